@@ -6,6 +6,20 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import StringIO
+import atexit
+import bisect
+import cProfile
+import collections
+import errno
+import functools
+import json
+import os
+import pstats
+import tempfile
+import threading
+import time
+
 import ga4gh.datamodel as datamodel
 import ga4gh.exceptions as exceptions
 import ga4gh.protocol as protocol
@@ -50,17 +64,664 @@ def _parsePageToken(pageToken, numValues):
     return values
 
 
+def _closeIterator(iterator):
+    """
+    Closes the specified suspended iterator, if it can be closed.
+    """
+    close = getattr(iterator, "close", None)
+    if close is not None:
+        close()
+
+
+class CursorCache(object):
+    """
+    A bounded cache of suspended search iterators, keyed by the page
+    token that was issued to the client when the iterator was suspended.
+    When a client asks for the next page using this token, we can pick
+    up the live iterator (and the pysam iterator that it wraps) where we
+    left off, rather than re-opening the fetch at the search anchor and
+    skipping over all the objects that we have already seen.
+
+    Entries expire after a fixed time to live, and the least recently
+    added entries are evicted when the cache grows beyond its maximum
+    size. Iterators are removed from the cache when they are taken, so
+    that a suspended iterator is never shared between two requests.
+    Suspended iterators hold their own file handles, so the iterators
+    that are discarded are closed.
+    """
+    def __init__(self, maxSize=0, timeToLive=60):
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._maxSize = maxSize
+        self._timeToLive = timeToLive
+        self._numHits = 0
+        self._numMisses = 0
+        self._numEvictions = 0
+
+    def setMaxSize(self, maxSize):
+        """
+        Sets the maximum number of suspended iterators held in this cache.
+        A value of zero disables the cache.
+        """
+        if maxSize < 0:
+            raise ValueError(
+                "The size of the cache must be a non-negative value")
+        with self._lock:
+            self._maxSize = maxSize
+            self._evict(time.time())
+
+    def setTimeToLive(self, timeToLive):
+        """
+        Sets the number of seconds after which a suspended iterator is
+        discarded.
+        """
+        if timeToLive <= 0:
+            raise ValueError(
+                "The time to live must be a strictly positive value")
+        self._timeToLive = timeToLive
+
+    def isEnabled(self):
+        """
+        Returns True if this cache will hold on to suspended iterators.
+        """
+        return self._maxSize > 0
+
+    def _evict(self, now):
+        """
+        Removes the expired entries, and then the oldest entries until the
+        cache is within its maximum size. Entries are held in the order
+        they were added, so that the oldest entry is always at the front.
+        """
+        while len(self._cache) > 0:
+            expiryTime, _ = next(self._cache.itervalues())
+            if expiryTime > now and len(self._cache) <= self._maxSize:
+                break
+            _, (_, iterator) = self._cache.popitem(last=False)
+            _closeIterator(iterator)
+            self._numEvictions += 1
+
+    def put(self, key, iterator):
+        """
+        Stores the specified suspended iterator under the specified key.
+        """
+        if not self.isEnabled():
+            return
+        now = time.time()
+        with self._lock:
+            _, oldIterator = self._cache.pop(key, (None, None))
+            if oldIterator is not None:
+                _closeIterator(oldIterator)
+            self._cache[key] = now + self._timeToLive, iterator
+            self._evict(now)
+
+    def take(self, key):
+        """
+        Removes the iterator stored under the specified key from the cache
+        and returns it, or returns None if there is no live iterator for
+        this key.
+        """
+        now = time.time()
+        with self._lock:
+            expiryTime, iterator = self._cache.pop(key, (None, None))
+            self._evict(now)
+            if iterator is None or expiryTime <= now:
+                if iterator is not None:
+                    _closeIterator(iterator)
+                self._numMisses += 1
+                return None
+            self._numHits += 1
+            return iterator
+
+    def getNumEntries(self):
+        """
+        Returns the number of suspended iterators currently in the cache.
+        """
+        return len(self._cache)
+
+    def getNumHits(self):
+        """
+        Returns the number of page requests that resumed a live iterator.
+        """
+        return self._numHits
+
+    def getNumMisses(self):
+        """
+        Returns the number of page requests that could not be matched to a
+        live iterator, and therefore fell back to the page token anchor.
+        """
+        return self._numMisses
+
+    def getNumEvictions(self):
+        """
+        Returns the number of iterators that were discarded because they
+        expired or because the cache was full.
+        """
+        return self._numEvictions
+
+
+class _InFlightRequest(object):
+    """
+    The state of a request being run by a RequestCoalescer, shared between
+    the thread running the request and the threads waiting for its result.
+    """
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+class RequestCoalescer(object):
+    """
+    Coalesces identical concurrent requests, so that only the first caller
+    for a given key runs the request, and every caller that arrives while
+    it is running is handed the same result (or exception). Results are
+    not retained once the first caller has finished.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inFlight = {}
+        self._enabled = False
+        self._numRequests = 0
+        self._numCoalesced = 0
+
+    def setEnabled(self, enabled):
+        """
+        If enabled is False, every request is run by its caller.
+        """
+        self._enabled = enabled
+
+    def isEnabled(self):
+        """
+        Returns True if identical concurrent requests are coalesced.
+        """
+        return self._enabled
+
+    def run(self, key, function, *args):
+        """
+        Returns the result of calling the specified function with the
+        specified arguments, unless a request with the same key is already
+        running, in which case we wait for and return its result.
+        """
+        if not self._enabled:
+            return function(*args)
+        with self._lock:
+            self._numRequests += 1
+            inFlightRequest = self._inFlight.get(key)
+            isLeader = inFlightRequest is None
+            if isLeader:
+                inFlightRequest = _InFlightRequest()
+                self._inFlight[key] = inFlightRequest
+            else:
+                self._numCoalesced += 1
+        if not isLeader:
+            with datamodel.timePhase("coalesced"):
+                inFlightRequest.event.wait()
+            if inFlightRequest.exception is not None:
+                raise inFlightRequest.exception
+            return inFlightRequest.result
+        try:
+            inFlightRequest.result = function(*args)
+        except Exception as exception:
+            inFlightRequest.exception = exception
+            raise
+        finally:
+            with self._lock:
+                del self._inFlight[key]
+            inFlightRequest.event.set()
+        return inFlightRequest.result
+
+    def getNumRequests(self):
+        """
+        Returns the number of requests run through this coalescer.
+        """
+        return self._numRequests
+
+    def getNumCoalesced(self):
+        """
+        Returns the number of requests that were handed the result of an
+        identical request rather than being run.
+        """
+        return self._numCoalesced
+
+    def getCoalescedRatio(self):
+        """
+        Returns the fraction of requests that were coalesced.
+        """
+        if self._numRequests == 0:
+            return 0.0
+        return self._numCoalesced / self._numRequests
+
+
+class MetricsRegistry(object):
+    """
+    A registry of counters, gauges and histograms, exported in the
+    Prometheus text format. Each metric has a fixed list of label names,
+    and a value is kept for each combination of label values seen.
+
+    Collectors are functions that are called with the registry just
+    before its values are read, and can be used to set the values of
+    metrics that are maintained elsewhere.
+
+    If a directory is set, the values are aggregated over all the
+    processes that share the directory, such as the pre-forked workers
+    of a WSGI server. Each process writes a snapshot of its own values
+    to a file in the directory every snapshot interval (from a
+    background thread, and only if they have changed). Counters and
+    histograms are summed over the snapshots of every process, including
+    those that have exited, so that they never decrease; gauges are
+    summed over the processes that are still running.
+    """
+    counterType = "counter"
+    gaugeType = "gauge"
+    histogramType = "histogram"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = collections.OrderedDict()
+        self._collectors = []
+        self._directory = None
+        self._snapshotInterval = 1
+        self._pid = None
+        self._snapshotPid = None
+        self._values = {}
+        self._changed = False
+
+    def setDirectory(self, directory, snapshotInterval=1):
+        """
+        Sets the directory shared by the processes whose values are
+        aggregated, and the number of seconds between snapshots. If the
+        directory is None, only the values of this process are exported.
+        """
+        if snapshotInterval <= 0:
+            raise ValueError(
+                "The snapshot interval must be a strictly positive value")
+        if directory is not None and not os.path.isdir(directory):
+            raise ValueError(
+                "The metrics directory '{}' does not exist".format(
+                    directory))
+        self._directory = directory
+        self._snapshotInterval = snapshotInterval
+        self._snapshotPid = None
+
+    def _addMetric(self, name, metricType, help_, labelNames, buckets=None):
+        if name in self._metrics:
+            raise ValueError("Duplicate metric '{}'".format(name))
+        self._metrics[name] = (metricType, help_, tuple(labelNames), buckets)
+
+    def addCounter(self, name, help_, labelNames=[]):
+        """
+        Adds a counter with the specified name, help text and label names.
+        """
+        self._addMetric(name, self.counterType, help_, labelNames)
+
+    def addGauge(self, name, help_, labelNames=[]):
+        """
+        Adds a gauge with the specified name, help text and label names.
+        """
+        self._addMetric(name, self.gaugeType, help_, labelNames)
+
+    def addHistogram(self, name, help_, labelNames, buckets):
+        """
+        Adds a histogram with the specified name, help text, label names
+        and list of increasing bucket upper bounds. A bucket for all values
+        is added implicitly.
+        """
+        self._addMetric(
+            name, self.histogramType, help_, labelNames, sorted(buckets))
+
+    def addCollector(self, collector):
+        """
+        Adds a function that is called with this registry before the
+        values are exported.
+        """
+        self._collectors.append(collector)
+
+    def _checkProcess(self):
+        """
+        Resets the values inherited from the parent if this is the first
+        update in a newly forked process, and starts the snapshot thread
+        for this process if needed. Must be called while holding the lock.
+        """
+        pid = os.getpid()
+        if self._pid != pid:
+            self._pid = pid
+            self._values = {}
+            self._changed = False
+        if self._directory is not None and self._snapshotPid != pid:
+            self._snapshotPid = pid
+            thread = threading.Thread(target=self._runSnapshots, args=(pid,))
+            thread.daemon = True
+            thread.start()
+            # The values recorded since the last snapshot are written
+            # when the process exits.
+            atexit.register(self._writeFinalSnapshot, pid)
+
+    def increment(self, name, labelValues=(), amount=1):
+        """
+        Adds the specified amount to the specified counter or gauge.
+        """
+        key = name, tuple(labelValues)
+        with self._lock:
+            self._checkProcess()
+            self._values[key] = self._values.get(key, 0) + amount
+            self._changed = True
+
+    def setValue(self, name, labelValues=(), value=0):
+        """
+        Sets the value of the specified counter or gauge.
+        """
+        key = name, tuple(labelValues)
+        with self._lock:
+            self._checkProcess()
+            self._values[key] = value
+            self._changed = True
+
+    def observe(self, name, labelValues=(), value=0):
+        """
+        Records the specified value in the specified histogram.
+        """
+        buckets = self._metrics[name][3]
+        key = name, tuple(labelValues)
+        with self._lock:
+            self._checkProcess()
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket, and then the sum of the values
+                counts = [0] * (len(buckets) + 2)
+                self._values[key] = counts
+            counts[bisect.bisect_left(buckets, value)] += 1
+            counts[-1] += value
+            self._changed = True
+
+    def _collect(self):
+        """
+        Runs the collectors and returns a copy of the values of this
+        process.
+        """
+        for collector in self._collectors:
+            collector(self)
+        with self._lock:
+            self._checkProcess()
+            self._changed = False
+            return dict(
+                (key, list(value) if isinstance(value, list) else value)
+                for key, value in self._values.items())
+
+    def _getSnapshotPath(self, pid):
+        return os.path.join(self._directory, "metrics-{}.json".format(pid))
+
+    def writeSnapshot(self):
+        """
+        Writes the values of this process to its snapshot file. The file
+        is replaced atomically, so that it is never read half written.
+        """
+        values = self._collect()
+        snapshot = {
+            "pid": self._pid,
+            "values": [
+                [name, list(labelValues), value]
+                for (name, labelValues), value in values.items()]}
+        snapshotFile = tempfile.NamedTemporaryFile(
+            mode="w", dir=self._directory, prefix=".metrics-", delete=False)
+        with snapshotFile:
+            json.dump(snapshot, snapshotFile)
+        os.rename(snapshotFile.name, self._getSnapshotPath(self._pid))
+
+    def _runSnapshots(self, pid):
+        """
+        Writes a snapshot of the values of the specified process whenever
+        they have changed, until the snapshot directory is changed.
+        """
+        while True:
+            time.sleep(self._snapshotInterval)
+            if self._snapshotPid != pid or self._directory is None:
+                return
+            if self._changed:
+                self.writeSnapshot()
+
+    def _writeFinalSnapshot(self, pid):
+        if (os.getpid() == pid and self._directory is not None and
+                self._changed):
+            self.writeSnapshot()
+
+    def _readSnapshots(self):
+        """
+        Returns the list of (pid, values) pairs for the snapshots of the
+        other processes sharing the directory.
+        """
+        snapshots = []
+        for fileName in os.listdir(self._directory):
+            if not (fileName.startswith("metrics-") and
+                    fileName.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self._directory, fileName)) as file_:
+                    snapshot = json.load(file_)
+            except (IOError, ValueError):
+                continue
+            if snapshot["pid"] == self._pid:
+                continue
+            values = {}
+            for name, labelValues, value in snapshot["values"]:
+                values[name, tuple(labelValues)] = value
+            snapshots.append((snapshot["pid"], values))
+        return snapshots
+
+    def getValues(self):
+        """
+        Returns a dictionary mapping (name, labelValues) keys to the
+        aggregated values of the metrics. The value of a histogram is the
+        list of the counts in each bucket, followed by the sum of the
+        observed values.
+        """
+        values = self._collect()
+        if self._directory is None:
+            return values
+        self.writeSnapshot()
+        for pid, snapshotValues in self._readSnapshots():
+            isRunning = _isProcessRunning(pid)
+            for key, value in snapshotValues.items():
+                metric = self._metrics.get(key[0])
+                if metric is None:
+                    continue
+                if metric[0] == self.gaugeType and not isRunning:
+                    continue
+                if metric[0] == self.histogramType:
+                    counts = values.get(key, [0] * len(value))
+                    values[key] = [x + y for x, y in zip(counts, value)]
+                else:
+                    values[key] = values.get(key, 0) + value
+        return values
+
+    def getText(self):
+        """
+        Returns the aggregated values of the metrics in the Prometheus
+        text exposition format.
+        """
+        values = self.getValues()
+        lines = []
+        for name, metric in self._metrics.items():
+            metricType, help_, labelNames, buckets = metric
+            lines.append("# HELP {} {}".format(name, help_))
+            lines.append("# TYPE {} {}".format(name, metricType))
+            keys = sorted(key for key in values if key[0] == name)
+            for _, labelValues in keys:
+                value = values[name, labelValues]
+                labels = list(zip(labelNames, labelValues))
+                if metricType != self.histogramType:
+                    lines.append("{}{} {}".format(
+                        name, _formatLabels(labels), _formatValue(value)))
+                    continue
+                count = 0
+                for bound, bucketCount in zip(buckets + ["+Inf"], value):
+                    count += bucketCount
+                    lines.append("{}_bucket{} {}".format(
+                        name, _formatLabels(labels + [(
+                            "le", _formatValue(bound))]),
+                        _formatValue(count)))
+                lines.append("{}_sum{} {}".format(
+                    name, _formatLabels(labels), _formatValue(value[-1])))
+                lines.append("{}_count{} {}".format(
+                    name, _formatLabels(labels), _formatValue(count)))
+        return "\n".join(lines) + "\n"
+
+
+def _formatValue(value):
+    """
+    Returns the Prometheus text representation of the specified number.
+    """
+    if value == "+Inf":
+        return value
+    return repr(float(value))
+
+
+def _formatLabels(labels):
+    """
+    Returns the Prometheus text representation of the specified list of
+    (name, value) label pairs.
+    """
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(
+        '{}="{}"'.format(name, value.replace("\\", "\\\\").replace(
+            "\n", "\\n").replace('"', '\\"'))
+        for name, value in labels) + "}"
+
+
+def _isProcessRunning(pid):
+    """
+    Returns True if the process with the specified ID is running.
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError as error:
+        return error.errno != errno.ESRCH
+    return True
+
+
+class CpuRequestProfiler(object):
+    """
+    Profiles the CPU time spent by the backend on a single request with
+    cProfile. Only the thread that starts the profiler is profiled.
+    """
+    def __init__(self):
+        self._profile = cProfile.Profile()
+        self._running = False
+        self._profiled = False
+
+    def start(self):
+        """
+        Starts profiling, if the profiler is not already running.
+        """
+        if not self._running:
+            self._profile.enable()
+            self._running = True
+            self._profiled = True
+
+    def stop(self):
+        """
+        Stops profiling, if the profiler is running.
+        """
+        if self._running:
+            self._profile.disable()
+            self._running = False
+
+    def getReport(self, numEntries):
+        """
+        Returns the pstats report of the specified number of functions
+        with the highest cumulative time.
+        """
+        if not self._profiled:
+            return "Nothing was profiled\n"
+        stream = StringIO.StringIO()
+        stats = pstats.Stats(self._profile, stream=stream)
+        stats.sort_stats("cumulative")
+        stats.print_stats(numEntries)
+        return stream.getvalue()
+
+
+class HeapRequestProfiler(object):
+    """
+    Profiles the objects allocated by the backend for a single request
+    with guppy, which must be installed. The heap is shared by all
+    threads, and so the profile includes the objects allocated for any
+    concurrent requests.
+    """
+    def __init__(self):
+        try:
+            import guppy
+        except ImportError:
+            raise exceptions.NotImplementedException(
+                "Heap profiling requires the guppy package")
+        self._heapy = guppy.hpy()
+        self._running = False
+        self._heap = None
+
+    def start(self):
+        """
+        Starts profiling, if the profiler is not already running.
+        """
+        if not self._running:
+            self._heapy.setrelheap()
+            self._running = True
+
+    def stop(self):
+        """
+        Stops profiling, if the profiler is running.
+        """
+        if self._running:
+            self._heap = self._heapy.heap()
+            self._running = False
+
+    def getReport(self, numEntries):
+        """
+        Returns guppy's summary of the objects allocated while profiling,
+        by type. Guppy always summarises the ten largest types, so
+        numEntries is ignored.
+        """
+        if self._heap is None:
+            return "Nothing was profiled\n"
+        return "{}\n".format(self._heap)
+
+
+requestProfilerClasses = {
+    "cpu": CpuRequestProfiler,
+    "heap": HeapRequestProfiler,
+}
+_requestProfilers = threading.local()
+
+
+def setRequestProfiler(profiler):
+    """
+    Sets the profiler for the request being handled by the current thread,
+    which is started and stopped by the Backend's profiling hooks. A
+    profiler of None disables profiling.
+    """
+    _requestProfilers.profiler = profiler
+
+
+def getRequestProfiler():
+    """
+    Returns the profiler for the request being handled by the current
+    thread, or None if the request is not being profiled.
+    """
+    return getattr(_requestProfilers, "profiler", None)
+
+
 class IntervalIterator(object):
     """
     Implements generator logic for types which accept a start/end
     range to search for the object. Returns an iterator over
     (object, pageToken) pairs. The pageToken is a string which allows
     us to pick up the iteration at any point, and is None for the last
-    value in the iterator.
+    value in the iterator. If a field mask is specified, the objects
+    need only have the fields included by the mask filled in, along with
+    the fields that define their interval.
     """
-    def __init__(self, request, parentContainer):
+    def __init__(self, request, parentContainer, fieldMask=None):
         self._request = request
         self._parentContainer = parentContainer
+        self._fieldMask = fieldMask
         self._searchIterator = None
         self._currentObject = None
         self._nextObject = None
@@ -111,27 +772,43 @@ class IntervalIterator(object):
         self._searchIterator = self._search(
             searchAnchor,
             self._request.end if self._request.end != 0 else None)
-        obj = next(self._searchIterator)
-        if searchAnchor == self._request.start:
-            # This is the initial set of intervals, we just skip forward
-            # objectsToSkip positions
-            for _ in range(objectsToSkip):
-                obj = next(self._searchIterator)
-        else:
-            # Now, we are past this initial set of intervals.
-            # First, we need to skip forward over the intervals where
-            # start < searchAnchor, as we've seen these already.
-            while self._getStart(obj) < searchAnchor:
-                obj = next(self._searchIterator)
-            # Now, we skip over objectsToSkip objects such that
-            # start == searchAnchor
-            for _ in range(objectsToSkip):
-                if self._getStart(obj) != searchAnchor:
-                    raise exceptions.BadPageTokenException
-                obj = next(self._searchIterator)
+        # The objects we skip over are fetched and converted only to be
+        # discarded, so all of this work is timed as skipping.
+        numSkipped = 0
+        with datamodel.timePhase("skip"):
+            obj = next(self._searchIterator)
+            if searchAnchor == self._request.start:
+                # This is the initial set of intervals, we just skip forward
+                # objectsToSkip positions
+                for _ in range(objectsToSkip):
+                    obj = next(self._searchIterator)
+                    numSkipped += 1
+            else:
+                # Now, we are past this initial set of intervals.
+                # First, we need to skip forward over the intervals where
+                # start < searchAnchor, as we've seen these already.
+                while self._getStart(obj) < searchAnchor:
+                    obj = next(self._searchIterator)
+                    numSkipped += 1
+                # Now, we skip over objectsToSkip objects such that
+                # start == searchAnchor
+                for _ in range(objectsToSkip):
+                    if self._getStart(obj) != searchAnchor:
+                        raise exceptions.BadPageTokenException
+                    obj = next(self._searchIterator)
+                    numSkipped += 1
+        datamodel.addRequestCount("skipped", numSkipped)
         self._currentObject = obj
         self._nextObject = next(self._searchIterator, None)
 
+    def close(self):
+        """
+        Closes the underlying search, releasing its file handles.
+        """
+        close = getattr(self._searchIterator, "close", None)
+        if close is not None:
+            close()
+
     def next(self):
         """
         Returns the next (object, nextPageToken) pair.
@@ -163,13 +840,14 @@ class ReadsIntervalIterator(IntervalIterator):
     """
     An interval iterator for reads
     """
-    def __init__(self, request, parentContainer, reference):
+    def __init__(self, request, parentContainer, reference, fieldMask=None):
         self._reference = reference
-        super(ReadsIntervalIterator, self).__init__(request, parentContainer)
+        super(ReadsIntervalIterator, self).__init__(
+            request, parentContainer, fieldMask)
 
     def _search(self, start, end):
         return self._parentContainer.getReadAlignments(
-            self._reference, start, end)
+            self._reference, start, end, fieldMask=self._fieldMask)
 
     @classmethod
     def _getStart(cls, readAlignment):
@@ -195,7 +873,7 @@ class VariantsIntervalIterator(IntervalIterator):
     def _search(self, start, end):
         return self._parentContainer.getVariants(
             self._request.reference_name, start, end,
-            self._request.call_set_ids)
+            self._request.call_set_ids, fieldMask=self._fieldMask)
 
     @classmethod
     def _getStart(cls, variant):
@@ -313,7 +991,57 @@ class Backend(object):
         self._responseValidation = False
         self._defaultPageSize = 100
         self._maxResponseLength = 2**20  # 1 MiB
+        self._maxBatchGetSize = 1000
+        self._maxDensityBins = 10000
         self._dataRepository = dataRepository
+        self._cursorCache = CursorCache()
+        self._requestCoalescer = RequestCoalescer()
+        self._metricsRegistry = MetricsRegistry()
+        self._metricsRegistry.addHistogram(
+            "ga4gh_search_page_objects",
+            "The number of objects in each page of search results.",
+            ["request"], [0, 1, 10, 100, 1000, 10000])
+        for name, help_ in [
+                ("ga4gh_file_handle_cache_hits_total",
+                 "Requests for a file that was already open."),
+                ("ga4gh_file_handle_cache_misses_total",
+                 "Requests for a file that had to be opened."),
+                ("ga4gh_file_handle_cache_evictions_total",
+                 "File handles closed to keep the cache within its size."),
+                ("ga4gh_cursor_cache_hits_total",
+                 "Page requests that resumed a suspended search."),
+                ("ga4gh_cursor_cache_misses_total",
+                 "Page requests that restarted the search at the token."),
+                ("ga4gh_coalesced_requests_total",
+                 "Requests handed the result of an identical request.")]:
+            self._metricsRegistry.addCounter(name, help_)
+        self._metricsRegistry.addCollector(self._collectMetrics)
+
+    def getMetricsRegistry(self):
+        """
+        Returns the registry of the metrics exported by this server.
+        """
+        return self._metricsRegistry
+
+    def _collectMetrics(self, metricsRegistry):
+        """
+        Sets the values of the metrics maintained by the caches.
+        """
+        fileHandleCaches = datamodel.getFileHandleCaches()
+        for name, value in [
+                ("ga4gh_file_handle_cache_hits_total",
+                 sum(cache.getNumHits() for cache in fileHandleCaches)),
+                ("ga4gh_file_handle_cache_misses_total",
+                 sum(cache.getNumMisses() for cache in fileHandleCaches)),
+                ("ga4gh_file_handle_cache_evictions_total",
+                 sum(cache.getNumEvictions() for cache in fileHandleCaches)),
+                ("ga4gh_cursor_cache_hits_total",
+                 self._cursorCache.getNumHits()),
+                ("ga4gh_cursor_cache_misses_total",
+                 self._cursorCache.getNumMisses()),
+                ("ga4gh_coalesced_requests_total",
+                 self._requestCoalescer.getNumCoalesced())]:
+            metricsRegistry.setValue(name, (), value)
 
     def getDataRepository(self):
         """
@@ -346,18 +1074,84 @@ class Backend(object):
         """
         self._maxResponseLength = maxResponseLength
 
+    def setMaxBatchGetSize(self, maxBatchGetSize):
+        """
+        Sets the maximum number of IDs in a batch get request to the
+        specified value.
+        """
+        self._maxBatchGetSize = maxBatchGetSize
+
+    def setMaxDensityBins(self, maxDensityBins):
+        """
+        Sets the maximum number of bins in a variant density request to
+        the specified value.
+        """
+        self._maxDensityBins = maxDensityBins
+
+    def getResponseSettings(self):
+        """
+        Returns a tuple of the settings of this backend that shape its
+        responses, such as the page sizes, so that responses cached under
+        one set of values are not served after they change.
+        """
+        return (
+            self._requestValidation, self._responseValidation,
+            self._defaultPageSize, self._maxResponseLength,
+            self._maxBatchGetSize, self._maxDensityBins)
+
+    def getCursorCache(self):
+        """
+        Returns the cache of suspended search iterators used by this backend.
+        """
+        return self._cursorCache
+
+    def setCursorCacheMaxSize(self, maxSize):
+        """
+        Sets the maximum number of suspended search iterators that are
+        kept alive between page requests. Zero disables the cursor cache.
+        """
+        self._cursorCache.setMaxSize(maxSize)
+
+    def setCursorCacheTimeToLive(self, timeToLive):
+        """
+        Sets the number of seconds a suspended search iterator is kept
+        alive waiting for the request for the next page.
+        """
+        self._cursorCache.setTimeToLive(timeToLive)
+
+    def getRequestCoalescer(self):
+        """
+        Returns the coalescer used to share the responses to identical
+        concurrent requests.
+        """
+        return self._requestCoalescer
+
+    def setRequestCoalescing(self, requestCoalescing):
+        """
+        Set enable/disable the coalescing of identical concurrent requests.
+        """
+        self._requestCoalescer.setEnabled(requestCoalescing)
+
     def startProfile(self):
         """
         Profiling hook. Called at the start of the runSearchRequest method
-        and allows for detailed profiling of search performance.
+        and allows for detailed profiling of search performance. Starts the
+        profiler of the request being handled by the current thread, if
+        there is one.
         """
-        pass
+        profiler = getRequestProfiler()
+        if profiler is not None:
+            profiler.start()
 
     def endProfile(self):
         """
         Profiling hook. Called at the end of the runSearchRequest method.
+        Stops the profiler of the request being handled by the current
+        thread, if there is one.
         """
-        pass
+        profiler = getRequestProfiler()
+        if profiler is not None:
+            profiler.stop()
 
     def validateRequest(self, jsonDict, requestClass):
         """
@@ -508,10 +1302,11 @@ class Backend(object):
             request, variantSet.getNumVariantAnnotationSets(),
             variantSet.getVariantAnnotationSetByIndex)
 
-    def readsGenerator(self, request):
+    def readsGenerator(self, request, fieldMask=None):
         """
         Returns a generator over the (read, nextPageToken) pairs defined
-        by the specified request
+        by the specified request. Only the fields included by the
+        specified field mask need be filled in.
         """
         if not request.reference_id:
             raise exceptions.UnmappedReadsNotSupported()
@@ -519,11 +1314,11 @@ class Backend(object):
             raise exceptions.BadRequestException(
                 "At least one readGroupId must be specified")
         elif len(request.read_group_ids) == 1:
-            return self._readsGeneratorSingle(request)
+            return self._readsGeneratorSingle(request, fieldMask)
         else:
-            return self._readsGeneratorMultiple(request)
+            return self._readsGeneratorMultiple(request, fieldMask)
 
-    def _readsGeneratorSingle(self, request):
+    def _readsGeneratorSingle(self, request, fieldMask):
         compoundId = datamodel.ReadGroupCompoundId.parse(
             request.read_group_ids[0])
         dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
@@ -535,10 +1330,10 @@ class Backend(object):
         reference = referenceSet.getReference(request.reference_id)
         readGroup = readGroupSet.getReadGroup(compoundId.read_group_id)
         intervalIterator = ReadsIntervalIterator(
-            request, readGroup, reference)
+            request, readGroup, reference, fieldMask)
         return intervalIterator
 
-    def _readsGeneratorMultiple(self, request):
+    def _readsGeneratorMultiple(self, request, fieldMask):
         compoundId = datamodel.ReadGroupCompoundId.parse(
             request.read_group_ids[0])
         dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
@@ -554,19 +1349,21 @@ class Backend(object):
                 "If multiple readGroupIds are specified, "
                 "they must be all of the readGroupIds in a ReadGroup")
         intervalIterator = ReadsIntervalIterator(
-            request, readGroupSet, reference)
+            request, readGroupSet, reference, fieldMask)
         return intervalIterator
 
-    def variantsGenerator(self, request):
+    def variantsGenerator(self, request, fieldMask=None):
         """
         Returns a generator over the (variant, nextPageToken) pairs defined
-        by the specified request.
+        by the specified request. Only the fields included by the
+        specified field mask need be filled in.
         """
         compoundId = datamodel.VariantSetCompoundId \
             .parse(request.variant_set_id)
         dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
         variantSet = dataset.getVariantSet(compoundId.variant_set_id)
-        intervalIterator = VariantsIntervalIterator(request, variantSet)
+        intervalIterator = VariantsIntervalIterator(
+            request, variantSet, fieldMask)
         return intervalIterator
 
     def variantAnnotationsGenerator(self, request):
@@ -584,10 +1381,11 @@ class Backend(object):
             request, variantAnnotationSet)
         return intervalIterator
 
-    def featuresGenerator(self, request):
+    def featuresGenerator(self, request, fieldMask=None):
         """
         Returns a generator over the (features, nextPageToken) pairs
-        defined by the (JSON string) request.
+        defined by the (JSON string) request. Only the fields included by
+        the specified field mask need be filled in.
         """
         compoundId = None
         parentId = None
@@ -619,10 +1417,13 @@ class Backend(object):
         dataset = self.getDataRepository().getDataset(
             compoundId.dataset_id)
         featureSet = dataset.getFeatureSet(compoundId.feature_set_id)
+        # The page size is only zero when streaming, in which case all of
+        # the features are returned.
+        pageSize = request.page_size if request.page_size > 0 else None
         return featureSet.getFeatures(
             request.reference_name, request.start, request.end,
-            request.page_token, request.page_size,
-            request.feature_types, parentId)
+            request.page_token, pageSize,
+            request.feature_types, parentId, fieldMask=fieldMask)
 
     def callSetsGenerator(self, request):
         """
@@ -662,49 +1463,282 @@ class Backend(object):
     #
     ###########################################################
 
-    def runGetRequest(self, obj):
+    def runGetRequest(self, obj, responseMimetype=protocol.JSON_MIMETYPE):
         """
         Runs a get request by converting the specified datamodel
-        object into its protocol representation.
+        object into its protocol representation, serialised in the
+        wire format for the specified mimetype.
         """
         protocolElement = obj.toProtocolElement()
-        jsonString = protocol.toJson(protocolElement)
-        return jsonString
+        return protocol.serialize(protocolElement, responseMimetype)
+
+    def runBatchGet(self, objectType, requestStr):
+        """
+        Runs a batch get request for objects of the specified type (such
+        as "variants"). The request is a JSON object with a list of IDs,
+        {"ids": [...]}. We return a JSON object with a list of results in
+        the same order, {"results": [...]}, each of which holds the ID and
+        either the requested "object" or the "error" that prevented us
+        from getting it.
+        """
+        getMethods = {
+            "callsets": self.runGetCallSet,
+            "datasets": self.runGetDataset,
+            "features": self.runGetFeature,
+            "featuresets": self.runGetFeatureSet,
+            "readgroups": self.runGetReadGroup,
+            "readgroupsets": self.runGetReadGroupSet,
+            "references": self.runGetReference,
+            "referencesets": self.runGetReferenceSet,
+            "variantannotationsets": self.runGetVariantAnnotationSet,
+            "variants": self.runGetVariant,
+            "variantsets": self.runGetVariantSet,
+        }
+        if objectType not in getMethods:
+            raise exceptions.PathNotFoundException()
+        try:
+            ids = json.loads(requestStr)["ids"]
+        except (ValueError, KeyError, TypeError):
+            raise exceptions.InvalidJsonException(requestStr)
+        if (not isinstance(ids, list) or
+                not all(isinstance(id_, basestring) for id_ in ids)):
+            raise exceptions.BadBatchGetRequestException(
+                "ids must be a list of strings")
+        if len(ids) > self._maxBatchGetSize:
+            raise exceptions.BadBatchGetRequestException(
+                "at most {} ids may be requested at once".format(
+                    self._maxBatchGetSize))
+        prefetched = {}
+        if objectType == "variants":
+            prefetched = self._getVariantsById(ids)
+        results = []
+        for id_ in ids:
+            try:
+                if id_ in prefetched:
+                    objectString = protocol.toJson(prefetched[id_])
+                else:
+                    objectString = getMethods[objectType](id_)
+                results.append('{{"id": {}, "object": {}}}'.format(
+                    json.dumps(id_), objectString))
+            except exceptions.BaseServerException as exception:
+                errorString = protocol.toJson(exception.toProtocolElement())
+                results.append('{{"id": {}, "error": {}}}'.format(
+                    json.dumps(id_), errorString))
+        return '{{"results": [{}]}}'.format(", ".join(results))
+
+    def _getVariantsById(self, ids):
+        """
+        Returns a dictionary mapping the specified variant IDs to the
+        corresponding GA Variants. The IDs in each variant set are read
+        together, so that variants in the same region are read with a
+        single fetch. IDs that cannot be resolved are omitted.
+        """
+        variantSetIds = collections.defaultdict(list)
+        for id_ in ids:
+            try:
+                compoundId = datamodel.VariantCompoundId.parse(id_)
+            except exceptions.BaseServerException:
+                continue
+            key = compoundId.dataset_id, compoundId.variant_set_id
+            variantSetIds[key].append((id_, compoundId))
+        variants = {}
+        for (datasetId, variantSetId), idPairs in variantSetIds.items():
+            try:
+                dataset = self.getDataRepository().getDataset(datasetId)
+                variantSet = dataset.getVariantSet(variantSetId)
+            except exceptions.BaseServerException:
+                continue
+            gaVariants = variantSet.getVariantsByCompoundIds(
+                [variantId for _, variantId in idPairs])
+            for (id_, _), gaVariant in zip(idPairs, gaVariants):
+                if gaVariant is not None:
+                    variants[id_] = gaVariant
+        return variants
 
     def runSearchRequest(
-            self, requestStr, requestClass, responseClass, objectGenerator):
+            self, requestStr, requestClass, responseClass, objectGenerator,
+            requestMimetype=protocol.JSON_MIMETYPE,
+            responseMimetype=protocol.JSON_MIMETYPE, fieldMask=None):
         """
         Runs the specified request. The request is a string containing
-        a JSON representation of an instance of the specified requestClass.
+        a representation of an instance of the specified requestClass in
+        the wire format for requestMimetype (JSON by default).
         We return a string representation of an instance of the specified
-        responseClass in JSON format. Objects are filled into the page list
-        using the specified object generator, which must return
+        responseClass in the wire format for responseMimetype. Objects are
+        filled into the page list using the specified object generator,
+        which must return
         (object, nextPageToken) pairs, and be able to resume iteration from
         any point using the nextPageToken attribute of the request object.
+
+        If responseMimetype is protocol.NDJSON_MIMETYPE, the page size is
+        ignored and we instead return an iterator over the lines of a
+        newline delimited JSON document, containing every object from the
+        page token (if any) onwards.
+
+        If a protocol.FieldMask is specified, the fields of each object
+        that are not included by the mask are cleared before it is
+        serialised. Object generators that can skip building these fields
+        altogether should be passed the same mask.
         """
         self.startProfile()
         try:
-            request = protocol.fromJson(requestStr, requestClass)
-        except protocol.json_format.ParseError:
+            with datamodel.timePhase("parse"):
+                request = protocol.deserialize(
+                    requestStr, requestClass, requestMimetype)
+        except ValueError:
+            if requestMimetype == protocol.PROTOBUF_MIMETYPE:
+                raise exceptions.InvalidProtobufException(
+                    requestClass.__name__)
             raise exceptions.InvalidJsonException(requestStr)
+        datamodel.recordRequest(request)
+        if fieldMask is not None:
+            if fieldMask.isEmpty():
+                fieldMask = None
+            else:
+                valueDescriptor = responseClass.DESCRIPTOR.fields_by_name[
+                    protocol.getValueListName(responseClass)].message_type
+                invalidPath = fieldMask.getInvalidPath(valueDescriptor)
+                if invalidPath is not None:
+                    raise exceptions.BadFieldMaskException(
+                        invalidPath, valueDescriptor.name)
+        if responseMimetype == protocol.NDJSON_MIMETYPE:
+            # The page size is ignored, so we clear it before it reaches
+            # object generators that limit their queries by it. The
+            # generator is created here so that any errors in the request
+            # are raised before we start writing the response. The stream
+            # is consumed after we return, possibly on other threads, so
+            # its search is opened on its own file handles.
+            request.page_size = 0
+            with datamodel.getFileHandleCache().detachedIterators():
+                objectIterator = objectGenerator(request)
+            self.endProfile()
+            return self._streamObjects(
+                objectIterator, fieldMask, datamodel.getRequestTimer(),
+                getRequestProfiler())
         # TODO How do we detect when the page size is not set?
         if not request.page_size:
             request.page_size = self._defaultPageSize
         if request.page_size < 0:
             raise exceptions.BadPageSizeException(request.page_size)
+        # Identical requests are keyed on their canonical serialised form,
+        # so that they are coalesced regardless of JSON formatting.
+        requestKey = (
+            requestClass.__name__, request.SerializeToString(),
+            responseMimetype, str(fieldMask))
+        # Every caller records the objects in its response, including
+        # those handed the response of an identical request.
+        responseString, numObjects = self._requestCoalescer.run(
+            requestKey, self._runSearchPage, request, responseClass,
+            objectGenerator, responseMimetype, fieldMask)
+        self._metricsRegistry.observe(
+            "ga4gh_search_page_objects", (requestClass.__name__,),
+            numObjects)
+        datamodel.addRequestCount("returned", numObjects)
+        self.endProfile()
+        return responseString
+
+    def _runSearchPage(
+            self, request, responseClass, objectGenerator, responseMimetype,
+            fieldMask=None):
+        """
+        Returns the serialised page of responseClass objects for the
+        specified parsed search request, projected onto the specified
+        field mask, and the number of objects in the page.
+        """
         responseBuilder = protocol.SearchResponseBuilder(
-            responseClass, request.page_size, self._maxResponseLength)
+            responseClass, request.page_size, self._maxResponseLength,
+            responseMimetype)
+        objectIterator = None
+        if request.page_token and self._cursorCache.isEnabled():
+            objectIterator = self._cursorCache.take(
+                self._getCursorKey(request, request.page_token, fieldMask))
+        if objectIterator is None:
+            if self._cursorCache.isEnabled():
+                # An iterator that may be suspended in the cursor cache must
+                # not share file handles with other fetches from the same
+                # files, so its search is opened on its own handles.
+                fileHandleCache = datamodel.getFileHandleCache()
+                with fileHandleCache.detachedIterators():
+                    objectIterator = objectGenerator(request)
+            else:
+                objectIterator = objectGenerator(request)
         nextPageToken = None
-        for obj, nextPageToken in objectGenerator(request):
-            responseBuilder.addValue(obj)
+        numObjects = 0
+        for obj, nextPageToken in objectIterator:
+            with datamodel.timePhase("serialize"):
+                if fieldMask is not None:
+                    fieldMask.apply(obj)
+                responseBuilder.addValue(obj)
+            numObjects += 1
             if responseBuilder.isFull():
                 break
+        if isinstance(objectIterator, IntervalIterator):
+            if nextPageToken is not None and self._cursorCache.isEnabled():
+                self._cursorCache.put(
+                    self._getCursorKey(request, nextPageToken, fieldMask),
+                    objectIterator)
+            else:
+                objectIterator.close()
         responseBuilder.setNextPageToken(nextPageToken)
-        responseString = responseBuilder.getSerializedResponse()
-        self.endProfile()
-        return responseString
+        with datamodel.timePhase("serialize"):
+            return responseBuilder.getSerializedResponse(), numObjects
+
+    def _streamObjects(
+            self, objectIterator, fieldMask=None, timer=None, profiler=None):
+        """
+        Returns a generator over the JSON representations of the objects in
+        the specified iterator of (object, nextPageToken) pairs, one object
+        per line, projected onto the specified field mask.
 
-    def runListReferenceBases(self, id_, requestArgs):
+        The lines are generated after the request that started the stream
+        has returned, possibly on other threads, so each is generated with
+        the specified RequestTimer and request profiler of that request,
+        either of which may be None. The iterator is closed, and the
+        profiler stopped, when the stream is exhausted or closed.
+        """
+        try:
+            while True:
+                previousTimer = datamodel.getRequestTimer()
+                previousProfiler = getRequestProfiler()
+                datamodel.setRequestTimer(timer)
+                setRequestProfiler(profiler)
+                self.startProfile()
+                try:
+                    value = next(objectIterator, None)
+                    if value is None:
+                        return
+                    obj = value[0]
+                    with datamodel.timePhase("serialize"):
+                        if fieldMask is not None:
+                            fieldMask.apply(obj)
+                        line = protocol.toJson(obj) + "\n"
+                    datamodel.addRequestCount("returned")
+                finally:
+                    self.endProfile()
+                    datamodel.setRequestTimer(previousTimer)
+                    setRequestProfiler(previousProfiler)
+                yield line
+        finally:
+            _closeIterator(objectIterator)
+
+    def _getCursorKey(self, request, pageToken, fieldMask=None):
+        """
+        Returns the key under which the iterator for the specified search
+        request is stored in the cursor cache when suspended at the
+        specified page token. The page size may legitimately change between
+        pages, so it is not part of the key. The objects produced by the
+        iterator depend on the field mask, so it is.
+        """
+        keyRequest = type(request)()
+        keyRequest.CopyFrom(request)
+        keyRequest.page_token = ""
+        keyRequest.page_size = 0
+        return (
+            type(request).__name__, keyRequest.SerializeToString(),
+            pageToken, str(fieldMask))
+
+    def runListReferenceBases(
+            self, id_, requestArgs, responseMimetype=protocol.JSON_MIMETYPE):
         """
         Runs a listReferenceBases request for the specified ID and
         request arguments.
@@ -735,11 +1769,11 @@ class Backend(object):
         response.sequence = sequence
         if nextPageToken is not None:
             response.next_page_token = nextPageToken
-        return protocol.toJson(response)
+        return protocol.serialize(response, responseMimetype)
 
     # Get requests.
 
-    def runGetCallSet(self, id_):
+    def runGetCallSet(self, id_, responseMimetype=protocol.JSON_MIMETYPE):
         """
         Returns a callset with the given id
         """
@@ -747,9 +1781,9 @@ class Backend(object):
         dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
         variantSet = dataset.getVariantSet(compoundId.variant_set_id)
         callSet = variantSet.getCallSet(id_)
-        return self.runGetRequest(callSet)
+        return self.runGetRequest(callSet, responseMimetype)
 
-    def runGetVariant(self, id_):
+    def runGetVariant(self, id_, responseMimetype=protocol.JSON_MIMETYPE):
         """
         Returns a variant with the given id
         """
@@ -760,31 +1794,29 @@ class Backend(object):
         # TODO variant is a special case here, as it's returning a
         # protocol element rather than a datamodel object. We should
         # fix this for consistency.
-        jsonString = protocol.toJson(gaVariant)
-        return jsonString
+        return protocol.serialize(gaVariant, responseMimetype)
 
-    def runGetFeature(self, id_):
+    def runGetFeature(self, id_, responseMimetype=protocol.JSON_MIMETYPE):
         """
-        Returns JSON string of the feature object corresponding to
+        Returns the serialised feature object corresponding to
         the feature compoundID passed in.
         """
         compoundId = datamodel.FeatureCompoundId.parse(id_)
         dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
         featureSet = dataset.getFeatureSet(compoundId.feature_set_id)
         gaFeature = featureSet.getFeature(compoundId)
-        jsonString = protocol.toJson(gaFeature)
-        return jsonString
+        return protocol.serialize(gaFeature, responseMimetype)
 
-    def runGetReadGroupSet(self, id_):
+    def runGetReadGroupSet(self, id_, responseMimetype=protocol.JSON_MIMETYPE):
         """
         Returns a readGroupSet with the given id_
         """
         compoundId = datamodel.ReadGroupSetCompoundId.parse(id_)
         dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
         readGroupSet = dataset.getReadGroupSet(id_)
-        return self.runGetRequest(readGroupSet)
+        return self.runGetRequest(readGroupSet, responseMimetype)
 
-    def runGetReadGroup(self, id_):
+    def runGetReadGroup(self, id_, responseMimetype=protocol.JSON_MIMETYPE):
         """
         Returns a read group with the given id_
         """
@@ -792,9 +1824,9 @@ class Backend(object):
         dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
         readGroupSet = dataset.getReadGroupSet(compoundId.read_group_set_id)
         readGroup = readGroupSet.getReadGroup(id_)
-        return self.runGetRequest(readGroup)
+        return self.runGetRequest(readGroup, responseMimetype)
 
-    def runGetReference(self, id_):
+    def runGetReference(self, id_, responseMimetype=protocol.JSON_MIMETYPE):
         """
         Runs a getReference request for the specified ID.
         """
@@ -802,41 +1834,109 @@ class Backend(object):
         referenceSet = self.getDataRepository().getReferenceSet(
             compoundId.reference_set_id)
         reference = referenceSet.getReference(id_)
-        return self.runGetRequest(reference)
+        return self.runGetRequest(reference, responseMimetype)
 
-    def runGetReferenceSet(self, id_):
+    def runGetReferenceSet(self, id_, responseMimetype=protocol.JSON_MIMETYPE):
         """
         Runs a getReferenceSet request for the specified ID.
         """
         referenceSet = self.getDataRepository().getReferenceSet(id_)
-        return self.runGetRequest(referenceSet)
+        return self.runGetRequest(referenceSet, responseMimetype)
 
-    def runGetVariantSet(self, id_):
+    def runGetVariantSet(self, id_, responseMimetype=protocol.JSON_MIMETYPE):
         """
         Runs a getVariantSet request for the specified ID.
         """
         compoundId = datamodel.VariantSetCompoundId.parse(id_)
         dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
         variantSet = dataset.getVariantSet(id_)
-        return self.runGetRequest(variantSet)
+        return self.runGetRequest(variantSet, responseMimetype)
 
-    def runGetFeatureSet(self, id_):
+    def runGetVariantSetStatistics(
+            self, id_, responseMimetype=protocol.JSON_MIMETYPE):
+        """
+        Runs a request for the statistics of the variants in the variant
+        set with the specified ID, computed when it was imported. We
+        return a JSON object holding the total number of variants and a
+        list of the statistics of each reference, in name order. The
+        statistics have no protobuf equivalent, so JSON is the only
+        supported response mimetype.
+        """
+        if responseMimetype != protocol.JSON_MIMETYPE:
+            raise exceptions.UnsupportedMediaTypeException()
+        compoundId = datamodel.VariantSetCompoundId.parse(id_)
+        dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
+        variantSet = dataset.getVariantSet(id_)
+        statistics = variantSet.getStatistics()
+        if statistics is None:
+            raise exceptions.VariantSetStatisticsNotFoundException(id_)
+        references = []
+        for referenceName in sorted(statistics.keys()):
+            referenceStatistics = collections.OrderedDict([
+                ("referenceName", referenceName)])
+            referenceStatistics.update(sorted(
+                statistics[referenceName].items()))
+            references.append(referenceStatistics)
+        return json.dumps(collections.OrderedDict([
+            ("variantSetId", id_),
+            ("numVariants", variantSet.getNumVariants()),
+            ("references", references)]))
+
+    def runGetVariantDensity(self, id_, requestArgs):
+        """
+        Runs a request for the density of the variants in the variant set
+        with the specified ID. The request arguments are the referenceName,
+        the start (0 by default) and end of the region and the binSize. We
+        return a JSON object with the list of the numbers of variants that
+        start in each of the bins of binSize bases from start that overlap
+        the region.
+        """
+        compoundId = datamodel.VariantSetCompoundId.parse(id_)
+        dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
+        variantSet = dataset.getVariantSet(id_)
+        for key in ['referenceName', 'end', 'binSize']:
+            if key not in requestArgs:
+                raise exceptions.BadVariantDensityRequestException(
+                    "{} must be specified".format(key))
+        referenceName = requestArgs['referenceName']
+        start = _parseIntegerArgument(requestArgs, 'start', 0)
+        end = _parseIntegerArgument(requestArgs, 'end', None)
+        binSize = _parseIntegerArgument(requestArgs, 'binSize', None)
+        if start < 0 or end < start or binSize <= 0:
+            raise exceptions.BadVariantDensityRequestException(
+                "start and end must be a valid region and binSize must be "
+                "positive")
+        if (end - start + binSize - 1) // binSize > self._maxDensityBins:
+            raise exceptions.BadVariantDensityRequestException(
+                "at most {} bins may be requested at once".format(
+                    self._maxDensityBins))
+        counts = variantSet.getVariantDensity(
+            referenceName, start, end, binSize)
+        return json.dumps(collections.OrderedDict([
+            ("variantSetId", id_),
+            ("referenceName", referenceName),
+            ("start", start),
+            ("binSize", binSize),
+            ("counts", counts)]))
+
+    def runGetFeatureSet(self, id_, responseMimetype=protocol.JSON_MIMETYPE):
         """
         Runs a getFeatureSet request for the specified ID.
         """
         compoundId = datamodel.FeatureSetCompoundId.parse(id_)
         dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
         featureSet = dataset.getFeatureSet(id_)
-        return self.runGetRequest(featureSet)
+        return self.runGetRequest(featureSet, responseMimetype)
 
-    def runGetDataset(self, id_):
+    def runGetDataset(self, id_, responseMimetype=protocol.JSON_MIMETYPE):
         """
         Runs a getDataset request for the specified ID.
         """
         dataset = self.getDataRepository().getDataset(id_)
-        return self.runGetRequest(dataset)
+        return self.runGetRequest(dataset, responseMimetype)
 
-    def runGetVariantAnnotationSet(self, id_):
+    def runGetVariantAnnotationSet(
+            self, id_, responseMimetype=protocol.JSON_MIMETYPE):
         """
         Runs a getVariantSet request for the specified ID.
         """
@@ -844,101 +1944,133 @@ class Backend(object):
         dataset = self.getDataRepository().getDataset(compoundId.dataset_id)
         variantSet = dataset.getVariantSet(compoundId.variant_set_id)
         variantAnnotationSet = variantSet.getVariantAnnotationSet(id_)
-        return self.runGetRequest(variantAnnotationSet)
+        return self.runGetRequest(variantAnnotationSet, responseMimetype)
 
     # Search requests.
 
-    def runSearchReadGroupSets(self, request):
+    def runSearchReadGroupSets(
+            self, request, requestMimetype=protocol.JSON_MIMETYPE,
+            responseMimetype=protocol.JSON_MIMETYPE, fieldMask=None):
         """
         Runs the specified SearchReadGroupSetsRequest.
         """
         return self.runSearchRequest(
             request, protocol.SearchReadGroupSetsRequest,
             protocol.SearchReadGroupSetsResponse,
-            self.readGroupSetsGenerator)
+            self.readGroupSetsGenerator,
+            requestMimetype, responseMimetype, fieldMask)
 
-    def runSearchReads(self, request):
+    def runSearchReads(
+            self, request, requestMimetype=protocol.JSON_MIMETYPE,
+            responseMimetype=protocol.JSON_MIMETYPE, fieldMask=None):
         """
         Runs the specified SearchReadsRequest.
         """
         return self.runSearchRequest(
             request, protocol.SearchReadsRequest,
             protocol.SearchReadsResponse,
-            self.readsGenerator)
+            functools.partial(self.readsGenerator, fieldMask=fieldMask),
+            requestMimetype, responseMimetype, fieldMask)
 
-    def runSearchReferenceSets(self, request):
+    def runSearchReferenceSets(
+            self, request, requestMimetype=protocol.JSON_MIMETYPE,
+            responseMimetype=protocol.JSON_MIMETYPE, fieldMask=None):
         """
         Runs the specified SearchReferenceSetsRequest.
         """
         return self.runSearchRequest(
             request, protocol.SearchReferenceSetsRequest,
             protocol.SearchReferenceSetsResponse,
-            self.referenceSetsGenerator)
+            self.referenceSetsGenerator,
+            requestMimetype, responseMimetype, fieldMask)
 
-    def runSearchReferences(self, request):
+    def runSearchReferences(
+            self, request, requestMimetype=protocol.JSON_MIMETYPE,
+            responseMimetype=protocol.JSON_MIMETYPE, fieldMask=None):
         """
         Runs the specified SearchReferenceRequest.
         """
         return self.runSearchRequest(
             request, protocol.SearchReferencesRequest,
             protocol.SearchReferencesResponse,
-            self.referencesGenerator)
+            self.referencesGenerator,
+            requestMimetype, responseMimetype, fieldMask)
 
-    def runSearchVariantSets(self, request):
+    def runSearchVariantSets(
+            self, request, requestMimetype=protocol.JSON_MIMETYPE,
+            responseMimetype=protocol.JSON_MIMETYPE, fieldMask=None):
         """
         Runs the specified SearchVariantSetsRequest.
         """
         return self.runSearchRequest(
             request, protocol.SearchVariantSetsRequest,
             protocol.SearchVariantSetsResponse,
-            self.variantSetsGenerator)
+            self.variantSetsGenerator,
+            requestMimetype, responseMimetype, fieldMask)
 
-    def runSearchVariantAnnotationSets(self, request):
+    def runSearchVariantAnnotationSets(
+            self, request, requestMimetype=protocol.JSON_MIMETYPE,
+            responseMimetype=protocol.JSON_MIMETYPE, fieldMask=None):
         """
         Runs the specified SearchVariantAnnotationSetsRequest.
         """
         return self.runSearchRequest(
             request, protocol.SearchVariantAnnotationSetsRequest,
             protocol.SearchVariantAnnotationSetsResponse,
-            self.variantAnnotationSetsGenerator)
+            self.variantAnnotationSetsGenerator,
+            requestMimetype, responseMimetype, fieldMask)
 
-    def runSearchVariants(self, request):
+    def runSearchVariants(
+            self, request, requestMimetype=protocol.JSON_MIMETYPE,
+            responseMimetype=protocol.JSON_MIMETYPE, fieldMask=None):
         """
         Runs the specified SearchVariantRequest.
         """
         return self.runSearchRequest(
             request, protocol.SearchVariantsRequest,
             protocol.SearchVariantsResponse,
-            self.variantsGenerator)
+            functools.partial(self.variantsGenerator, fieldMask=fieldMask),
+            requestMimetype, responseMimetype, fieldMask)
 
-    def runSearchVariantAnnotations(self, request):
+    def runSearchVariantAnnotations(
+            self, request, requestMimetype=protocol.JSON_MIMETYPE,
+            responseMimetype=protocol.JSON_MIMETYPE, fieldMask=None):
         """
         Runs the specified SearchVariantAnnotationsRequest.
         """
         return self.runSearchRequest(
             request, protocol.SearchVariantAnnotationsRequest,
             protocol.SearchVariantAnnotationsResponse,
-            self.variantAnnotationsGenerator)
+            self.variantAnnotationsGenerator,
+            requestMimetype, responseMimetype, fieldMask)
 
-    def runSearchCallSets(self, request):
+    def runSearchCallSets(
+            self, request, requestMimetype=protocol.JSON_MIMETYPE,
+            responseMimetype=protocol.JSON_MIMETYPE, fieldMask=None):
         """
         Runs the specified SearchCallSetsRequest.
         """
         return self.runSearchRequest(
             request, protocol.SearchCallSetsRequest,
             protocol.SearchCallSetsResponse,
-            self.callSetsGenerator)
+            self.callSetsGenerator,
+            requestMimetype, responseMimetype, fieldMask)
 
-    def runSearchDatasets(self, request):
+    def runSearchDatasets(
+            self, request, requestMimetype=protocol.JSON_MIMETYPE,
+            responseMimetype=protocol.JSON_MIMETYPE, fieldMask=None):
         """
         Runs the specified SearchDatasetsRequest.
         """
         return self.runSearchRequest(
             request, protocol.SearchDatasetsRequest,
             protocol.SearchDatasetsResponse,
-            self.datasetsGenerator)
+            self.datasetsGenerator,
+            requestMimetype, responseMimetype, fieldMask)
 
-    def runSearchFeatureSets(self, request):
+    def runSearchFeatureSets(
+            self, request, requestMimetype=protocol.JSON_MIMETYPE,
+            responseMimetype=protocol.JSON_MIMETYPE, fieldMask=None):
         """
         Returns a SearchFeatureSetsResponse for the specified
         SearchFeatureSetsRequest object.
@@ -946,9 +2078,12 @@ class Backend(object):
         return self.runSearchRequest(
             request, protocol.SearchFeatureSetsRequest,
             protocol.SearchFeatureSetsResponse,
-            self.featureSetsGenerator)
+            self.featureSetsGenerator,
+            requestMimetype, responseMimetype, fieldMask)
 
-    def runSearchFeatures(self, request):
+    def runSearchFeatures(
+            self, request, requestMimetype=protocol.JSON_MIMETYPE,
+            responseMimetype=protocol.JSON_MIMETYPE, fieldMask=None):
         """
         Returns a SearchFeaturesResponse for the specified
         SearchFeaturesRequest object.
@@ -959,4 +2094,5 @@ class Backend(object):
         return self.runSearchRequest(
             request, protocol.SearchFeaturesRequest,
             protocol.SearchFeaturesResponse,
-            self.featuresGenerator)
+            functools.partial(self.featuresGenerator, fieldMask=fieldMask),
+            requestMimetype, responseMimetype, fieldMask)
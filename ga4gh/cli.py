@@ -124,6 +124,9 @@ def addServerOptions(parser):
     parser.add_argument(
         "--dont-use-reloader", default=False, action="store_true",
         help="Don't use the flask reloader")
+    parser.add_argument(
+        "--async", dest="use_async", default=False, action="store_true",
+        help="Serve requests from an event loop (requires gevent)")
     addVersionArgument(parser)
     addDisableUrllibWarningsArgument(parser)
 
@@ -144,6 +147,11 @@ def server_main(args=None):
     sslContext = None
     if parsedArgs.tls or ("OIDC_PROVIDER" in frontend.app.config):
         sslContext = "adhoc"
+    if parsedArgs.use_async:
+        if sslContext is not None:
+            parser.error("TLS is not supported by the asynchronous server")
+        frontend.runAsyncServer(parsedArgs.host, parsedArgs.port)
+        return
     frontend.app.run(
         host=parsedArgs.host, port=parsedArgs.port,
         use_reloader=not parsedArgs.dont_use_reloader,
@@ -1625,7 +1633,7 @@ class RepoManager(object):
         we don't have any broken URLs, missing files, etc.
         """
         self._openRepo()
-        self._repo.verify()
+        self._repo.verify(self._args.workers)
 
     def addOntology(self):
         """
@@ -1704,6 +1712,8 @@ class RepoManager(object):
             referenceSetName = readGroupSet.getBamHeaderReferenceSetName()
         referenceSet = self._repo.getReferenceSetByName(referenceSetName)
         readGroupSet.setReferenceSet(referenceSet)
+        if self._args.checkReferences:
+            readGroupSet.checkConsistency(self._repo)
         self._updateRepo(self._repo.insertReadGroupSet, readGroupSet)
 
     def addVariantSet(self):
@@ -1759,7 +1769,8 @@ class RepoManager(object):
         indexFiles = map(lambda url: self._getFilePath(
             url, self._args.relativePath), indexFiles)
         variantSet = variants.HtslibVariantSet(dataset, name)
-        variantSet.populateFromFile(dataUrls, indexFiles)
+        variantSet.populateFromFile(
+            dataUrls, indexFiles, self._args.workers)
         # Get the reference set that is associated with the variant set.
         referenceSetName = self._args.referenceSetName
         if referenceSetName is None:
@@ -1772,6 +1783,8 @@ class RepoManager(object):
                 "VariantSet using the --referenceSetName option")
         referenceSet = self._repo.getReferenceSetByName(referenceSetName)
         variantSet.setReferenceSet(referenceSet)
+        if self._args.statistics != "none":
+            variantSet.computeStatistics(scan=self._args.statistics == "scan")
 
         # Now check for annotations
         annotationSets = []
@@ -1786,12 +1799,50 @@ class RepoManager(object):
                 annotationSet.setOntology(ontology)
                 annotationSets.append(annotationSet)
 
+        # The sidecar files are built under temporary names, so that the
+        # files of an existing variant set with the same ID are not
+        # replaced if the variant set cannot be added.
+        sidecarPaths = []
+        if self._args.buildVariantIdIndex:
+            variantIdIndexPath = self._getSidecarPath(
+                variantSet, "variantIdIndex.db")
+            variantSet.buildVariantIdIndex(variantIdIndexPath + ".tmp")
+            variantSet.setVariantIdIndexPath(self._getFilePath(
+                variantIdIndexPath, self._args.relativePath))
+            sidecarPaths.append(variantIdIndexPath)
+        if self._args.buildVariantDensity:
+            variantDensityPath = self._getSidecarPath(
+                variantSet, "variantDensity.db")
+            variantSet.buildVariantDensity(variantDensityPath + ".tmp")
+            variantSet.setVariantDensityPath(self._getFilePath(
+                variantDensityPath, self._args.relativePath))
+            sidecarPaths.append(variantDensityPath)
+
         # Add the annotation sets and the variant set as an atomic update
         def updateRepo():
             self._repo.insertVariantSet(variantSet)
             for annotationSet in annotationSets:
                 self._repo.insertVariantAnnotationSet(annotationSet)
-        self._updateRepo(updateRepo)
+            for sidecarPath in sidecarPaths:
+                os.rename(sidecarPath + ".tmp", sidecarPath)
+        try:
+            self._updateRepo(updateRepo)
+        finally:
+            for sidecarPath in sidecarPaths:
+                if os.path.exists(sidecarPath + ".tmp"):
+                    os.unlink(sidecarPath + ".tmp")
+
+    def _getSidecarPath(self, variantSet, suffix):
+        """
+        Returns the path of the sidecar file with the specified suffix for
+        the specified variant set, creating the repo's sidecar directory
+        if necessary.
+        """
+        sidecarDirectory = self._repo.getSidecarDirectory()
+        if not os.path.exists(sidecarDirectory):
+            os.makedirs(sidecarDirectory)
+        return os.path.join(
+            sidecarDirectory, "{}.{}".format(variantSet.getId(), suffix))
 
     def removeReferenceSet(self):
         """
@@ -1828,8 +1879,20 @@ class RepoManager(object):
 
         def func():
             self._updateRepo(self._repo.removeVariantSet, variantSet)
+            self._removeSidecarFiles(variantSet)
         self._confirmDelete("VariantSet", variantSet.getLocalId(), func)
 
+    def _removeSidecarFiles(self, variantSet):
+        """
+        Removes the sidecar files built for the specified variant set.
+        """
+        sidecarPaths = [
+            variantSet.getVariantIdIndexPath(),
+            variantSet.getVariantDensityPath()]
+        for sidecarPath in sidecarPaths:
+            if sidecarPath is not None and os.path.exists(sidecarPath):
+                os.unlink(sidecarPath)
+
     def removeDataset(self):
         """
         Removes a dataset from the repo.
@@ -1839,6 +1902,8 @@ class RepoManager(object):
 
         def func():
             self._updateRepo(self._repo.removeDataset, dataset)
+            for variantSet in dataset.getVariantSets():
+                self._removeSidecarFiles(variantSet)
         self._confirmDelete("Dataset", dataset.getLocalId(), func)
 
     def addFeatureSet(self):
@@ -1970,6 +2035,14 @@ class RepoManager(object):
     def addFilePathArgument(cls, subparser, helpText):
         subparser.add_argument("filePath", help=helpText)
 
+    @classmethod
+    def addWorkersOption(cls, subparser):
+        subparser.add_argument(
+            "-w", "--workers", type=int, default=1,
+            help=(
+                "the number of worker processes used to read the VCF/BCF "
+                "files of each variant set concurrently"))
+
     @classmethod
     def addNameOption(cls, parser, objectType):
         parser.add_argument(
@@ -1994,6 +2067,7 @@ class RepoManager(object):
             "Verifies the repository by examing all data files")
         verifyParser.set_defaults(runner="verify")
         cls.addRepoArgument(verifyParser)
+        cls.addWorkersOption(verifyParser)
 
         listParser = addSubparser(
             subparsers, "list", "List the contents of the repo")
@@ -2074,6 +2148,12 @@ class RepoManager(object):
                 "be automatically inferred by appending '.bai' to the "
                 "file name. If the dataFile is a remote URL the path to "
                 "a local file containing the BAM index must be provided"))
+        addReadGroupSetParser.add_argument(
+            "-c", "--checkReferences", action="store_true",
+            help=(
+                "Check that every reference with reads aligned to it in "
+                "the BAM file is in the reference set, and fail otherwise. "
+                "Reads on other references cannot be queried."))
 
         addOntologyParser = addSubparser(
             subparsers, "add-ontology",
@@ -2136,11 +2216,35 @@ class RepoManager(object):
         cls.addNameOption(addVariantSetParser, objectType)
         cls.addReferenceSetNameOption(addVariantSetParser, objectType)
         cls.addSequenceOntologyNameOption(addVariantSetParser, objectType)
+        cls.addWorkersOption(addVariantSetParser)
         addVariantSetParser.add_argument(
             "-a", "--addAnnotationSets", action="store_true",
             help=(
                 "If the supplied VCF file contains annotations, create the "
                 "corresponding VariantAnnotationSet."))
+        addVariantSetParser.add_argument(
+            "-s", "--statistics", default="index",
+            choices=["none", "index", "scan"],
+            help=(
+                "How to compute the statistics of the variants on each "
+                "reference: 'index' reads the number of variants from the "
+                "index files where they record it and reads the other "
+                "files in full, 'scan' reads all of the files in full, "
+                "which also gives the positions and types of the "
+                "variants, and 'none' skips them."))
+        addVariantSetParser.add_argument(
+            "-x", "--buildVariantIdIndex", action="store_true",
+            help=(
+                "Build an index of the file offsets of the variants by ID, "
+                "stored next to the repo, so that variants can be "
+                "fetched by ID without scanning the records at their "
+                "position."))
+        addVariantSetParser.add_argument(
+            "-D", "--buildVariantDensity", action="store_true",
+            help=(
+                "Precompute the number of variants in bins of 1kb up to "
+                "10Mb along each reference, stored next to the repo, to "
+                "serve variant density requests."))
 
         removeVariantSetParser = addSubparser(
             subparsers, "remove-variantset",
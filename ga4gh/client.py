@@ -5,6 +5,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import json
 import requests
 import posixpath
 import logging
@@ -18,6 +19,21 @@ class AbstractClient(object):
     """
     The abstract superclass of GA4GH Client objects.
     """
+    # The protocol classes of the objects that can be fetched by getMany
+    _batchGetClassMap = {
+        "callsets": protocol.CallSet,
+        "datasets": protocol.Dataset,
+        "features": protocol.Feature,
+        "featuresets": protocol.FeatureSet,
+        "readgroups": protocol.ReadGroup,
+        "readgroupsets": protocol.ReadGroupSet,
+        "references": protocol.Reference,
+        "referencesets": protocol.ReferenceSet,
+        "variantannotationsets": protocol.VariantAnnotationSet,
+        "variants": protocol.Variant,
+        "variantsets": protocol.VariantSet,
+    }
+    _defaultBatchGetSize = 100
 
     def __init__(self, logLevel=0):
         self._pageSize = None
@@ -27,12 +43,15 @@ class AbstractClient(object):
         self._logger = logging.getLogger(__name__)
         self._logger.setLevel(logLevel)
 
-    def _deserializeResponse(self, jsonResponseString, protocolResponseClass):
-        self._protocolBytesReceived += len(jsonResponseString)
-        self._logger.debug("response:{}".format(jsonResponseString))
-        if not jsonResponseString:
+    def _deserializeResponse(
+            self, responseString, protocolResponseClass,
+            mimetype=protocol.JSON_MIMETYPE):
+        self._protocolBytesReceived += len(responseString)
+        self._logger.debug("response:{}".format(repr(responseString)))
+        if not responseString:
             raise exceptions.EmptyResponseException()
-        return protocol.fromJson(jsonResponseString, protocolResponseClass)
+        return protocol.deserialize(
+            responseString, protocolResponseClass, mimetype)
 
     def _runSearchPageRequest(
             self, protocolRequest, objectName, protocolResponseClass):
@@ -98,6 +117,47 @@ class AbstractClient(object):
         """
         raise NotImplemented()
 
+    def _runBatchGetRequest(self, objectName, requestString):
+        """
+        Runs a batch get transaction with the server for the objects of
+        the specified type, and returns the JSON response string.
+        """
+        raise NotImplemented()
+
+    def getMany(self, objectName, ids):
+        """
+        Returns a list of the objects of the specified type with the
+        specified IDs, in the same order. The objects are fetched from the
+        server in batches rather than one request at a time. Objects that
+        could not be fetched are replaced by a GAException describing the
+        error.
+
+        :param str objectName: The type of the objects of interest, as it
+            appears in the URL of the corresponding GET request; for example
+            "variants" or "callsets".
+        :param list ids: The IDs of the objects of interest.
+        :return: The objects of interest, or GAExceptions.
+        :rtype: list
+        """
+        protocolClass = self._batchGetClassMap[objectName]
+        batchSize = self._pageSize or self._defaultBatchGetSize
+        objects = []
+        for i in range(0, len(ids), batchSize):
+            requestString = json.dumps({"ids": ids[i:i + batchSize]})
+            responseString = self._runBatchGetRequest(
+                objectName, requestString)
+            self._protocolBytesReceived += len(responseString)
+            if not responseString:
+                raise exceptions.EmptyResponseException()
+            for result in json.loads(responseString)["results"]:
+                if "object" in result:
+                    objects.append(protocol.fromJson(
+                        json.dumps(result["object"]), protocolClass))
+                else:
+                    objects.append(protocol.fromJson(
+                        json.dumps(result["error"]), protocol.GAException))
+        return objects
+
     def getPageSize(self):
         """
         Returns the suggested maximum size of pages of results returned by
@@ -542,13 +602,21 @@ class HttpClient(AbstractClient):
         the :mod:`logging` module. This is :data:`logging.WARNING` by default.
     :param str authenticationKey: The authentication key provided by the
         server after logging in.
+    :param str mimetype: The wire format used to exchange protocol
+        messages with the server. This is JSON by default. Binary protobuf
+        is more compact and faster to parse, but fields declared as
+        ``float`` in the schemas (such as ``Reference.source_divergence``)
+        are then received with single precision. If the server does not
+        support protobuf, the client falls back to JSON.
     """
 
     def __init__(
-            self, urlPrefix, logLevel=logging.WARNING, authenticationKey=None):
+            self, urlPrefix, logLevel=logging.WARNING, authenticationKey=None,
+            mimetype=protocol.JSON_MIMETYPE):
         super(HttpClient, self).__init__(logLevel)
         self._urlPrefix = urlPrefix
         self._authenticationKey = authenticationKey
+        self._mimetype = mimetype
         self._session = requests.Session()
         self._setupHttpSession()
         requestsLog = logging.getLogger("requests.packages.urllib3")
@@ -559,7 +627,11 @@ class HttpClient(AbstractClient):
         """
         Sets up the common HTTP session parameters used by requests.
         """
-        headers = {"Content-type": "application/json"}
+        accept = self._mimetype
+        if self._mimetype != protocol.JSON_MIMETYPE:
+            accept = "{}, {};q=0.5".format(
+                self._mimetype, protocol.JSON_MIMETYPE)
+        headers = {"Content-type": self._mimetype, "Accept": accept}
         self._session.headers.update(headers)
         # TODO is this unsafe????
         self._session.verify = False
@@ -582,22 +654,60 @@ class HttpClient(AbstractClient):
         """
         return {'key': self._authenticationKey}
 
+    def getMimetype(self):
+        """
+        Returns the wire format used to exchange protocol messages with
+        the server.
+        """
+        return self._mimetype
+
+    def _deserializeHttpResponse(self, response, protocolResponseClass):
+        """
+        Deserialises the body of the specified HTTP response using the
+        wire format given by its Content-Type.
+        """
+        contentType = response.headers.get(
+            "Content-Type", protocol.JSON_MIMETYPE)
+        mimetype = contentType.split(";")[0].strip()
+        return self._deserializeResponse(
+            response.content, protocolResponseClass, mimetype)
+
     def _runSearchPageRequest(
             self, protocolRequest, objectName, protocolResponseClass):
         url = posixpath.join(self._urlPrefix, objectName + '/search')
-        data = protocol.toJson(protocolRequest)
-        self._logger.debug("request:{}".format(data))
+        data = protocol.serialize(protocolRequest, self._mimetype)
+        self._logger.debug("request:{}".format(repr(data)))
         response = self._session.post(
             url, params=self._getHttpParameters(), data=data)
+        if (response.status_code == requests.codes.unsupported_media_type and
+                self._mimetype != protocol.JSON_MIMETYPE):
+            # Servers that predate protobuf support only accept JSON.
+            self._mimetype = protocol.JSON_MIMETYPE
+            self._setupHttpSession()
+            return self._runSearchPageRequest(
+                protocolRequest, objectName, protocolResponseClass)
         self._checkResponseStatus(response)
-        return self._deserializeResponse(response.text, protocolResponseClass)
+        return self._deserializeHttpResponse(response, protocolResponseClass)
 
     def _runGetRequest(self, objectName, protocolResponseClass, id_):
         urlSuffix = "{objectName}/{id}".format(objectName=objectName, id=id_)
         url = posixpath.join(self._urlPrefix, urlSuffix)
         response = self._session.get(url, params=self._getHttpParameters())
         self._checkResponseStatus(response)
-        return self._deserializeResponse(response.text, protocolResponseClass)
+        return self._deserializeHttpResponse(response, protocolResponseClass)
+
+    def _runBatchGetRequest(self, objectName, requestString):
+        url = posixpath.join(self._urlPrefix, objectName + '/batchGet')
+        # Batch get requests are always exchanged as JSON
+        headers = {
+            "Content-type": protocol.JSON_MIMETYPE,
+            "Accept": protocol.JSON_MIMETYPE,
+        }
+        response = self._session.post(
+            url, params=self._getHttpParameters(), data=requestString,
+            headers=headers)
+        self._checkResponseStatus(response)
+        return response.text
 
     def _runListReferenceBasesPageRequest(self, id_, request):
         urlSuffix = "references/{id}/bases".format(id=id_)
@@ -606,8 +716,8 @@ class HttpClient(AbstractClient):
         params.update(protocol.toJsonDict(request))
         response = self._session.get(url, params=params)
         self._checkResponseStatus(response)
-        return self._deserializeResponse(
-            response.text, protocol.ListReferenceBasesResponse)
+        return self._deserializeHttpResponse(
+            response, protocol.ListReferenceBasesResponse)
 
 
 class LocalClient(AbstractClient):
@@ -649,6 +759,9 @@ class LocalClient(AbstractClient):
         responseJson = getMethod(id_)
         return self._deserializeResponse(responseJson, protocolResponseClass)
 
+    def _runBatchGetRequest(self, objectName, requestString):
+        return self._backend.runBatchGet(objectName, requestString)
+
     def _runSearchPageRequest(
             self, protocolRequest, objectName, protocolResponseClass):
         searchMethod = self._searchMethodMap[objectName]
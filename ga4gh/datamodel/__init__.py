@@ -9,6 +9,9 @@ from __future__ import unicode_literals
 import json
 import base64
 import collections
+import contextlib
+import threading
+import time
 
 import ga4gh.exceptions as exceptions
 
@@ -27,6 +30,10 @@ class PysamFileHandleCache(object):
         self._memoTable = dict()
         # Initialize the value even if it will be set up by the config
         self._maxCacheSize = 50
+        self._local = threading.local()
+        self._numHits = 0
+        self._numMisses = 0
+        self._numEvictions = 0
 
     def setMaxCacheSize(self, size):
         """
@@ -37,6 +44,35 @@ class PysamFileHandleCache(object):
                 "The size of the cache must be a strictly positive value")
         self._maxCacheSize = size
 
+    def getMaxCacheSize(self):
+        """
+        Returns the maximum size of the cache
+        """
+        return self._maxCacheSize
+
+    @contextlib.contextmanager
+    def detachedIterators(self):
+        """
+        Returns a context manager within which iterators over the records
+        of a cached file are given their own underlying htslib file
+        handle, so that they can be suspended and resumed independently of
+        the other iterators over the same file. This only applies to the
+        iterators created by the current thread.
+        """
+        previous = self.getDetachedIterators()
+        self._local.detachedIterators = True
+        try:
+            yield
+        finally:
+            self._local.detachedIterators = previous
+
+    def getDetachedIterators(self):
+        """
+        Returns True if iterators created by the current thread should have
+        their own file handle.
+        """
+        return getattr(self._local, "detachedIterators", False)
+
     def _add(self, dataFile, handle):
         """
         Add a file handle to the left of the deque
@@ -67,6 +103,25 @@ class PysamFileHandleCache(object):
         """
         return self._memoTable.keys()
 
+    def getNumHits(self):
+        """
+        Returns the number of requests for a file that was already open.
+        """
+        return self._numHits
+
+    def getNumMisses(self):
+        """
+        Returns the number of requests for a file that had to be opened.
+        """
+        return self._numMisses
+
+    def getNumEvictions(self):
+        """
+        Returns the number of file handles closed to keep the cache within
+        its maximum size.
+        """
+        return self._numEvictions
+
     def getFileHandle(self, dataFile, openMethod):
         """
         Returns handle associated to the filename. If the file is
@@ -77,8 +132,10 @@ class PysamFileHandleCache(object):
         if dataFile in self._memoTable:
             handle = self._memoTable[dataFile]
             self._update(dataFile, handle)
+            self._numHits += 1
             return handle
         else:
+            self._numMisses += 1
             try:
                 handle = openMethod(dataFile)
             except ValueError:
@@ -89,12 +146,243 @@ class PysamFileHandleCache(object):
             if len(self._memoTable) > self._maxCacheSize:
                 dataFile = self._removeLru()
                 del self._memoTable[dataFile]
+                self._numEvictions += 1
             return handle
 
 
 # LRU cache of open file handles
 fileHandleCache = PysamFileHandleCache()
 
+# The caches of the threads that keep their own file handles, as the
+# PysamFileHandleCache and the handles it holds are not thread safe.
+_threadFileHandleCaches = threading.local()
+_fileHandleCaches = [fileHandleCache]
+_fileHandleCachesLock = threading.Lock()
+
+
+def useThreadFileHandleCache():
+    """
+    Makes the current thread open and cache file handles in a
+    PysamFileHandleCache of its own, with the same maximum size as the
+    shared cache, rather than in the shared one.
+    """
+    if getattr(_threadFileHandleCaches, "cache", None) is None:
+        cache = PysamFileHandleCache()
+        cache.setMaxCacheSize(fileHandleCache.getMaxCacheSize())
+        with _fileHandleCachesLock:
+            _fileHandleCaches.append(cache)
+        _threadFileHandleCaches.cache = cache
+
+
+def getFileHandleCache():
+    """
+    Returns the file handle cache used by the current thread.
+    """
+    return getattr(_threadFileHandleCaches, "cache", fileHandleCache)
+
+
+def getFileHandleCaches():
+    """
+    Returns the list of all the file handle caches, the shared one first.
+    """
+    with _fileHandleCachesLock:
+        return list(_fileHandleCaches)
+
+
+class RequestTimer(object):
+    """
+    Accumulates the wall clock and CPU time spent in each phase of
+    handling a request, such as parsing the request, fetching records from
+    files, converting them to protocol objects and serialising the
+    response, along with counts of the objects processed and the parsed
+    protocol request, if there is one. Phases may be
+    nested, and the time spent in an inner phase is not counted in the
+    outer phase. The exception is the skip phase: all of the work done
+    while skipping over the objects before the start of a page is counted
+    as skipping. The CPU time is that of the whole process, and so
+    includes any work done for concurrent requests.
+    """
+    skipPhase = "skip"
+
+    def __init__(self):
+        self._startTime = time.time()
+        self._wallTimes = collections.OrderedDict()
+        self._cpuTimes = {}
+        self._counts = collections.OrderedDict()
+        self._request = None
+        # The stack of [phase, wall time, CPU time] entries for the open
+        # phases, with the times at which each was last resumed.
+        self._stack = []
+
+    def _charge(self, entry, wallTime, cpuTime):
+        phase = entry[0]
+        self._wallTimes[phase] = (
+            self._wallTimes.get(phase, 0) + wallTime - entry[1])
+        self._cpuTimes[phase] = (
+            self._cpuTimes.get(phase, 0) + cpuTime - entry[2])
+
+    def startPhase(self, phase):
+        """
+        Starts timing the specified phase, suspending the current phase.
+        """
+        wallTime, cpuTime = time.time(), time.clock()
+        if len(self._stack) > 0:
+            outer = self._stack[-1]
+            self._charge(outer, wallTime, cpuTime)
+            if outer[0] == self.skipPhase:
+                phase = self.skipPhase
+        self._stack.append([phase, wallTime, cpuTime])
+
+    def endPhase(self):
+        """
+        Stops timing the current phase, resuming the phase it suspended.
+        """
+        wallTime, cpuTime = time.time(), time.clock()
+        self._charge(self._stack.pop(), wallTime, cpuTime)
+        if len(self._stack) > 0:
+            self._stack[-1][1:] = [wallTime, cpuTime]
+
+    def addCount(self, name, count=1):
+        """
+        Adds the specified number to the count with the specified name.
+        """
+        self._counts[name] = self._counts.get(name, 0) + count
+
+    def setRequest(self, request):
+        """
+        Sets the parsed protocol request being handled.
+        """
+        self._request = request
+
+    def getRequest(self):
+        """
+        Returns the parsed protocol request being handled, or None if it
+        has not been set.
+        """
+        return self._request
+
+    def getPhases(self):
+        """
+        Returns a list of (phase, wall time, CPU time) tuples, in seconds,
+        in the order in which the phases were first started.
+        """
+        return [
+            (phase, wallTime, self._cpuTimes[phase])
+            for phase, wallTime in self._wallTimes.items()]
+
+    def getCounts(self):
+        """
+        Returns a list of the (name, count) pairs of the counts.
+        """
+        return list(self._counts.items())
+
+    def getElapsedTime(self):
+        """
+        Returns the wall clock time in seconds since this timer was
+        created.
+        """
+        return time.time() - self._startTime
+
+
+class _TimedPhase(object):
+    """
+    A context manager that times its body as a phase of a RequestTimer.
+    """
+    def __init__(self, timer, phase):
+        self._timer = timer
+        self._phase = phase
+
+    def __enter__(self):
+        self._timer.startPhase(self._phase)
+
+    def __exit__(self, exceptionType, exception, traceback):
+        self._timer.endPhase()
+        return False
+
+
+class _UntimedPhase(object):
+    """
+    A context manager that does nothing, used when there is no timer.
+    """
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exceptionType, exception, traceback):
+        return False
+
+
+_untimedPhase = _UntimedPhase()
+_requestTimers = threading.local()
+
+
+def setRequestTimer(timer):
+    """
+    Sets the RequestTimer for the request being handled by the current
+    thread. A timer of None disables timing.
+    """
+    _requestTimers.timer = timer
+
+
+def getRequestTimer():
+    """
+    Returns the RequestTimer for the request being handled by the current
+    thread, or None if the request is not being timed.
+    """
+    return getattr(_requestTimers, "timer", None)
+
+
+def timePhase(phase):
+    """
+    Returns a context manager that attributes the time spent in its body
+    to the specified phase of the current thread's request timer, if it
+    has one.
+    """
+    timer = getRequestTimer()
+    if timer is None:
+        return _untimedPhase
+    return _TimedPhase(timer, phase)
+
+
+def timeIterator(iterator, phase):
+    """
+    Yields the values of the specified iterator, attributing the time taken
+    to produce each one to the specified phase of the current thread's
+    request timer. The timer is looked up for each value, as an iterator
+    may be suspended and resumed by a later request.
+    """
+    iterator = iter(iterator)
+    while True:
+        timer = getRequestTimer()
+        if timer is None:
+            value = next(iterator)
+        else:
+            timer.startPhase(phase)
+            try:
+                value = next(iterator)
+            finally:
+                timer.endPhase()
+        yield value
+
+
+def addRequestCount(name, count=1):
+    """
+    Adds the specified number to the named count of the current thread's
+    request timer, if it has one.
+    """
+    timer = getRequestTimer()
+    if timer is not None:
+        timer.addCount(name, count)
+
+
+def recordRequest(request):
+    """
+    Records the specified parsed protocol request as the one being handled
+    by the current thread's request timer, if it has one.
+    """
+    timer = getRequestTimer()
+    if timer is not None:
+        timer.setRequest(request)
+
 
 class CompoundId(object):
     """
@@ -553,4 +841,4 @@ class PysamDatamodelMixin(object):
         return attr
 
     def getFileHandle(self, dataFile):
-        return fileHandleCache.getFileHandle(dataFile, self.openFile)
+        return getFileHandleCache().getFileHandle(dataFile, self.openFile)
@@ -0,0 +1,185 @@
+"""
+Readers for the metadata in the tabix, CSI and BAI indexes of the files
+served through htslib.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import gzip
+import io
+import struct
+
+import ga4gh.exceptions as exceptions
+
+TABIX_MAGIC = b"TBI\1"
+CSI_MAGIC = b"CSI\1"
+BAI_MAGIC = b"BAI\1"
+GZIP_MAGIC = b"\x1f\x8b"
+
+# The minimum shift and depth of the binning scheme of tabix and BAI
+# indexes.
+TABIX_MIN_SHIFT = 14
+TABIX_DEPTH = 5
+
+# The number of records on a reference and the start of the last bin
+# holding any of them, read from an index. Either value is None if it
+# is not known. As each record is held in a bin that contains it, the
+# last record on the reference starts at or after the last bin start.
+IndexedReference = collections.namedtuple(
+    "IndexedReference", ["numRecords", "lastBinStart"])
+
+
+class _IndexReader(object):
+    """
+    Reads the little-endian values of an uncompressed index.
+    """
+    def __init__(self, data):
+        self._data = data
+        self._offset = 0
+
+    def read(self, format_):
+        values = struct.unpack_from(b"<" + format_, self._data, self._offset)
+        self._offset += struct.calcsize(b"<" + format_)
+        return values
+
+    def readInt32(self):
+        return self.read(b"i")[0]
+
+    def readBytes(self, length):
+        value = self._data[self._offset:self._offset + length]
+        self._offset += length
+        return value
+
+    def skip(self, length):
+        self._offset += length
+
+
+def _readNames(reader):
+    """
+    Reads the reference names in the tabix header of an index.
+    """
+    reader.skip(6 * 4)  # format, col_seq, col_beg, col_end, meta, skip
+    namesLength = reader.readInt32()
+    names = reader.readBytes(namesLength).split(b"\0")
+    return [name.decode("utf-8") for name in names if len(name) > 0]
+
+
+def _getBinStart(bin_, minShift, depth):
+    """
+    Returns the start of the genomic interval covered by the specified bin
+    of an index with the specified minimum shift and depth.
+    """
+    level = 0
+    firstBin = 0
+    while level < depth and bin_ >= firstBin + (1 << (3 * level)):
+        firstBin += 1 << (3 * level)
+        level += 1
+    return (bin_ - firstBin) << (minShift + 3 * (depth - level))
+
+
+def _readBins(reader, minShift, depth, hasLinearOffset):
+    """
+    Reads the bins of a reference in an index, returning the
+    IndexedReference holding the number of mapped records stored in its
+    pseudo-bin and the start of its last bin.
+    """
+    pseudoBin = ((1 << ((depth + 1) * 3)) - 1) // 7 + 1
+    numBins = reader.readInt32()
+    numMapped = None if numBins > 0 else 0
+    lastBinStart = None
+    for _ in range(numBins):
+        bin_ = reader.read(b"I")[0]
+        if hasLinearOffset:
+            reader.skip(8)
+        numChunks = reader.readInt32()
+        if bin_ == pseudoBin:
+            if numChunks == 2:
+                numMapped = reader.read(b"QQQQ")[2]
+            else:
+                reader.skip(numChunks * 16)
+        else:
+            reader.skip(numChunks * 16)
+            binStart = _getBinStart(bin_, minShift, depth)
+            if lastBinStart is None or binStart > lastBinStart:
+                lastBinStart = binStart
+    return IndexedReference(numMapped, lastBinStart)
+
+
+def readIndexRecordCounts(indexFile, referenceNames=None):
+    """
+    Returns a dictionary mapping the name of each reference in the
+    specified tabix, CSI or BAI index to the number of records on it, read
+    from the metadata that htslib writes into the index. The number is
+    None if the index does not record it, and 0 if the reference has no
+    records. BAI indexes, and CSI indexes of BAM and BCF files, do not
+    contain the reference names, so these must be given in the order of
+    the references in the file's header.
+    """
+    return dict(
+        (name, indexedReference.numRecords) for name, indexedReference in
+        readIndexReferences(indexFile, referenceNames).items())
+
+
+def readIndexReferences(indexFile, referenceNames=None):
+    """
+    Returns a dictionary mapping the name of each reference in the
+    specified tabix, CSI or BAI index to its IndexedReference. The
+    reference names are needed as described in readIndexRecordCounts.
+    """
+    try:
+        data = _readIndexData(indexFile)
+        return _readReferences(_IndexReader(data), indexFile, referenceNames)
+    except (IOError, struct.error):
+        raise exceptions.FileOpenFailedException(indexFile)
+
+
+def _readIndexData(indexFile):
+    """
+    Returns the contents of the specified index, which are BGZF compressed
+    for tabix and CSI indexes and uncompressed for BAI indexes.
+    """
+    with open(indexFile, "rb") as indexStream:
+        data = indexStream.read()
+    if data.startswith(GZIP_MAGIC):
+        data = gzip.GzipFile(fileobj=io.BytesIO(data)).read()
+    return data
+
+
+def _readReferences(reader, indexFile, referenceNames):
+    """
+    Returns the IndexedReferences read from the specified index, as
+    described in readIndexReferences.
+    """
+    magic = reader.readBytes(4)
+    if magic == TABIX_MAGIC:
+        numReferences = reader.readInt32()
+        names = _readNames(reader)
+        minShift, depth = TABIX_MIN_SHIFT, TABIX_DEPTH
+        hasLinearOffset = False
+    elif magic == CSI_MAGIC:
+        minShift, depth, auxLength = reader.read(b"iii")
+        if auxLength > 0:
+            names = _readNames(reader)
+        else:
+            names = referenceNames
+        numReferences = reader.readInt32()
+        hasLinearOffset = True
+    elif magic == BAI_MAGIC:
+        names = referenceNames
+        numReferences = reader.readInt32()
+        minShift, depth = TABIX_MIN_SHIFT, TABIX_DEPTH
+        hasLinearOffset = False
+    else:
+        raise exceptions.FileOpenFailedException(indexFile)
+    if names is None or len(names) < numReferences:
+        raise exceptions.FileOpenFailedException(indexFile)
+    indexedReferences = {}
+    for name in names[:numReferences]:
+        indexedReferences[name] = _readBins(
+            reader, minShift, depth, hasLinearOffset)
+        if magic != CSI_MAGIC:
+            numIntervals = reader.readInt32()
+            reader.skip(numIntervals * 8)
+    return indexedReferences
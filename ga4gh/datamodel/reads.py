@@ -14,6 +14,7 @@ import random
 import pysam
 
 import ga4gh.datamodel as datamodel
+import ga4gh.datamodel.htslibIndexes as htslibIndexes
 import ga4gh.datamodel.references as references
 import ga4gh.exceptions as exceptions
 import ga4gh.protocol as protocol
@@ -100,9 +101,11 @@ class AlignmentDataMixin(datamodel.PysamDatamodelMixin):
     from bam files
     """
     def _getReadAlignments(
-            self, reference, start, end, readGroupSet, readGroup):
+            self, reference, start, end, readGroupSet, readGroup,
+            fieldMask=None):
         """
-        Returns an iterator over the specified reads
+        Returns an iterator over the specified reads, with the fields
+        included by the specified field mask filled in.
         """
         # TODO If reference is None, return against all references,
         # including unmapped reads.
@@ -110,38 +113,45 @@ class AlignmentDataMixin(datamodel.PysamDatamodelMixin):
         referenceName = reference.getLocalId().encode()
         # TODO deal with errors from htslib
         start, end = self.sanitizeAlignmentFileFetch(start, end)
-        readAlignments = samFile.fetch(referenceName, start, end)
-        for readAlignment in readAlignments:
-            tags = dict(readAlignment.tags)
+        readAlignments = samFile.fetch(
+            referenceName, start, end, multiple_iterators=(
+                datamodel.getFileHandleCache().getDetachedIterators()))
+        # The tags are only needed to find the read group of each read.
+        needTags = readGroup is None or self._filterReads
+        for readAlignment in datamodel.timeIterator(readAlignments, "fetch"):
+            if needTags:
+                tags = dict(readAlignment.tags)
             if readGroup is None:
                 if 'RG' in tags:
                     alignmentReadGroupLocalId = tags['RG']
                     readGroupCompoundId = datamodel.ReadGroupCompoundId(
                         readGroupSet.getCompoundId(),
                         str(alignmentReadGroupLocalId))
-                yield self.convertReadAlignment(
-                    readAlignment, readGroupSet, str(readGroupCompoundId))
+                readGroupId = str(readGroupCompoundId)
+            elif self._filterReads and not (
+                    'RG' in tags and tags['RG'] == self._localId):
+                continue
             else:
-                if self._filterReads:
-                    if 'RG' in tags and tags['RG'] == self._localId:
-                        yield self.convertReadAlignment(
-                            readAlignment, readGroupSet,
-                            str(readGroup.getCompoundId()))
-                else:
-                    yield self.convertReadAlignment(
-                        readAlignment, readGroupSet,
-                        str(readGroup.getCompoundId()))
+                readGroupId = str(readGroup.getCompoundId())
+            with datamodel.timePhase("convert"):
+                gaAlignment = self.convertReadAlignment(
+                    readAlignment, readGroupSet, readGroupId, fieldMask)
+            yield gaAlignment
 
-    def convertReadAlignment(self, read, readGroupSet, readGroupId):
+    def convertReadAlignment(
+            self, read, readGroupSet, readGroupId, fieldMask=None):
         """
-        Convert a pysam ReadAlignment to a GA4GH ReadAlignment
+        Convert a pysam ReadAlignment to a GA4GH ReadAlignment. If a
+        protocol.FieldMask is specified, the qualities, tags and CIGAR
+        are only converted if the mask includes them.
         """
         samFile = self.getFileHandle(self._dataUrl)
         # TODO fill out remaining fields
         # TODO refine in tandem with code in converters module
         ret = protocol.ReadAlignment()
         # ret.fragmentId = 'TODO'
-        ret.aligned_quality.extend(read.query_qualities)
+        if fieldMask is None or fieldMask.includes("aligned_quality"):
+            ret.aligned_quality.extend(read.query_qualities)
         ret.aligned_sequence = read.query_sequence
         if SamFlags.isFlagSet(read.flag, SamFlags.READ_UNMAPPED):
             ret.ClearField("alignment")
@@ -155,19 +165,24 @@ class AlignmentDataMixin(datamodel.PysamDatamodelMixin):
             ret.alignment.position.strand = protocol.POS_STRAND
             if SamFlags.isFlagSet(read.flag, SamFlags.READ_REVERSE_STRAND):
                 ret.alignment.position.strand = protocol.NEG_STRAND
-            for operation, length in read.cigar:
-                gaCigarUnit = ret.alignment.cigar.add()
-                gaCigarUnit.operation = SamCigar.int2ga(operation)
-                gaCigarUnit.operation_length = length
-                gaCigarUnit.reference_sequence = ""  # TODO fix this!
+            includeCigar = fieldMask is None or (
+                fieldMask.includes("alignment") and
+                fieldMask.getSubMask("alignment").includes("cigar"))
+            if includeCigar:
+                for operation, length in read.cigar:
+                    gaCigarUnit = ret.alignment.cigar.add()
+                    gaCigarUnit.operation = SamCigar.int2ga(operation)
+                    gaCigarUnit.operation_length = length
+                    gaCigarUnit.reference_sequence = ""  # TODO fix this!
         ret.duplicate_fragment = SamFlags.isFlagSet(
             read.flag, SamFlags.DUPLICATE_READ)
         ret.failed_vendor_quality_checks = SamFlags.isFlagSet(
             read.flag, SamFlags.FAILED_QUALITY_CHECK)
         ret.fragment_length = read.template_length
         ret.fragment_name = read.query_name
-        for key, value in read.tags:
-            ret.info[key].values.add().string_value = str(value)
+        if fieldMask is None or fieldMask.includes("info"):
+            for key, value in read.tags:
+                ret.info[key].values.add().string_value = str(value)
         if SamFlags.isFlagSet(read.flag, SamFlags.MATE_UNMAPPED):
             ret.next_mate_position.Clear()
         else:
@@ -345,9 +360,11 @@ class SimulatedReadGroupSet(AbstractReadGroupSet):
     def getPrograms(self):
         return []
 
-    def getReadAlignments(self, referenceId=None, start=None, end=None):
+    def getReadAlignments(
+            self, referenceId=None, start=None, end=None, fieldMask=None):
         for readGroup in self.getReadGroups():
-            iterator = readGroup.getReadAlignments(referenceId, start, end)
+            iterator = readGroup.getReadAlignments(
+                referenceId, start, end, fieldMask)
             for alignment in iterator:
                 yield alignment
 
@@ -367,11 +384,13 @@ class HtslibReadGroupSet(AlignmentDataMixin, AbstractReadGroupSet):
         # from the DB.
         self._bamHeaderReferenceSetName = None
 
-    def getReadAlignments(self, reference, start=None, end=None):
+    def getReadAlignments(
+            self, reference, start=None, end=None, fieldMask=None):
         """
         Returns an iterator over the specified reads
         """
-        return self._getReadAlignments(reference, start, end, self, None)
+        return self._getReadAlignments(
+            reference, start, end, self, None, fieldMask)
 
     def getBamHeaderReferenceSetName(self):
         """
@@ -431,10 +450,44 @@ class HtslibReadGroupSet(AlignmentDataMixin, AbstractReadGroupSet):
         self._numUnalignedReads = samFile.unmapped
 
     def checkConsistency(self, dataRepository):
-        pass
-        # TODO verify that the references in the BAM file exist
-        # in the reference set. Otherwise, we won't be able to
-        # query for them.
+        """
+        Checks that the references with mapped reads in the BAM file exist
+        in the reference set. Otherwise, we won't be able to query for
+        them.
+        """
+        referenceSet = self.getReferenceSet()
+        if referenceSet is None:
+            return
+        for referenceName in self.getMappedReferenceNames():
+            try:
+                referenceSet.getReferenceByName(referenceName)
+            except exceptions.ReferenceNameNotFoundException:
+                raise exceptions.ReadGroupReferenceNotFound(
+                    self._dataUrl, referenceName, referenceSet.getLocalId())
+
+    def getMappedReferenceNames(self):
+        """
+        Returns the names of the references in the BAM header that have
+        reads aligned to them. The number of reads on each reference is
+        read from the index where it records it, so that only the
+        references whose number of reads is not known are fetched from.
+        """
+        samFile = self.getFileHandle(self._dataUrl)
+        referenceNames = list(samFile.references)
+        try:
+            readCounts = htslibIndexes.readIndexRecordCounts(
+                self._indexFile, referenceNames)
+        except exceptions.FileOpenFailedException:
+            readCounts = {}
+        mappedReferenceNames = []
+        for referenceName in referenceNames:
+            readCount = readCounts.get(referenceName)
+            if readCount is None:
+                reads = samFile.fetch(referenceName)
+                readCount = 0 if next(reads, None) is None else 1
+            if readCount > 0:
+                mappedReferenceNames.append(referenceName)
+        return mappedReferenceNames
 
     def _setHeaderFields(self, samFile):
         programs = []
@@ -627,7 +680,8 @@ class SimulatedReadGroup(AbstractReadGroup):
         self._numAlignedReads = self._parentContainer.getNumAlignedReads()
         self._numUnalignedReads = 0
 
-    def getReadAlignments(self, referenceId=None, start=None, end=None):
+    def getReadAlignments(
+            self, referenceId=None, start=None, end=None, fieldMask=None):
         rng = random.Random(self._randomSeed)
 
         # We seed reads with sequential seeds starting from here. We hope no
@@ -753,12 +807,13 @@ class HtslibReadGroup(AlignmentDataMixin, AbstractReadGroup):
         self._platformUnit = experiment.platform_unit
         self._runTime = experiment.run_time
 
-    def getReadAlignments(self, reference, start=None, end=None):
+    def getReadAlignments(
+            self, reference, start=None, end=None, fieldMask=None):
         """
         Returns an iterator over the specified reads
         """
         return self._getReadAlignments(
-            reference, start, end, self._parentContainer, self)
+            reference, start, end, self._parentContainer, self, fieldMask)
 
     def getPrograms(self):
         return self._parentContainer.getPrograms()
@@ -270,7 +270,7 @@ class SimulatedFeatureSet(AbstractFeatureSet):
     def getFeatures(
             self, referenceName, start, end,
             pageToken, pageSize,
-            featureTypes=[], parentId=None, numFeatures=10):
+            featureTypes=[], parentId=None, numFeatures=10, fieldMask=None):
         """
         Returns a set number of simulated features.
 
@@ -283,6 +283,8 @@ class SimulatedFeatureSet(AbstractFeatureSet):
         :param parentId: optional parentId to limit query.
         :param numFeatures: number of features to generate in the return.
             10 is a reasonable (if arbitrary) default.
+        :param fieldMask: ignored, as simulated features are cheap to
+            generate in full.
         :return: Yields feature, nextPageToken pairs.
             nextPageToken is None if last feature was yielded.
         """
@@ -377,9 +379,12 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
             gaFeature = self._gaFeatureForFeatureDbRecord(featureReturned)
             return gaFeature
 
-    def _gaFeatureForFeatureDbRecord(self, feature):
+    def _gaFeatureForFeatureDbRecord(self, feature, fieldMask=None):
         """
         :param feature: The DB Row representing a feature
+        :param fieldMask: optional protocol.FieldMask; the child IDs,
+            feature type and attributes are only converted if it includes
+            them.
         :return: the corresponding GA4GH protocol.Feature object
         """
         gaFeature = protocol.Feature()
@@ -398,21 +403,26 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
         else:
             # default to positive strand
             gaFeature.strand = protocol.POS_STRAND
-        gaFeature.child_ids.extend(map(
-                self.getCompoundIdForFeatureId,
-                json.loads(feature['child_ids'])))
-        gaFeature.feature_type.CopyFrom(
-            self._ontology.getGaTermByName(feature['type']))
-        attributes = json.loads(feature['attributes'])
-        # TODO: Identify which values are ExternalIdentifiers and OntologyTerms
-        for key in attributes:
-            for v in attributes[key]:
-                gaFeature.attributes.vals[key].values.add().string_value = v
+        if fieldMask is None or fieldMask.includes("child_ids"):
+            gaFeature.child_ids.extend(map(
+                    self.getCompoundIdForFeatureId,
+                    json.loads(feature['child_ids'])))
+        if fieldMask is None or fieldMask.includes("feature_type"):
+            gaFeature.feature_type.CopyFrom(
+                self._ontology.getGaTermByName(feature['type']))
+        if fieldMask is None or fieldMask.includes("attributes"):
+            attributes = json.loads(feature['attributes'])
+            # TODO: Identify which values are ExternalIdentifiers and
+            # OntologyTerms
+            for key in attributes:
+                values = gaFeature.attributes.vals[key].values
+                for v in attributes[key]:
+                    values.add().string_value = v
         return gaFeature
 
     def getFeatures(self, referenceName, start, end,
                     pageToken, pageSize,
-                    featureTypes=None, parentId=None):
+                    featureTypes=None, parentId=None, fieldMask=None):
         """
         method passed to runSearchRequest to fulfill the request
         :param str referenceName: name of reference (ex: "chr1")
@@ -422,6 +432,8 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
         :param pageSize: none or castable to int
         :param featureTypes: array of str
         :param parentId: none or featureID of parent
+        :param fieldMask: none or protocol.FieldMask of the fields to
+            convert
         :return: yields a protocol.Feature at a time, together with
             the corresponding nextPageToken (which is null for the last
             feature served out).
@@ -430,7 +442,7 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
         start = int(start)
         end = int(end)
 
-        with self._db as dataSource:
+        with datamodel.timePhase("fetch"), self._db as dataSource:
             # featuresCount is needed to ensure that once the
             # request is fulfilled, no nextPageTokens past the
             # end of the actual dataset range are returned.
@@ -451,7 +463,9 @@ class Gff3DbFeatureSet(AbstractFeatureSet):
         else:
             nextPageToken = 0
         for featureRecord in featuresReturned:
-            gaFeature = self._gaFeatureForFeatureDbRecord(featureRecord)
+            with datamodel.timePhase("convert"):
+                gaFeature = self._gaFeatureForFeatureDbRecord(
+                    featureRecord, fieldMask)
             if nextPageToken < featuresCount - 1:
                 nextPageToken += 1
             else:
@@ -6,13 +6,19 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import array
+import collections
 import datetime
 import glob
 import hashlib
+import heapq
 import json
+import multiprocessing
 import os
 import random
 import re
+import sqlite3
+import sys
 
 import pysam
 import google.protobuf.struct_pb2 as struct_pb2
@@ -20,12 +26,27 @@ import google.protobuf.struct_pb2 as struct_pb2
 import ga4gh.protocol as protocol
 import ga4gh.exceptions as exceptions
 import ga4gh.datamodel as datamodel
-import ga4gh.pb as pb
+import ga4gh.datamodel.htslibIndexes as htslibIndexes
 
 ANNOTATIONS_VEP_V82 = "VEP_v82"
 ANNOTATIONS_VEP_V77 = "VEP_v77"
 ANNOTATIONS_SNPEFF = "SNPEff"
 
+# Variants requested together are fetched with a single query if they
+# are no further than this number of bases apart.
+BATCH_FETCH_MAX_GAP = 10000
+
+# The bin sizes of the levels of the precomputed variant density pyramid.
+# Each bin is made up of whole bins of the level below.
+VARIANT_DENSITY_BIN_SIZES = [10**3, 10**4, 10**5, 10**6, 10**7]
+
+VARIANT_TYPE_REF = "REF"
+VARIANT_TYPE_SNP = "SNP"
+VARIANT_TYPE_MNP = "MNP"
+VARIANT_TYPE_INDEL = "INDEL"
+VARIANT_TYPE_OTHER = "OTHER"
+VARIANT_TYPE_MIXED = "MIXED"
+
 
 def isUnspecified(str):
     """
@@ -244,6 +265,40 @@ class AbstractVariantSet(datamodel.DatamodelObject):
         """
         raise NotImplementedError()
 
+    def getStatistics(self):
+        """
+        Returns the statistics of the variants in this VariantSet by
+        reference, or None if they are not available.
+        """
+        return None
+
+    def getVariantDensity(self, referenceName, start, end, binSize):
+        """
+        Returns the list of the numbers of variants starting in each of
+        the bins of binSize bases from start that overlap [start, end).
+        """
+        counts = [0] * _getNumBins(start, end, binSize)
+        variants = self.getVariants(
+            referenceName, start, start + len(counts) * binSize, [])
+        for variant in variants:
+            if variant.start >= start:
+                counts[(variant.start - start) // binSize] += 1
+        return counts
+
+    def getVariantsByCompoundIds(self, compoundIds):
+        """
+        Returns a list of the GA Variants with the specified compound IDs
+        in this variant set, in the same order. The list contains None for
+        each variant that cannot be found.
+        """
+        variants = []
+        for compoundId in compoundIds:
+            try:
+                variants.append(self.getVariant(compoundId))
+            except (exceptions.ObjectNotFoundException, ValueError):
+                variants.append(None)
+        return variants
+
     def _createGaVariant(self):
         """
         Convenience method to set the common fields in a GA Variant
@@ -355,7 +410,7 @@ class SimulatedVariantSet(AbstractVariantSet):
         return variant
 
     def getVariants(self, referenceName, startPosition, endPosition,
-                    callSetIds=None):
+                    callSetIds=None, fieldMask=None):
         randomNumberGenerator = random.Random()
         randomNumberGenerator.seed(self._randomSeed)
         i = startPosition
@@ -406,6 +461,105 @@ def _encodeValue(value):
         return [struct_pb2.Value(string_value=str(value))]
 
 
+def _addEncodedValues(values, value):
+    """
+    Adds the encoding of the specified value to the specified repeated
+    Value field, without the copy made by extending it with _encodeValue.
+    """
+    if isinstance(value, (list, tuple)):
+        for v in value:
+            values.add(string_value=str(v))
+    else:
+        values.add(string_value=str(value))
+
+
+def getVariantType(referenceBases, alternateBases):
+    """
+    Returns the type of the variant with the specified reference and
+    alternate bases: one of the VARIANT_TYPE constants. Symbolic and
+    breakend alleles are of type OTHER, and variants whose alternate
+    alleles are of different types are MIXED.
+    """
+    if alternateBases is None or len(alternateBases) == 0:
+        return VARIANT_TYPE_REF
+    variantTypes = set()
+    for alt in alternateBases:
+        if (alt.startswith("<") or "[" in alt or "]" in alt or
+                alt in ("*", ".")):
+            variantTypes.add(VARIANT_TYPE_OTHER)
+        elif len(alt) != len(referenceBases):
+            variantTypes.add(VARIANT_TYPE_INDEL)
+        elif len(alt) == 1:
+            variantTypes.add(VARIANT_TYPE_SNP)
+        else:
+            variantTypes.add(VARIANT_TYPE_MNP)
+    if len(variantTypes) > 1:
+        return VARIANT_TYPE_MIXED
+    return variantTypes.pop()
+
+
+def _mergeReferenceStatistics(shardStatistics):
+    """
+    Returns the statistics of a reference sharded over several files from
+    the list of the statistics of each shard. Values that are not known
+    for every shard are None.
+    """
+    starts = [statistics["start"] for statistics in shardStatistics]
+    ends = [statistics["end"] for statistics in shardStatistics]
+    variantTypeCounts = collections.Counter()
+    for statistics in shardStatistics:
+        if statistics["variantTypeCounts"] is None:
+            variantTypeCounts = None
+            break
+        variantTypeCounts.update(statistics["variantTypeCounts"])
+    return {
+        "numVariants": sum(
+            statistics["numVariants"] for statistics in shardStatistics),
+        "start": None if None in starts else min(starts),
+        "end": None if None in ends else max(ends),
+        "variantTypeCounts": (
+            None if variantTypeCounts is None else dict(variantTypeCounts)),
+    }
+
+
+def _getNumBins(start, end, binSize):
+    """
+    Returns the number of bins of binSize bases from start that overlap
+    [start, end).
+    """
+    return max(0, (end - start + binSize - 1) // binSize)
+
+
+def _sumBins(counts, factor):
+    """
+    Returns the list of the sums of each run of factor consecutive counts
+    in the specified list.
+    """
+    return [sum(counts[i:i + factor]) for i in range(0, len(counts), factor)]
+
+
+def _packBinCounts(counts):
+    """
+    Returns the specified bin counts as a string of little-endian unsigned
+    32 bit integers.
+    """
+    packed = array.array(b'I', counts)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tostring()
+
+
+def _unpackBinCounts(packedCounts):
+    """
+    Returns the list of bin counts packed by _packBinCounts.
+    """
+    counts = array.array(b'I')
+    counts.fromstring(packedCounts)
+    if sys.byteorder == "big":
+        counts.byteswap()
+    return counts.tolist()
+
+
 _nothing = object()
 
 
@@ -414,15 +568,192 @@ def isEmptyIter(it):
     return next(it, _nothing) is _nothing
 
 
+def _decorateRecords(cursor, shardIndex):
+    """
+    Returns an iterator over the records in the specified cursor, decorated
+    so that records from several shards can be merged in coordinate order.
+    Ties are broken by the order of the shards, and then the order of the
+    records within the shard.
+    """
+    for recordIndex, record in enumerate(cursor):
+        yield record.start, shardIndex, recordIndex, record
+
+
+def _getHeaderMetadataFields(header):
+    """
+    Returns the list of (key, type, number, description) tuples describing
+    the metadata in the specified pysam VCF header, along with the value
+    of the version entry.
+    """
+    # TODO: currently ALT field is not implemented through pysam
+    # NOTE: contigs field is different between vcf files,
+    # so it's not included in metadata
+    # NOTE: filters in not included in metadata unless needed
+    fields = []
+    for prefix, content in [
+            ("FORMAT", header.formats.items()), ("INFO", header.info.items())]:
+        for contentKey, value in content:
+            key = "{0}.{1}".format(prefix, value.name)
+            if key != "FORMAT.GT":
+                fields.append((
+                    key, value.type, "{}".format(value.number),
+                    value.description.strip('"')))
+    return header.version, fields
+
+
+def _getAnnotationType(header, dataUrl):
+    """
+    Returns the type of the variant annotations in the specified pysam VCF
+    header, or None if there are none. Raises a ValueError if the
+    annotations are not supported.
+    """
+    annotationType = None
+    for record in header.records:
+        if record.type == "GENERIC":
+            if record.key == "SnpEffVersion":
+                annotationType = ANNOTATIONS_SNPEFF
+            elif record.key == "VEP":
+                version = record.value.split()[0]
+                # TODO we need _much_ more sophisticated processing
+                # of VEP versions here. When do they become
+                # incompatible?
+                if version == "v82":
+                    annotationType = ANNOTATIONS_VEP_V82
+                elif version == "v77":
+                    annotationType = ANNOTATIONS_VEP_V77
+                else:
+                    # TODO raise a proper typed exception there with
+                    # the file name as an argument.
+                    raise ValueError(
+                        "Unsupported VEP version {} in '{}'".format(
+                            version, dataUrl))
+    if annotationType is None:
+        infoKeys = header.info.keys()
+        if 'CSQ' in infoKeys or 'ANN' in infoKeys:
+            # TODO likewise, we want a properly typed exception that
+            # we can throw back to the repo manager UI and display
+            # as an import error.
+            raise ValueError(
+                "Unsupported annotations in '{}'".format(dataUrl))
+    return annotationType
+
+
+def _readIndexReferences(indexFile, referenceNames):
+    """
+    Returns the dictionary mapping reference names to the
+    IndexedReferences read from the specified index, or an empty
+    dictionary if the index cannot be read.
+    """
+    try:
+        return htslibIndexes.readIndexReferences(indexFile, referenceNames)
+    except exceptions.FileOpenFailedException:
+        return {}
+
+
+def _getRecordRange(varFile, chrom, indexedReference=None):
+    """
+    Returns the (firstStart, lastStart) pair of the start positions of the
+    first and last records on the specified contig of the specified pysam
+    VariantFile, or None if there are no records on it. Only the records
+    from the start of the last bin in the index onwards are read to find
+    the last record, where the IndexedReference gives this.
+    """
+    firstRecord = next(varFile.fetch(chrom), None)
+    if firstRecord is None:
+        return None
+    searchStart = firstRecord.start
+    if (indexedReference is not None and
+            indexedReference.lastBinStart is not None):
+        searchStart = max(searchStart, indexedReference.lastBinStart)
+    lastStart = firstRecord.start
+    for record in varFile.fetch(chrom, searchStart):
+        lastStart = max(lastStart, record.start)
+    return firstRecord.start, lastStart
+
+
+def _summariseVariantFile(dataUrlIndexFilePair):
+    """
+    Returns a dictionary summarising the header and contigs of the
+    specified VCF/BCF file, which is all that is needed to add the file
+    to a variant set or to check its consistency with the other files.
+    This is a module level function returning only plain values so that
+    files can be summarised in a process pool; errors that cannot be
+    pickled are reported in the summary rather than raised.
+    """
+    dataUrl, indexFile = dataUrlIndexFilePair
+    varFile = pysam.VariantFile(dataUrl, index_filename=indexFile)
+    try:
+        if varFile.index is None:
+            return {"indexed": False}
+        # Unlike Tabix indices, CSI indices include all contigs defined
+        # in the BCF header.  Thus we must test each one to see if
+        # records exist or else they are likely to trigger spurious
+        # overlapping errors. The index records the number of records
+        # on each contig if it was written by a recent htslib, so we
+        # only fetch from the contigs that have records or whose number
+        # of records is not known.
+        indexedReferences = _readIndexReferences(
+            indexFile, list(varFile.header.contigs))
+        mixin = datamodel.PysamDatamodelMixin
+        recordRanges = []
+        for chrom in varFile.index:
+            chrom, _, _ = mixin.sanitizeVariantFileFetch(chrom)
+            indexedReference = indexedReferences.get(chrom)
+            if (indexedReference is not None and
+                    indexedReference.numRecords == 0):
+                continue
+            recordRange = _getRecordRange(varFile, chrom, indexedReference)
+            if recordRange is not None:
+                recordRanges.append((chrom,) + recordRange)
+        try:
+            annotationType = _getAnnotationType(varFile.header, dataUrl)
+            annotationError = None
+        except ValueError as error:
+            annotationType = None
+            annotationError = "{}".format(error)
+        return {
+            "indexed": True,
+            "recordRanges": recordRanges,
+            "sampleNames": list(varFile.header.samples),
+            "metadataFields": _getHeaderMetadataFields(varFile.header),
+            "annotationType": annotationType,
+            "annotationError": annotationError,
+        }
+    finally:
+        varFile.close()
+
+
+def _summariseVariantFiles(dataUrlIndexFilePairs, workers=1):
+    """
+    Returns the list of summaries of the specified files, in the same
+    order as the files. If workers is greater than one, the files are
+    summarised concurrently in a pool of that many processes.
+    """
+    if workers <= 1 or len(dataUrlIndexFilePairs) <= 1:
+        return [_summariseVariantFile(pair) for pair in dataUrlIndexFilePairs]
+    pool = multiprocessing.Pool(min(workers, len(dataUrlIndexFilePairs)))
+    try:
+        return pool.map(_summariseVariantFile, dataUrlIndexFilePairs, 1)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
 class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
     """
     Class representing a single variant set backed by a directory of indexed
-    VCF or BCF files.
+    VCF or BCF files. The variants for a given reference may be sharded by
+    region over several files.
     """
     def __init__(self, parentContainer, localId):
         super(HtslibVariantSet, self).__init__(parentContainer, localId)
         self._chromFileMap = {}
         self._metadata = None
+        self._callSetSamples = (None, [])
+        self._variantIdIndexPath = None
+        self._statistics = None
+        self._variantDensityPath = None
+        self._recordRanges = {}
 
     def isAnnotated(self):
         """
@@ -433,15 +764,45 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
 
     def getReferenceToDataUrlIndexMap(self):
         """
-        Returns the map of Reference names to the (dataUrl, indexFile) pairs.
+        Returns the map of Reference names to the lists of
+        (dataUrl, indexFile) pairs holding the variants for each reference.
         """
         return self._chromFileMap
 
+    def getVariantIdIndexPath(self):
+        """
+        Returns the path of the variant ID index for this variant set, or
+        None if it does not have one.
+        """
+        return self._variantIdIndexPath
+
+    def setVariantIdIndexPath(self, variantIdIndexPath):
+        """
+        Sets the path of the variant ID index for this variant set.
+        """
+        self._variantIdIndexPath = variantIdIndexPath
+
+    def getVariantDensityPath(self):
+        """
+        Returns the path of the precomputed variant density pyramid for
+        this variant set, or None if it does not have one.
+        """
+        return self._variantDensityPath
+
+    def setVariantDensityPath(self, variantDensityPath):
+        """
+        Sets the path of the variant density pyramid for this variant set.
+        """
+        self._variantDensityPath = variantDensityPath
+
     def getDataUrlIndexPairs(self):
         """
         Returns the set of (dataUrl, indexFile) pairs.
         """
-        return set(self._chromFileMap.values())
+        pairs = set()
+        for dataUrlIndexPairs in self._chromFileMap.values():
+            pairs.update(dataUrlIndexPairs)
+        return pairs
 
     def populateFromRow(self, row):
         """
@@ -450,29 +811,42 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
         self._created = row[b'created']
         self._updated = row[b'updated']
         self._chromFileMap = {}
+        self._recordRanges = {}
         # We can't load directly as we want tuples to be stored
         # rather than lists.
         for key, value in json.loads(row[b'dataUrlIndexMap']).items():
-            self._chromFileMap[key] = tuple(value)
+            # Older repositories map each reference to a single pair.
+            if len(value) > 0 and not isinstance(value[0], list):
+                value = [value]
+            self._chromFileMap[key] = [tuple(pair) for pair in value]
         self._metadata = []
         for jsonDict in json.loads(row[b'metadata']):
             metadata = protocol.fromJson(json.dumps(jsonDict),
                                          protocol.VariantSetMetadata)
             self._metadata.append(metadata)
+        # Older repositories do not have variant ID indexes.
+        if b'variantIdIndex' in row.keys():
+            self._variantIdIndexPath = row[b'variantIdIndex']
+        if b'statistics' in row.keys() and row[b'statistics'] is not None:
+            self._statistics = json.loads(row[b'statistics'])
+        if b'variantDensity' in row.keys():
+            self._variantDensityPath = row[b'variantDensity']
 
-    def populateFromFile(self, dataUrls, indexFiles):
+    def populateFromFile(self, dataUrls, indexFiles, workers=1):
         """
         Populates this variant set using the specified lists of data
         files and indexes. These must be in the same order, such that
-        the jth index file corresponds to the jth data file.
+        the jth index file corresponds to the jth data file. If workers
+        is greater than one, the files are read concurrently in a pool of
+        that many processes, and the results merged in the order of the
+        files.
         """
         assert len(dataUrls) == len(indexFiles)
-        for dataUrl, indexFile in zip(dataUrls, indexFiles):
-            varFile = pysam.VariantFile(dataUrl, index_filename=indexFile)
-            try:
-                self._populateFromVariantFile(varFile, dataUrl, indexFile)
-            finally:
-                varFile.close()
+        dataUrlIndexFilePairs = list(zip(dataUrls, indexFiles))
+        summaries = _summariseVariantFiles(dataUrlIndexFilePairs, workers)
+        for dataUrlIndexFilePair, summary in zip(
+                dataUrlIndexFilePairs, summaries):
+            self._populateFromSummary(dataUrlIndexFilePair, summary)
 
     def populateFromDirectory(self, vcfDirectory):
         """
@@ -495,157 +869,466 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
         # TODO implemenent
         return None
 
-    def checkConsistency(self):
+    def checkConsistency(self, workers=1):
         """
-        Perform consistency check on the variant set
+        Perform consistency check on the variant set. If workers is
+        greater than one, the files are read concurrently in a pool of
+        that many processes.
         """
-        for referenceName, (dataUrl, indexFile) in self._chromFileMap.items():
-            varFile = pysam.VariantFile(dataUrl, index_filename=indexFile)
-            try:
-                for chrom in varFile.index:
-                    chrom, _, _ = self.sanitizeVariantFileFetch(chrom)
-                    if not isEmptyIter(varFile.fetch(chrom)):
-                        self._checkMetadata(varFile)
-                        self._checkCallSetIds(varFile)
-            finally:
-                varFile.close()
+        dataUrlIndexFilePairs = sorted(self.getDataUrlIndexPairs())
+        summaries = _summariseVariantFiles(dataUrlIndexFilePairs, workers)
+        for (dataUrl, _), summary in zip(dataUrlIndexFilePairs, summaries):
+            if not summary["indexed"]:
+                raise exceptions.NotIndexedException(dataUrl)
+            if len(summary["recordRanges"]) > 0:
+                self._checkMetadata(summary["metadataFields"], dataUrl)
+                self._checkCallSetIds(summary["sampleNames"], dataUrl)
 
-    def _populateFromVariantFile(self, varFile, dataUrl, indexFile):
+    def _populateFromSummary(self, dataUrlIndexFilePair, summary):
         """
         Populates the instance variables of this VariantSet from the specified
-        pysam VariantFile object.
+        summary of a file.
         """
-        if varFile.index is None:
+        dataUrl, indexFile = dataUrlIndexFilePair
+        if not summary["indexed"]:
             raise exceptions.NotIndexedException(dataUrl)
-        for chrom in varFile.index:
-            # Unlike Tabix indices, CSI indices include all contigs defined
-            # in the BCF header.  Thus we must test each one to see if
-            # records exist or else they are likely to trigger spurious
-            # overlapping errors.
-            chrom, _, _ = self.sanitizeVariantFileFetch(chrom)
-            if not isEmptyIter(varFile.fetch(chrom)):
-                if chrom in self._chromFileMap:
+        for chrom, firstStart, lastStart in summary["recordRanges"]:
+            # A reference may be sharded over several files, which must
+            # hold disjoint ranges of it.
+            shards = self._chromFileMap.setdefault(chrom, [])
+            for shard in shards:
+                shardRange = self._getCachedRecordRange(shard, chrom)
+                if (shardRange is not None and
+                        firstStart <= shardRange[1] and
+                        shardRange[0] <= lastStart):
                     raise exceptions.OverlappingVcfException(dataUrl, chrom)
-            self._chromFileMap[chrom] = dataUrl, indexFile
-        self._updateMetadata(varFile)
-        self._updateCallSetIds(varFile)
-        self._updateVariantAnnotationSets(varFile, dataUrl)
-
-    def _updateVariantAnnotationSets(self, variantFile, dataUrl):
+            shards.append(dataUrlIndexFilePair)
+            self._recordRanges[(dataUrlIndexFilePair, chrom)] = (
+                firstStart, lastStart)
+        self._updateMetadata(summary["metadataFields"])
+        self._updateCallSetIds(summary["sampleNames"])
+        self._updateVariantAnnotationSets(dataUrlIndexFilePair, summary)
+
+    def _getCachedRecordRange(self, dataUrlIndexFilePair, referenceName):
+        """
+        Returns the (firstStart, lastStart) pair of the starts of the first
+        and last records on the specified reference in the specified file,
+        or None if there are no records, reading them only the first time
+        they are needed.
+        """
+        key = (dataUrlIndexFilePair, referenceName)
+        if key not in self._recordRanges:
+            self._recordRanges[key] = self._getRecordRange(
+                dataUrlIndexFilePair, referenceName)
+        return self._recordRanges[key]
+
+    def _getRecordRange(self, dataUrlIndexFilePair, referenceName):
+        """
+        Returns the (firstStart, lastStart) pair of the starts of the first
+        and last records on the specified reference in the specified file,
+        or None if there are no records.
+        """
+        varFile = self.openFile(dataUrlIndexFilePair)
+        try:
+            indexedReferences = _readIndexReferences(
+                dataUrlIndexFilePair[1], list(varFile.header.contigs))
+            return _getRecordRange(
+                varFile, referenceName, indexedReferences.get(referenceName))
+        finally:
+            varFile.close()
+
+    def _updateVariantAnnotationSets(self, dataUrlIndexFilePair, summary):
         """
         Updates the variant annotation set associated with this variant using
-        information in the specified pysam variantFile.
+        the specified summary of a file.
         """
         # TODO check the consistency of this between VCF files.
         if not self.isAnnotated():
-            annotationType = None
-            for record in variantFile.header.records:
-                if record.type == "GENERIC":
-                    if record.key == "SnpEffVersion":
-                        annotationType = ANNOTATIONS_SNPEFF
-                    elif record.key == "VEP":
-                        version = record.value.split()[0]
-                        # TODO we need _much_ more sophisticated processing
-                        # of VEP versions here. When do they become
-                        # incompatible?
-                        if version == "v82":
-                            annotationType = ANNOTATIONS_VEP_V82
-                        elif version == "v77":
-                            annotationType = ANNOTATIONS_VEP_V77
-                        else:
-                            # TODO raise a proper typed exception there with
-                            # the file name as an argument.
-                            raise ValueError(
-                                "Unsupported VEP version {} in '{}'".format(
-                                    version, dataUrl))
-            if annotationType is None:
-                infoKeys = variantFile.header.info.keys()
-                if 'CSQ' in infoKeys or 'ANN' in infoKeys:
-                    # TODO likewise, we want a properly typed exception that
-                    # we can throw back to the repo manager UI and display
-                    # as an import error.
-                    raise ValueError(
-                        "Unsupported annotations in '{}'".format(dataUrl))
+            if summary["annotationError"] is not None:
+                raise ValueError(summary["annotationError"])
+            annotationType = summary["annotationType"]
             if annotationType is not None:
                 vas = HtslibVariantAnnotationSet(self, self.getLocalId())
-                vas.populateFromFile(variantFile, annotationType)
+                variantFile = self.openFile(dataUrlIndexFilePair)
+                try:
+                    vas.populateFromFile(variantFile, annotationType)
+                finally:
+                    variantFile.close()
                 self.addVariantAnnotationSet(vas)
 
-    def _updateMetadata(self, variantFile):
+    def _updateMetadata(self, metadataFields):
         """
         Updates the metadata for his variant set based on the specified
-        variant file
+        header metadata fields of a variant file
         """
-        metadata = self._getMetadataFromVcf(variantFile)
+        metadata = self._getMetadataFromFields(metadataFields)
         if self._metadata is None:
             self._metadata = metadata
 
-    def _checkMetadata(self, variantFile):
+    def _checkMetadata(self, metadataFields, dataUrl):
         """
         Checks that metadata is consistent
         """
-        metadata = self._getMetadataFromVcf(variantFile)
+        metadata = self._getMetadataFromFields(metadataFields)
         if self._metadata is not None and self._metadata != metadata:
-            raise exceptions.InconsistentMetaDataException(
-                variantFile.filename)
+            raise exceptions.InconsistentMetaDataException(dataUrl)
 
-    def _checkCallSetIds(self, variantFile):
+    def _checkCallSetIds(self, sampleNames, dataUrl):
         """
         Checks callSetIds for consistency
         """
         if len(self._callSetIdMap) > 0:
             callSetIds = set([
-                self.getCallSetId(sample)
-                for sample in variantFile.header.samples])
+                self.getCallSetId(sample) for sample in sampleNames])
             if callSetIds != set(self._callSetIdMap.keys()):
-                raise exceptions.InconsistentCallSetIdException(
-                    variantFile.filename)
+                raise exceptions.InconsistentCallSetIdException(dataUrl)
 
     def getNumVariants(self):
         """
-        Returns the total number of variants in this VariantSet.
+        Returns the total number of variants in this VariantSet, or 0 if
+        its statistics have not been computed.
+        """
+        if self._statistics is None:
+            return 0
+        return sum(
+            statistics["numVariants"]
+            for statistics in self._statistics.values())
+
+    def getStatistics(self):
+        """
+        Returns the dictionary mapping the name of each reference in this
+        variant set to the statistics of its variants, or None if they
+        have not been computed. The statistics of a reference are a
+        dictionary holding the numVariants, the minimum start and maximum
+        end positions of the variants, and the variantTypeCounts mapping
+        each variant type to the number of variants of that type. The
+        positions and type counts are None if they are not known.
+        """
+        return self._statistics
+
+    def computeStatistics(self, scan=False):
+        """
+        Computes the statistics of the variants in this variant set. The
+        number of variants in each file is read from the metadata in its
+        index where possible. The files whose indexes do not record it,
+        or all of the files if scan is True, are read in full, which also
+        gives the positions and types of the variants.
+        """
+        indexRecordCounts = {}
+        statistics = {}
+        for referenceName, dataUrlIndexPairs in self._chromFileMap.items():
+            shardStatistics = []
+            for dataUrlIndexPair in dataUrlIndexPairs:
+                numVariants = None
+                if not scan:
+                    if dataUrlIndexPair not in indexRecordCounts:
+                        indexRecordCounts[dataUrlIndexPair] = \
+                            self._getIndexRecordCounts(dataUrlIndexPair)
+                    numVariants = indexRecordCounts[dataUrlIndexPair].get(
+                        referenceName)
+                if numVariants is None:
+                    shardStatistics.append(self._scanReferenceStatistics(
+                        dataUrlIndexPair, referenceName))
+                else:
+                    shardStatistics.append({
+                        "numVariants": numVariants, "start": None,
+                        "end": None, "variantTypeCounts": None})
+            statistics[referenceName] = _mergeReferenceStatistics(
+                shardStatistics)
+        self._statistics = statistics
+
+    def _getIndexRecordCounts(self, dataUrlIndexFilePair):
+        """
+        Returns the dictionary mapping reference names to the number of
+        records recorded in the index of the specified file, or an empty
+        dictionary if the index cannot be read.
+        """
+        varFile = self.openFile(dataUrlIndexFilePair)
+        try:
+            referenceNames = list(varFile.header.contigs)
+        finally:
+            varFile.close()
+        indexedReferences = _readIndexReferences(
+            dataUrlIndexFilePair[1], referenceNames)
+        return dict(
+            (name, indexedReference.numRecords)
+            for name, indexedReference in indexedReferences.items())
+
+    def _scanReferenceStatistics(self, dataUrlIndexFilePair, referenceName):
+        """
+        Returns the statistics of the records on the specified reference
+        in the specified file, reading all of them. No FORMAT data is
+        decoded.
+        """
+        numVariants = 0
+        start = None
+        end = None
+        variantTypeCounts = collections.Counter()
+        varFile = self.openFile(dataUrlIndexFilePair)
+        try:
+            varFile.subset_samples([])
+            for record in varFile.fetch(referenceName):
+                numVariants += 1
+                if start is None:
+                    start = record.start
+                if end is None or record.stop > end:
+                    end = record.stop
+                variantTypeCounts[getVariantType(
+                    record.ref, record.alts)] += 1
+        finally:
+            varFile.close()
+        return {
+            "numVariants": numVariants, "start": start, "end": end,
+            "variantTypeCounts": dict(variantTypeCounts)}
+
+    def buildVariantDensity(self, variantDensityPath):
+        """
+        Writes the pyramid of the numbers of variants starting in each bin
+        of each reference, for each of the VARIANT_DENSITY_BIN_SIZES, to a
+        SQLite database at the specified path, and sets it as the variant
+        density pyramid of this variant set.
+        """
+        if os.path.exists(variantDensityPath):
+            os.unlink(variantDensityPath)
+        db = sqlite3.connect(variantDensityPath)
+        try:
+            db.execute("""
+                CREATE TABLE VariantDensity (
+                    referenceName TEXT NOT NULL,
+                    binSize INTEGER NOT NULL,
+                    counts BLOB NOT NULL,
+                    PRIMARY KEY (referenceName, binSize)
+                );
+            """)
+            for referenceName in sorted(self._chromFileMap.keys()):
+                binSize = VARIANT_DENSITY_BIN_SIZES[0]
+                counts = self._countVariantsInBins(referenceName, binSize)
+                for levelBinSize in VARIANT_DENSITY_BIN_SIZES:
+                    counts = _sumBins(counts, levelBinSize // binSize)
+                    binSize = levelBinSize
+                    db.execute(
+                        "INSERT INTO VariantDensity VALUES (?, ?, ?);",
+                        (referenceName, binSize,
+                         sqlite3.Binary(_packBinCounts(counts))))
+            db.commit()
+        finally:
+            db.close()
+        self._variantDensityPath = variantDensityPath
+
+    def _countVariantsInBins(self, referenceName, binSize):
+        """
+        Returns the list of the numbers of variants starting in each bin of
+        binSize bases on the specified reference, up to the last variant.
+        No FORMAT data is decoded.
+        """
+        counts = []
+        records = self.getPysamVariants(
+            referenceName, None, None, self._getSampleSubset([]))
+        for record in records:
+            index = record.start // binSize
+            if index >= len(counts):
+                counts.extend([0] * (index + 1 - len(counts)))
+            counts[index] += 1
+        return counts
+
+    def getVariantDensity(self, referenceName, start, end, binSize):
+        """
+        Returns the list of the numbers of variants starting in each of
+        the bins of binSize bases from start that overlap [start, end).
+        The counts are read from the level of the precomputed pyramid with
+        the largest bins that the requested bins are made up of, if there
+        is one. Otherwise, the records in the region are counted without
+        converting them or decoding their FORMAT data.
+        """
+        numBins = _getNumBins(start, end, binSize)
+        if referenceName not in self._chromFileMap:
+            return [0] * numBins
+        if self._variantDensityPath is not None:
+            for levelBinSize in reversed(VARIANT_DENSITY_BIN_SIZES):
+                if binSize % levelBinSize == 0 and start % levelBinSize == 0:
+                    return self._readVariantDensity(
+                        referenceName, start, numBins, binSize, levelBinSize)
+        counts = [0] * numBins
+        end = start + numBins * binSize
+        records = self.getPysamVariants(
+            referenceName, start, end, self._getSampleSubset([]))
+        for record in records:
+            if start <= record.start < end:
+                counts[(record.start - start) // binSize] += 1
+        return counts
+
+    def _readVariantDensity(
+            self, referenceName, start, numBins, binSize, levelBinSize):
+        """
+        Returns the variant counts for the specified bins, summed from the
+        specified level of the precomputed pyramid. Only the requested
+        part of the level is read.
+        """
+        factor = binSize // levelBinSize
+        numLevelBins = numBins * factor
+        itemSize = array.array(b'I').itemsize
+        db = sqlite3.connect(self._variantDensityPath)
+        try:
+            row = db.execute("""
+                SELECT substr(counts, ?, ?) FROM VariantDensity
+                WHERE referenceName = ? AND binSize = ?;
+            """, (
+                (start // levelBinSize) * itemSize + 1,
+                numLevelBins * itemSize, referenceName,
+                levelBinSize)).fetchone()
+        finally:
+            db.close()
+        counts = []
+        if row is not None:
+            counts = _unpackBinCounts(bytes(row[0]))
+        # The pyramid ends at the last variant on the reference.
+        counts.extend([0] * (numLevelBins - len(counts)))
+        return _sumBins(counts, factor)
+
+    def toProtocolElement(self):
         """
-        # TODO How do we get the number of records in a VariantFile?
-        return 0
+        Converts this VariantSet into its GA4GH protocol equivalent. The
+        number of variants is included in the metadata if it is known.
+        """
+        protocolElement = super(HtslibVariantSet, self).toProtocolElement()
+        if self._statistics is not None:
+            metadata = protocol.VariantSetMetadata()
+            metadata.key = "numVariants"
+            metadata.value = str(self.getNumVariants())
+            metadata.type = "Integer"
+            metadata.number = "1"
+            metadata.description = "The number of variants in the set"
+            metadata.id = self.getMetadataId(metadata)
+            protocolElement.metadata.extend([metadata])
+        return protocolElement
 
-    def _updateCallSetIds(self, variantFile):
+    def _updateCallSetIds(self, sampleNames):
         """
-        Updates the call set IDs based on the specified variant file.
+        Updates the call set IDs based on the specified sample names of a
+        variant file.
         """
         if len(self._callSetIdMap) == 0:
-            for sample in variantFile.header.samples:
+            for sample in sampleNames:
                 self.addCallSetFromName(sample)
 
     def openFile(self, dataUrlIndexFilePair):
         dataUrl, indexFile = dataUrlIndexFilePair
         return pysam.VariantFile(dataUrl, index_filename=indexFile)
 
-    def _convertGaCall(self, callSet, pysamCall):
-        phaseset = None
-        if pysamCall.phased:
-            phaseset = str(pysamCall.phased)
-        genotypeLikelihood = []
-        info = {}
-        for key, value in pysamCall.iteritems():
-            if key == 'GL' and value is not None:
-                genotypeLikelihood = list(value)
-            elif key != 'GT':
-                info[key] = _encodeValue(value)
-        call = protocol.Call()
-        call.call_set_name = callSet.getSampleName()
-        call.call_set_id = callSet.getId()
-        call.genotype.extend(list(pysamCall.allele_indices))
-        call.phaseset = pb.string(phaseset)
-        call.genotype_likelihood.extend(genotypeLikelihood)
-        for key in info:
-            call.info[key].values.extend(info[key])
-        return call
-
-    def convertVariant(self, record, callSetIds):
+    def _openSampleSubsetFile(self, subsetKey):
+        """
+        Opens the file in the specified (dataUrlIndexFilePair, sampleNames)
+        pair so that htslib only decodes the FORMAT data of those samples.
+        """
+        dataUrlIndexFilePair, sampleNames = subsetKey
+        varFile = self.openFile(dataUrlIndexFilePair)
+        varFile.subset_samples(sampleNames)
+        return varFile
+
+    def _getSampleSubset(self, callSetIds):
+        """
+        Returns the sorted tuple of the names of the samples of the
+        specified call sets, or None if they are all of the samples in
+        this variant set.
+        """
+        sampleNames = set(
+            str(self.getCallSet(callSetId).getSampleName())
+            for callSetId in callSetIds)
+        if len(sampleNames) == len(self._callSetIds):
+            return None
+        return tuple(sorted(sampleNames))
+
+    def _fetch(
+            self, dataUrlIndexFilePair, referenceName, startPosition,
+            endPosition, reopen, sampleNames=None):
+        """
+        Returns an iterator over the records in the specified region of
+        the specified file. If sampleNames is not None, the records only
+        contain those samples; the file handles subset to each set of
+        samples are cached alongside the full ones. A cursor over a
+        subset that needs its own file handle is given a newly opened
+        file rather than a reopened copy of the cached one, as copying a
+        handle does not preserve the sample subset.
+        """
+        if sampleNames is None:
+            varFile = self.getFileHandle(dataUrlIndexFilePair)
+        else:
+            subsetKey = (dataUrlIndexFilePair, sampleNames)
+            if reopen:
+                varFile = self._openSampleSubsetFile(subsetKey)
+                reopen = False
+            else:
+                varFile = datamodel.getFileHandleCache().getFileHandle(
+                    subsetKey, self._openSampleSubsetFile)
+        return varFile.fetch(
+            referenceName, startPosition, endPosition, reopen=reopen)
+
+    def _getCallSetSamples(self, callSetIds):
+        """
+        Returns the list of (sample name, call set ID, call set name)
+        tuples for the specified call set IDs. Every record in a search is
+        converted with the same call sets, so the list for the most
+        recently requested IDs is kept.
+        """
+        if len(callSetIds) == 0:
+            return []
+        cachedCallSetIds, callSetSamples = self._callSetSamples
+        if (callSetIds is not cachedCallSetIds or
+                len(callSetIds) != len(callSetSamples)):
+            callSetSamples = []
+            for callSetId in callSetIds:
+                callSet = self.getCallSet(callSetId)
+                sampleName = callSet.getSampleName()
+                callSetSamples.append((str(sampleName), callSetId, sampleName))
+            # Replace both at once, as other threads may be converting
+            self._callSetSamples = (callSetIds, callSetSamples)
+        return callSetSamples
+
+    def _convertGaCalls(self, variant, record, callSetIds, fieldMask=None):
+        """
+        Adds the calls for the specified call sets in the specified pysam
+        record to the specified GA Variant. The FORMAT fields to convert
+        are chosen once for the record rather than for each sample, and
+        the calls are built in place in the variant.
+        """
+        includeGenotype = fieldMask is None or fieldMask.includes("genotype")
+        includeLikelihood = (
+            fieldMask is None or fieldMask.includes("genotype_likelihood"))
+        includeInfo = fieldMask is None or fieldMask.includes("info")
+        formatKeys = []
+        for key in record.format.keys():
+            if key == 'GT':
+                continue
+            if includeInfo or (key == 'GL' and includeLikelihood):
+                formatKeys.append(key)
+        samples = record.samples
+        calls = variant.calls
+        for sampleName, callSetId, callSetName in self._getCallSetSamples(
+                callSetIds):
+            pysamCall = samples[sampleName]
+            call = calls.add()
+            call.call_set_name = callSetName
+            call.call_set_id = callSetId
+            if includeGenotype:
+                call.genotype.extend(pysamCall.allele_indices)
+            if pysamCall.phased:
+                call.phaseset = str(pysamCall.phased)
+            for key in formatKeys:
+                value = pysamCall[key]
+                if key == 'GL' and value is not None:
+                    if includeLikelihood:
+                        call.genotype_likelihood.extend(value)
+                elif includeInfo:
+                    _addEncodedValues(call.info[key].values, value)
+
+    def convertVariant(self, record, callSetIds, fieldMask=None):
         """
         Converts the specified pysam variant record into a GA4GH Variant
         object. Only calls for the specified list of callSetIds will
-        be included.
+        be included. If a protocol.FieldMask is specified, the INFO and
+        call fields that it does not include are not converted; the
+        remaining fields are cheap to fill in and are needed to compute
+        the variant's ID, so they are always present.
         """
         variant = self._createGaVariant()
         variant.reference_name = record.contig
@@ -658,70 +1341,293 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
             variant.alternate_bases.extend(list(record.alts))
         # record.filter and record.qual are also available, when supported
         # by GAVariant.
-        for key, value in record.info.iteritems():
-            if value is not None:
-                if isinstance(value, str):
-                    value = value.split(',')
-                variant.info[key].values.extend(_encodeValue(value))
-        for callSetId in callSetIds:
-            callSet = self.getCallSet(callSetId)
-            pysamCall = record.samples[str(callSet.getSampleName())]
-            variant.calls.add().CopyFrom(
-                self._convertGaCall(callSet, pysamCall))
+        if fieldMask is None or fieldMask.includes("info"):
+            for key, value in record.info.iteritems():
+                if value is not None:
+                    if isinstance(value, str):
+                        value = value.split(',')
+                    variant.info[key].values.extend(_encodeValue(value))
+        if fieldMask is None or fieldMask.includes("calls"):
+            callMask = None
+            if fieldMask is not None:
+                callMask = fieldMask.getSubMask("calls")
+            self._convertGaCalls(variant, record, callSetIds, callMask)
         variant.id = self.getVariantId(variant)
         return variant
 
+    def hashRecord(self, record):
+        """
+        Returns the MD5 hash that hashVariant gives for the GA Variant
+        converted from the specified pysam record, computed from the
+        record's alleles without converting it.
+        """
+        alts = tuple()
+        if record.alts is not None:
+            alts = tuple(unicode(alt) for alt in record.alts)
+        hash_str = record.ref + str(alts)
+        return hashlib.md5(hash_str).hexdigest()
+
+    def buildVariantIdIndex(self, variantIdIndexPath):
+        """
+        Writes an index from the (reference name, start, MD5 hash) of each
+        variant in this variant set to the data file and BGZF virtual
+        offset of its record to a SQLite database at the specified path,
+        and sets it as the variant ID index of this variant set.
+        """
+        if os.path.exists(variantIdIndexPath):
+            os.unlink(variantIdIndexPath)
+        db = sqlite3.connect(variantIdIndexPath)
+        try:
+            db.execute("""
+                CREATE TABLE DataFile (
+                    id INTEGER NOT NULL PRIMARY KEY,
+                    dataUrl TEXT NOT NULL,
+                    indexFile TEXT NOT NULL
+                );
+            """)
+            db.execute("""
+                CREATE TABLE Variant (
+                    referenceName TEXT NOT NULL,
+                    start INTEGER NOT NULL,
+                    md5 TEXT NOT NULL,
+                    dataFileId INTEGER NOT NULL,
+                    virtualOffset INTEGER NOT NULL
+                );
+            """)
+            for dataFileId, dataUrlIndexPair in enumerate(
+                    sorted(self.getDataUrlIndexPairs())):
+                db.execute(
+                    "INSERT INTO DataFile VALUES (?, ?, ?);",
+                    (dataFileId,) + tuple(dataUrlIndexPair))
+                db.executemany(
+                    "INSERT INTO Variant VALUES (?, ?, ?, ?, ?);",
+                    self._getVariantIdIndexRows(
+                        dataUrlIndexPair, dataFileId))
+            db.execute("""
+                CREATE INDEX VariantLookup
+                ON Variant (referenceName, start, md5);
+            """)
+            db.commit()
+        finally:
+            db.close()
+        self._variantIdIndexPath = variantIdIndexPath
+
+    def _getVariantIdIndexRows(self, dataUrlIndexFilePair, dataFileId):
+        """
+        Returns an iterator over the variant ID index rows for the records
+        in the specified file, reading it sequentially. Only records on
+        the references that this variant set reads from the file are
+        included.
+        """
+        varFile = self.openFile(dataUrlIndexFilePair)
+        try:
+            while True:
+                virtualOffset = varFile.tell()
+                record = next(varFile, None)
+                if record is None:
+                    break
+                shards = self._chromFileMap.get(record.contig, [])
+                if tuple(dataUrlIndexFilePair) in shards:
+                    yield (
+                        record.contig, record.start, self.hashRecord(record),
+                        dataFileId, virtualOffset)
+        finally:
+            varFile.close()
+
+    def _getIndexedRecords(self, referenceName, start, md5):
+        """
+        Returns the list of the pysam records that the variant ID index
+        maps the specified variant to, in the order of the shards of the
+        reference. Each record is read from a newly opened file, as
+        seeking a cached file handle would move any cursor open on it.
+        """
+        db = sqlite3.connect(self._variantIdIndexPath)
+        try:
+            rows = db.execute("""
+                SELECT dataUrl, indexFile, virtualOffset
+                FROM Variant JOIN DataFile ON Variant.dataFileId = DataFile.id
+                WHERE referenceName = ? AND start = ? AND md5 = ?
+                ORDER BY virtualOffset;
+            """, (referenceName, start, md5)).fetchall()
+        finally:
+            db.close()
+        shards = self._chromFileMap[referenceName]
+        rows = [row for row in rows if (row[0], row[1]) in shards]
+        rows.sort(key=lambda row: shards.index((row[0], row[1])))
+        records = []
+        for dataUrl, indexFile, virtualOffset in rows:
+            varFile = self.openFile((dataUrl, indexFile))
+            try:
+                varFile.seek(virtualOffset)
+                records.append(next(varFile))
+            finally:
+                varFile.close()
+        return records
+
     def getVariant(self, compoundId):
-        if compoundId.reference_name in self._chromFileMap:
-            varFileName = self._chromFileMap[compoundId.reference_name]
-        else:
+        """
+        Returns the GA Variant with the specified compound ID. The records
+        at the variant's position are matched on the hash of their alleles,
+        and only the matching record is converted. If this variant set has
+        a variant ID index, the record is read directly from its offset;
+        variants that the index does not map to a matching record are
+        looked for by scanning the records at their position.
+        """
+        if compoundId.reference_name not in self._chromFileMap:
             raise exceptions.ObjectNotFoundException(compoundId)
         start = int(compoundId.start)
-        referenceName, startPosition, endPosition = \
-            self.sanitizeVariantFileFetch(
-                compoundId.reference_name, start, start + 1)
-        cursor = self.getFileHandle(varFileName).fetch(
-            referenceName, startPosition, endPosition)
+        if self._variantIdIndexPath is not None:
+            records = self._getIndexedRecords(
+                compoundId.reference_name, start, compoundId.md5)
+            for record in records:
+                # An index that no longer matches the data files is
+                # ignored, and the records are read as if it did not exist.
+                if (record.contig == compoundId.reference_name and
+                        record.start == start and
+                        self.hashRecord(record) == compoundId.md5):
+                    return self.convertVariant(record, self._callSetIds)
+        cursor = self.getPysamVariants(
+            compoundId.reference_name, start, start + 1)
         for record in cursor:
-            variant = self.convertVariant(record, self._callSetIds)
             if (record.start == start and
-                    compoundId.md5 == self.hashVariant(variant)):
-                return variant
+                    compoundId.md5 == self.hashRecord(record)):
+                return self.convertVariant(record, self._callSetIds)
             elif record.start > start:
                 raise exceptions.ObjectNotFoundException()
         raise exceptions.ObjectNotFoundException(compoundId)
 
-    def getPysamVariants(self, referenceName, startPosition, endPosition):
+    def getVariantsByCompoundIds(self, compoundIds):
+        """
+        Returns a list of the GA Variants with the specified compound IDs
+        in this variant set, in the same order. The list contains None for
+        each variant that cannot be found. Variants on the same reference
+        that are close together are read with a single fetch, and only the
+        records at the requested positions are converted.
+        """
+        variants = [None] * len(compoundIds)
+        referencePositions = collections.defaultdict(list)
+        for index, compoundId in enumerate(compoundIds):
+            if compoundId.reference_name not in self._chromFileMap:
+                continue
+            try:
+                start = int(compoundId.start)
+            except ValueError:
+                continue
+            referencePositions[compoundId.reference_name].append(
+                (start, index))
+        for referenceName, positions in referencePositions.items():
+            positions.sort()
+            cluster = collections.defaultdict(list)
+            clusterStart = positions[0][0]
+            for i, (start, index) in enumerate(positions):
+                cluster[start].append(index)
+                isLast = i == len(positions) - 1
+                if isLast or positions[i + 1][0] - start > BATCH_FETCH_MAX_GAP:
+                    self._fetchVariantCluster(
+                        referenceName, clusterStart, start, cluster,
+                        compoundIds, variants)
+                    cluster = collections.defaultdict(list)
+                    if not isLast:
+                        clusterStart = positions[i + 1][0]
+        return variants
+
+    def _fetchVariantCluster(
+            self, referenceName, clusterStart, clusterEnd, cluster,
+            compoundIds, variants):
+        """
+        Reads the variants starting between clusterStart and clusterEnd
+        (inclusive) on the specified reference with a single fetch, and
+        fills in the variants list entries whose compound IDs match. Only
+        the records that match a requested ID are converted. The
+        cluster maps each requested start position to the indexes in the
+        compoundIds list of the IDs starting there.
+        """
+        cursor = self.getPysamVariants(
+            referenceName, clusterStart, clusterEnd + 1)
+        for record in cursor:
+            if record.start > clusterEnd:
+                break
+            if record.start not in cluster:
+                continue
+            md5 = self.hashRecord(record)
+            indexes = [
+                index for index in cluster[record.start]
+                if compoundIds[index].md5 == md5]
+            if len(indexes) > 0:
+                variant = self.convertVariant(record, self._callSetIds)
+                for index in indexes:
+                    variants[index] = variant
+
+    def getPysamVariants(
+            self, referenceName, startPosition, endPosition,
+            sampleNames=None):
         """
         Returns an iterator over the pysam VCF records corresponding to the
-        specified query.
+        specified query. If sampleNames is not None, only the FORMAT data
+        of the samples with those names is decoded.
         """
         if referenceName in self._chromFileMap:
-            varFileName = self._chromFileMap[referenceName]
+            dataUrlIndexPairs = self._chromFileMap[referenceName]
             referenceName, startPosition, endPosition = \
                 self.sanitizeVariantFileFetch(
                     referenceName, startPosition, endPosition)
-            cursor = self.getFileHandle(varFileName).fetch(
-                referenceName, startPosition, endPosition)
-            for record in cursor:
-                yield record
+            # When merging several shards, each cursor must have its own
+            # file handle, as the cached handles may be evicted while we
+            # are still iterating over them.
+            reopen = (
+                datamodel.getFileHandleCache().getDetachedIterators() or
+                len(dataUrlIndexPairs) > 1)
+            cursors = [
+                self._fetch(
+                    dataUrlIndexPair, referenceName, startPosition,
+                    endPosition, reopen, sampleNames)
+                for dataUrlIndexPair in dataUrlIndexPairs]
+            if len(cursors) == 1:
+                for record in cursors[0]:
+                    yield record
+            else:
+                decoratedCursors = [
+                    _decorateRecords(cursor, shardIndex)
+                    for shardIndex, cursor in enumerate(cursors)]
+                for _, _, _, record in heapq.merge(*decoratedCursors):
+                    yield record
 
     def getVariants(self, referenceName, startPosition, endPosition,
-                    callSetIds=[]):
+                    callSetIds=[], fieldMask=None):
         """
         Returns an iterator over the specified variants. The parameters
         correspond to the attributes of a GASearchVariantsRequest object.
+        Only the fields included by the specified field mask are converted,
+        and only the FORMAT data of the samples whose calls are converted
+        is decoded.
         """
         if callSetIds is None:
             callSetIds = self._callSetIds
         else:
             for callSetId in callSetIds:
-                if callSetId not in self._callSetIds:
+                if callSetId not in self._callSetIdMap:
                     raise exceptions.CallSetNotInVariantSetException(
                         callSetId, self.getId())
-        for record in self.getPysamVariants(
-                referenceName, startPosition, endPosition):
-            yield self.convertVariant(record, callSetIds)
+        if fieldMask is None or fieldMask.includes("calls"):
+            sampleNames = self._getSampleSubset(callSetIds)
+        else:
+            sampleNames = self._getSampleSubset([])
+        variants = self._convertVariants(
+            self.getPysamVariants(
+                referenceName, startPosition, endPosition, sampleNames),
+            callSetIds, fieldMask)
+        for variant in variants:
+            yield variant
+
+    def _convertVariants(self, records, callSetIds, fieldMask):
+        """
+        Returns an iterator over the converted variants for the specified
+        pysam records, timing the fetch and conversion of each.
+        """
+        for record in datamodel.timeIterator(records, "fetch"):
+            with datamodel.timePhase("convert"):
+                variant = self.convertVariant(record, callSetIds, fieldMask)
+            yield variant
 
     def getMetadataId(self, metadata):
         """
@@ -730,15 +1636,10 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
         return str(datamodel.VariantSetMetadataCompoundId(
             self.getCompoundId(), 'metadata:' + metadata.key))
 
-    def _getMetadataFromVcf(self, varFile):
-        # All the metadata is available via each varFile.header, including:
-        #    records: header records
-        #    version: VCF version
-        #    samples -- not immediately needed
-        #    contigs -- not immediately needed
-        #    filters -- not immediately needed
-        #    info
-        #    formats
+    def _getMetadataFromFields(self, metadataFields):
+        # The header metadata fields are extracted from each varFile.header
+        # by _getHeaderMetadataFields, so that files can be read in worker
+        # processes; the IDs are assigned here.
 
         def buildMetadata(
                 key, type_="String", number="1", value="", id_="",
@@ -754,24 +1655,12 @@ class HtslibVariantSet(datamodel.PysamDatamodelMixin, AbstractVariantSet):
             metadata.id = id_
             return metadata
 
-        ret = []
-        header = varFile.header
-        ret.append(buildMetadata(key="version", value=header.version))
-        formats = header.formats.items()
-        infos = header.info.items()
-        # TODO: currently ALT field is not implemented through pysam
-        # NOTE: contigs field is different between vcf files,
-        # so it's not included in metadata
-        # NOTE: filters in not included in metadata unless needed
-        for prefix, content in [("FORMAT", formats), ("INFO", infos)]:
-            for contentKey, value in content:
-                description = value.description.strip('"')
-                key = "{0}.{1}".format(prefix, value.name)
-                if key != "FORMAT.GT":
-                    ret.append(buildMetadata(
-                        key=key, type_=value.type,
-                        number="{}".format(value.number),
-                        description=description))
+        version, fields = metadataFields
+        ret = [buildMetadata(key="version", value=version)]
+        for key, type_, number, description in fields:
+            ret.append(buildMetadata(
+                key=key, type_=type_, number=number,
+                description=description))
         return ret
 
 #############################################
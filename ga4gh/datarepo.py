@@ -7,6 +7,7 @@ from __future__ import unicode_literals
 
 import json
 import os
+import shutil
 import sqlite3
 
 import ga4gh.datamodel as datamodel
@@ -38,6 +39,13 @@ class AbstractDataRepository(object):
         self._ontologyIdMap = {}
         self._ontologyIds = []
 
+    def getCreationTimeStamp(self):
+        """
+        Returns the time at which this repository was created, or None
+        if it is not backed by persistent storage.
+        """
+        return None
+
     def addDataset(self, dataset):
         """
         Adds the specified dataset to this data repository.
@@ -294,9 +302,16 @@ class SqlDataRepository(AbstractDataRepository):
         def __str__(self):
             return "{}.{}".format(self.major, self.minor)
 
-    version = SchemaVersion("2.0")
+    version = SchemaVersion("2.1")
     systemKeySchemaVersion = "schemaVersion"
     systemKeyCreationTimeStamp = "creationTimeStamp"
+    # Columns added to the tables since the schema's major version was
+    # last changed, which are added to older repos when they are updated.
+    addedColumns = [
+        ("VariantSet", "variantIdIndex", "TEXT"),
+        ("VariantSet", "statistics", "TEXT"),
+        ("VariantSet", "variantDensity", "TEXT"),
+    ]
 
     def __init__(self, fileName):
         super(SqlDataRepository, self).__init__()
@@ -312,6 +327,12 @@ class SqlDataRepository(AbstractDataRepository):
         # Connection to the DB.
         self._dbConnection = None
 
+    def getCreationTimeStamp(self):
+        """
+        Returns the creation timestamp read from the System table.
+        """
+        return self._creationTimeStamp
+
     def _checkWriteMode(self):
         if self._openMode != MODE_WRITE:
             raise ValueError("Repo must be opened in write mode")
@@ -340,6 +361,8 @@ class SqlDataRepository(AbstractDataRepository):
         cursor = self._dbConnection.cursor()
         cursor.execute("PRAGMA foreign_keys = ON;")
         self._dbConnection.commit()
+        if mode == MODE_WRITE:
+            self._addMissingColumns(cursor)
         if mode == MODE_READ:
             # This is part of the transitional behaviour where
             # we load the whole DB into memory to get access to
@@ -354,6 +377,26 @@ class SqlDataRepository(AbstractDataRepository):
         self._checkWriteMode()
         self._dbConnection.commit()
 
+    def _addMissingColumns(self, cursor):
+        """
+        Adds the columns that were added to the schema after this repo
+        was created to its existing tables.
+        """
+        for table, column, type_ in self.addedColumns:
+            cursor.execute("PRAGMA table_info({});".format(table))
+            columns = [row[1] for row in cursor.fetchall()]
+            if len(columns) > 0 and column not in columns:
+                cursor.execute("ALTER TABLE {} ADD COLUMN {} {};".format(
+                    table, column, type_))
+        self._dbConnection.commit()
+
+    def getSidecarDirectory(self):
+        """
+        Returns the directory next to the repo DB in which the indexes
+        built for the data in this repo are stored.
+        """
+        return self._dbFilename + ".sidecar"
+
     def close(self):
         """
         Closes this repo.
@@ -364,9 +407,11 @@ class SqlDataRepository(AbstractDataRepository):
         self._dbConnection.close()
         self._dbConnection = None
 
-    def verify(self):
+    def verify(self, workers=1):
         """
-        Verifies that the data in the repository is consistent.
+        Verifies that the data in the repository is consistent. The files
+        of each variant set are checked concurrently in a pool of the
+        specified number of worker processes.
         """
         # TODO this should emit to a log that we can configure so we can
         # have verbosity levels. We should provide a way to configure
@@ -422,17 +467,19 @@ class SqlDataRepository(AbstractDataRepository):
                         readGroup.getLocalId())
             for variantSet in dataset.getVariantSets():
                 print("\tVerifying VariantSet", variantSet.getLocalId())
+                variantSet.checkConsistency(workers)
                 max_variants = 10
                 max_annotations = 10
                 refMap = variantSet.getReferenceToDataUrlIndexMap()
-                for referenceName, (dataUrl, indexFile) in refMap.items():
+                for referenceName, dataUrlIndexPairs in refMap.items():
                     variants = variantSet.getVariants(referenceName, 0, 2**31)
                     for i, variant in enumerate(variants):
                         if i == max_variants:
                             break
+                    dataUrls = [dataUrl for dataUrl, _ in dataUrlIndexPairs]
                     print(
                         "\t\tRead", i, "variants from reference",
-                        referenceName, "@", dataUrl)
+                        referenceName, "@", ", ".join(dataUrls))
                 for annotationSet in variantSet.getVariantAnnotationSets():
                     print(
                         "\t\tVerifying VariantAnnotationSet",
@@ -942,6 +989,9 @@ class SqlDataRepository(AbstractDataRepository):
                 updated TEXT,
                 metadata TEXT,
                 dataUrlIndexMap TEXT NOT NULL,
+                variantIdIndex TEXT,
+                statistics TEXT,
+                variantDensity TEXT,
                 UNIQUE (datasetID, name),
                 FOREIGN KEY(datasetId) REFERENCES Dataset(id)
                     ON DELETE CASCADE,
@@ -957,8 +1007,10 @@ class SqlDataRepository(AbstractDataRepository):
         sql = """
             INSERT INTO VariantSet (
                 id, datasetId, referenceSetId, name, created, updated,
-                metadata, dataUrlIndexMap)
-            VALUES (?, ?, ?, ?, datetime('now'), datetime('now'), ?, ?);
+                metadata, dataUrlIndexMap, variantIdIndex, statistics,
+                variantDensity)
+            VALUES (
+                ?, ?, ?, ?, datetime('now'), datetime('now'), ?, ?, ?, ?, ?);
         """
         cursor = self._dbConnection.cursor()
         # We cheat a little here with the VariantSetMetadata, and encode these
@@ -968,11 +1020,15 @@ class SqlDataRepository(AbstractDataRepository):
             [protocol.toJsonDict(metadata) for metadata in
              variantSet.getMetadata()])
         urlMapJson = json.dumps(variantSet.getReferenceToDataUrlIndexMap())
+        statisticsJson = None
+        if variantSet.getStatistics() is not None:
+            statisticsJson = json.dumps(variantSet.getStatistics())
         try:
             cursor.execute(sql, (
                 variantSet.getId(), variantSet.getParentContainer().getId(),
                 variantSet.getReferenceSet().getId(), variantSet.getLocalId(),
-                metadataJson, urlMapJson))
+                metadataJson, urlMapJson, variantSet.getVariantIdIndexPath(),
+                statisticsJson, variantSet.getVariantDensityPath()))
         except sqlite3.IntegrityError:
             raise exceptions.DuplicateNameException(
                 variantSet.getLocalId(),
@@ -1084,6 +1140,8 @@ class SqlDataRepository(AbstractDataRepository):
         This will delete ALL data stored within the repository!!
         """
         os.unlink(self._dbFilename)
+        if os.path.exists(self.getSidecarDirectory()):
+            shutil.rmtree(self.getSidecarDirectory())
 
     def load(self):
         """
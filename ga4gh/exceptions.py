@@ -145,6 +145,40 @@ class InvalidJsonException(BadRequestException):
         self.message = "Cannot parse JSON: '{}'".format(jsonString)
 
 
+class InvalidProtobufException(BadRequestException):
+    def __init__(self, messageName):
+        self.message = "Cannot parse protobuf message: '{}'".format(
+            messageName)
+
+
+class BadBatchGetRequestException(BadRequestException):
+    def __init__(self, reason):
+        self.message = "Invalid batch get request: {}".format(reason)
+
+
+class BadVariantDensityRequestException(BadRequestException):
+    def __init__(self, reason):
+        self.message = "Invalid variant density request: {}".format(reason)
+
+
+class BadFieldMaskException(BadRequestException):
+    def __init__(self, path, messageName):
+        self.message = "Field '{}' is not a field of '{}'".format(
+            path, messageName)
+
+
+class BadProfileTypeException(BadRequestException):
+    def __init__(self, profileType, profileTypes):
+        self.message = "Profile type '{}' is not one of {}".format(
+            profileType, ", ".join(profileTypes))
+
+
+class InvalidContentEncodingException(BadRequestException):
+    def __init__(self, encoding):
+        self.message = "Cannot decode request body with encoding '{}'".format(
+            encoding)
+
+
 class Validator(object):
     """
     Check that a JSON dictionary is a valid representation of a protocol
@@ -222,6 +256,13 @@ class VariantSetNotFoundException(NotFoundException):
             variantSetId)
 
 
+class VariantSetStatisticsNotFoundException(NotFoundException):
+    def __init__(self, variantSetId):
+        self.message = (
+            "The statistics of VariantSet '{}' have not been "
+            "computed".format(variantSetId))
+
+
 class AnnotationSetNotFoundException(NotFoundException):
     def __init__(self, variantAnnotationSetId):
         self.message = "The requested VariantAnnotationSet '{}'" \
@@ -271,6 +312,11 @@ class UnsupportedMediaTypeException(RuntimeException):
     message = "Unsupported media type"
 
 
+class RequestEntityTooLargeException(RuntimeException):
+    httpStatus = 413
+    message = "Request entity too large"
+
+
 class RangeErrorException(RuntimeException):
     """
     The superclass of all exceptions for which a query range error occured.
@@ -12,6 +12,14 @@ import datetime
 import socket
 import urlparse
 import functools
+import collections
+import hashlib
+import hmac
+import json
+import tempfile
+import threading
+import time
+import zlib
 
 import flask
 import flask.ext.cors as cors
@@ -29,17 +37,27 @@ import ga4gh.protocol as protocol
 import ga4gh.exceptions as exceptions
 import ga4gh.datarepo as datarepo
 import logging
+import logging.handlers
 from logging import StreamHandler
 
 
-MIMETYPE = "application/json"
+MIMETYPE = protocol.JSON_MIMETYPE
+PROTOBUF_MIMETYPE = protocol.PROTOBUF_MIMETYPE
+STREAMING_MIMETYPE = protocol.NDJSON_MIMETYPE
 SEARCH_ENDPOINT_METHODS = ['POST', 'OPTIONS']
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4"
+PROFILE_HEADER = "X-GA4GH-Profile"
+PROFILE_KEY_HEADER = "X-GA4GH-Profile-Key"
+PROFILE_REPORT_HEADER = "X-GA4GH-Profile-Report"
 SECRET_KEY_LENGTH = 24
 
 app = flask.Flask(__name__)
 assert not hasattr(app, 'urls')
 app.urls = []
 
+accessLogger = logging.getLogger("ga4gh.access")
+slowRequestLogger = logging.getLogger("ga4gh.slowrequests")
+
 
 class NoConverter(werkzeug.routing.BaseConverter):
     """
@@ -67,6 +85,231 @@ class NoConverter(werkzeug.routing.BaseConverter):
 app.url_map.converters['no'] = NoConverter
 
 
+class ResponseCache(object):
+    """
+    A cache of serialised responses, bounded by the total size of the
+    responses held. The least recently used responses are evicted first.
+    Each response is stored with a strong ETag derived from its contents,
+    so that clients can make conditional requests. The data repository
+    is immutable while the server is running, so entries never become
+    stale; the repository creation timestamp and the backend settings
+    that shape responses, such as the page sizes, are part of every key
+    to keep responses from different repositories and settings apart.
+    """
+    def __init__(self):
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._maxSize = 0
+        self._size = 0
+        self._numHits = 0
+        self._numMisses = 0
+
+    def setMaxSize(self, maxSize):
+        """
+        Sets the maximum total size of the cached responses in bytes.
+        A value of zero disables the cache.
+        """
+        if maxSize < 0:
+            raise ValueError(
+                "The size of the cache must be a non-negative value")
+        with self._lock:
+            self._maxSize = maxSize
+            self._evict()
+
+    def isEnabled(self):
+        """
+        Returns True if responses are cached.
+        """
+        return self._maxSize > 0
+
+    def _evict(self):
+        """
+        Removes the least recently used responses until the cache is
+        within its maximum size.
+        """
+        while self._size > self._maxSize:
+            _, (responseString, _) = self._cache.popitem(last=False)
+            self._size -= len(responseString)
+
+    def get(self, key):
+        """
+        Returns the (responseString, etag) pair stored under the specified
+        key, or None if there is no such response.
+        """
+        with self._lock:
+            entry = self._cache.pop(key, None)
+            if entry is None:
+                self._numMisses += 1
+            else:
+                self._numHits += 1
+                self._cache[key] = entry
+            return entry
+
+    def put(self, key, responseString):
+        """
+        Stores the specified response under the specified key and returns
+        the (responseString, etag) pair.
+        """
+        if isinstance(responseString, unicode):
+            responseString = responseString.encode('utf-8')
+        entry = responseString, hashlib.sha1(responseString).hexdigest()
+        if len(responseString) <= self._maxSize:
+            with self._lock:
+                oldEntry = self._cache.pop(key, None)
+                if oldEntry is not None:
+                    self._size -= len(oldEntry[0])
+                self._cache[key] = entry
+                self._size += len(responseString)
+                self._evict()
+        return entry
+
+    def getSize(self):
+        """
+        Returns the total size of the cached responses in bytes.
+        """
+        return self._size
+
+    def getNumHits(self):
+        """
+        Returns the number of requests answered from the cache.
+        """
+        return self._numHits
+
+    def getNumMisses(self):
+        """
+        Returns the number of requests that were not in the cache.
+        """
+        return self._numMisses
+
+
+class ResponseCompressor(object):
+    """
+    Compresses response bodies using the gzip or deflate content coding
+    preferred by the client, as given by its Accept-Encoding header.
+    Complete responses are only compressed if they are at least the
+    minimum size; streamed responses are compressed incrementally as they
+    are written. Compressed responses get their own ETag, so that
+    conditional requests work for each representation.
+    """
+    encodings = ["gzip", "deflate"]
+
+    def __init__(self):
+        self._level = 0
+        self._minSize = 0
+
+    def setLevel(self, level):
+        """
+        Sets the zlib compression level. A value of zero disables
+        compression.
+        """
+        if not 0 <= level <= 9:
+            raise ValueError(
+                "The compression level must be between 0 and 9")
+        self._level = level
+
+    def setMinSize(self, minSize):
+        """
+        Sets the minimum size in bytes of the response bodies that are
+        compressed.
+        """
+        if minSize < 0:
+            raise ValueError("The minimum size must be a non-negative value")
+        self._minSize = minSize
+
+    def isEnabled(self):
+        """
+        Returns True if responses are compressed.
+        """
+        return self._level > 0
+
+    def _getCompressor(self, encoding):
+        """
+        Returns a zlib compression object for the specified encoding.
+        """
+        windowBits = zlib.MAX_WBITS
+        if encoding == "gzip":
+            windowBits += 16
+        return zlib.compressobj(self._level, zlib.DEFLATED, windowBits)
+
+    def _compressStream(self, chunks, encoding):
+        """
+        Returns an iterator over the compressed form of the specified
+        iterator of chunks.
+        """
+        compressor = self._getCompressor(encoding)
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, unicode):
+                    chunk = chunk.encode('utf-8')
+                compressedChunk = compressor.compress(chunk)
+                if compressedChunk:
+                    yield compressedChunk
+            yield compressor.flush()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    def compressResponse(self, response, request):
+        """
+        Compresses the body of the specified response to the specified
+        request if the client accepts a supported encoding, and returns
+        the response.
+        """
+        if (not self.isEnabled() or response.status_code != 200 or
+                response.direct_passthrough or
+                'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            response.response = self._compressStream(
+                response.response, encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self._minSize:
+                return response
+            compressor = self._getCompressor(encoding)
+            response.set_data(compressor.compress(data) + compressor.flush())
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None:
+            response.set_etag("{}-{}".format(etag, encoding), weak)
+        return response
+
+
+def getRequestData(request):
+    """
+    Returns the body of the specified request, decompressing it if it
+    was sent with the gzip or deflate content coding.
+    """
+    data = request.get_data()
+    encoding = request.headers.get('Content-Encoding', 'identity').lower()
+    if encoding == 'identity':
+        return data
+    if encoding not in ResponseCompressor.encodings:
+        raise exceptions.UnsupportedMediaTypeException()
+    windowBits = zlib.MAX_WBITS
+    if encoding == "gzip":
+        windowBits += 16
+    decompressor = zlib.decompressobj(windowBits)
+    maxLength = app.config.get("MAX_CONTENT_LENGTH")
+    try:
+        if maxLength is None:
+            data = decompressor.decompress(data)
+        else:
+            # Guard against small bodies that expand to very large ones
+            data = decompressor.decompress(data, maxLength + 1)
+            if len(data) > maxLength:
+                raise exceptions.RequestEntityTooLargeException()
+        data += decompressor.flush()
+    except zlib.error:
+        raise exceptions.InvalidContentEncodingException(encoding)
+    return data
+
+
 class ServerStatus(object):
     """
     Generates information about the status of the server for display
@@ -85,7 +328,8 @@ class ServerStatus(object):
         # TODO what other config keys are appropriate to export here?
         keys = [
             'DEBUG', 'REQUEST_VALIDATION', 'RESPONSE_VALIDATION',
-            'DEFAULT_PAGE_SIZE', 'MAX_RESPONSE_LENGTH', 'LANDING_MESSAGE_HTML'
+            'DEFAULT_PAGE_SIZE', 'MAX_RESPONSE_LENGTH', 'LANDING_MESSAGE_HTML',
+            'REQUEST_COALESCING'
         ]
         return [(k, app.config[k]) for k in keys]
 
@@ -105,6 +349,14 @@ class ServerStatus(object):
             html = flask.render_template("landing_message.html")
         return html
 
+    def getCoalescedRequestRatio(self):
+        """
+        Returns the fraction of requests that were handed the response to
+        an identical concurrent request, as a percentage.
+        """
+        coalescer = app.backend.getRequestCoalescer()
+        return "{:.1f}%".format(100 * coalescer.getCoalescedRatio())
+
     def getNaturalUptime(self):
         """
         Returns the uptime in a human-readable format.
@@ -208,6 +460,15 @@ def configure(configFile=None, baseConfig="ProductionConfig",
     # Setup CORS
     cors.CORS(app, allow_headers='Content-Type')
     app.serverStatus = ServerStatus()
+    app.responseCache = ResponseCache()
+    app.responseCache.setMaxSize(app.config["RESPONSE_CACHE_MAX_SIZE"])
+    # The pool of threads that runs blocking backend calls when the
+    # server is running in asynchronous mode.
+    app.backendThreadPool = None
+    app.responseCompressor = ResponseCompressor()
+    app.responseCompressor.setLevel(app.config["RESPONSE_COMPRESSION_LEVEL"])
+    app.responseCompressor.setMinSize(
+        app.config["RESPONSE_COMPRESSION_MIN_SIZE"])
     # Allocate the backend
     # We use URLs to specify the backend. Currently we have file:// URLs (or
     # URLs with no scheme) for the SqlDataRepository, and special empty:// and
@@ -249,6 +510,24 @@ def configure(configFile=None, baseConfig="ProductionConfig",
     theBackend.setResponseValidation(app.config["RESPONSE_VALIDATION"])
     theBackend.setDefaultPageSize(app.config["DEFAULT_PAGE_SIZE"])
     theBackend.setMaxResponseLength(app.config["MAX_RESPONSE_LENGTH"])
+    theBackend.setMaxBatchGetSize(app.config["MAX_BATCH_GET_SIZE"])
+    theBackend.setMaxDensityBins(app.config["MAX_DENSITY_BINS"])
+    theBackend.setCursorCacheMaxSize(app.config["CURSOR_CACHE_MAX_SIZE"])
+    theBackend.setRequestCoalescing(app.config["REQUEST_COALESCING"])
+    theBackend.setCursorCacheTimeToLive(
+        app.config["CURSOR_CACHE_TIME_TO_LIVE"])
+    metricsRegistry = theBackend.getMetricsRegistry()
+    metricsRegistry.setDirectory(
+        app.config["METRICS_DIRECTORY"],
+        app.config["METRICS_SNAPSHOT_INTERVAL"])
+    addRequestMetrics(metricsRegistry)
+    app.requestTiming = app.config["REQUEST_TIMING"]
+    configureRequestLog(accessLogger, app.config["ACCESS_LOG_FILE"])
+    configureRequestLog(
+        slowRequestLogger, app.config["SLOW_REQUEST_LOG_FILE"],
+        app.config["SLOW_REQUEST_LOG_MAX_BYTES"],
+        app.config["SLOW_REQUEST_LOG_BACKUP_COUNT"])
+    app.slowRequestThreshold = app.config["SLOW_REQUEST_THRESHOLD"]
     app.backend = theBackend
     app.secret_key = os.urandom(SECRET_KEY_LENGTH)
     app.oidcClient = None
@@ -298,30 +577,254 @@ def configure(configFile=None, baseConfig="ProductionConfig",
             app.oidcClient.store_registration_info(response)
 
 
-def getFlaskResponse(responseString, httpStatus=200):
+def runAsyncServer(host, port):
+    """
+    Serves the app from a gevent event loop on the specified host and
+    port, so that many mostly idle client connections can be held open
+    cheaply. Blocking backend calls, which read and convert data with
+    htslib, are run on a bounded pool of native threads.
+    """
+    try:
+        import gevent.pywsgi
+        import gevent.threadpool
+    except ImportError:
+        raise exceptions.ConfigurationException(
+            "The asynchronous server requires the gevent package, "
+            "which is installed with ga4gh[async]")
+    app.backendThreadPool = gevent.threadpool.ThreadPool(
+        app.config["ASYNC_BACKEND_THREADS"])
+    server = gevent.pywsgi.WSGIServer((host, port), app)
+    server.serve_forever()
+
+
+def getFlaskResponse(responseString, httpStatus=200, mimetype=MIMETYPE):
+    """
+    Returns a Flask response object for the specified data, HTTP status
+    and mimetype.
+    """
+    return flask.Response(responseString, status=httpStatus, mimetype=mimetype)
+
+
+def callBackend(function, *args):
+    """
+    Calls the specified backend function with the specified arguments and
+    returns the result. When the server is running in asynchronous mode,
+    the call is made on the backend thread pool, so that reading and
+    converting data does not hold up the other requests being served.
+    """
+    timer = flask.g.requestTimer
+    profiler = flask.g.requestProfiler
+    if app.backendThreadPool is None:
+        return _callWithRequestContext(timer, profiler, function, *args)
+    return app.backendThreadPool.apply(
+        _callOnBackendThread,
+        (_callWithRequestContext, timer, profiler, function) + args)
+
+
+def _callOnBackendThread(function, *args):
+    """
+    Calls the specified function with the specified arguments on a thread
+    of the backend thread pool. Each of these threads keeps its own file
+    handles, as the handles and their cache must not be shared between
+    threads.
+    """
+    datamodel.useThreadFileHandleCache()
+    return function(*args)
+
+
+def _callWithRequestContext(timer, profiler, function, *args):
+    """
+    Calls the specified function with the specified arguments, timing the
+    phases of the call with the specified RequestTimer and profiling it
+    with the specified request profiler, either of which may be None.
+    """
+    datamodel.setRequestTimer(timer)
+    backend.setRequestProfiler(profiler)
+    try:
+        return function(*args)
+    finally:
+        datamodel.setRequestTimer(None)
+        backend.setRequestProfiler(None)
+        if profiler is not None:
+            profiler.stop()
+
+
+def iterateBackend(iterator):
+    """
+    Returns an iterator over the values of the specified backend iterator,
+    each of which is computed on the backend thread pool when the server
+    is running in asynchronous mode.
+    """
+    if app.backendThreadPool is None:
+        return iterator
+    return _iterateInThreadPool(app.backendThreadPool, iterator)
+
+
+def _iterateInThreadPool(threadPool, iterator):
+    """
+    Yields the values of the specified iterator, each computed in the
+    specified thread pool.
+    """
+    done = object()
+    while True:
+        value = threadPool.apply(_callOnBackendThread, (next, iterator, done))
+        if value is done:
+            break
+        yield value
+
+
+def getCachedFlaskResponse(requestKey, mimetype, function, *args):
+    """
+    Returns a Flask response of the specified mimetype for the result of
+    calling the specified function with the specified arguments, using
+    the response cache if it is enabled and the requestKey is not None.
+    Cached responses carry an ETag, and conditional GET requests are
+    answered with 304 if the response has not changed.
+    """
+    # Profiled requests must reach the backend.
+    if (requestKey is None or not app.responseCache.isEnabled() or
+            flask.g.requestProfiler is not None):
+        responseString = callBackend(function, *args)
+        return getFlaskResponse(responseString, mimetype=mimetype)
+    repository = app.backend.getDataRepository()
+    cacheKey = (
+        flask.request.path, requestKey, mimetype,
+        repository.getCreationTimeStamp(), app.backend.getResponseSettings())
+    entry = app.responseCache.get(cacheKey)
+    if entry is None:
+        entry = app.responseCache.put(cacheKey, callBackend(function, *args))
+    responseString, etag = entry
+    response = getFlaskResponse(responseString, mimetype=mimetype)
+    response.set_etag(etag)
+    # The response is compressed before the ETag is checked, as the
+    # compressed representation has an ETag of its own.
+    response = app.responseCompressor.compressResponse(
+        response, flask.request)
+    return response.make_conditional(flask.request)
+
+
+def getCanonicalJson(jsonString):
+    """
+    Returns a canonical form of the specified JSON document, so that
+    requests that differ only in formatting share a cache entry. Returns
+    None if the document cannot be parsed.
+    """
+    try:
+        return json.dumps(
+            json.loads(jsonString), sort_keys=True, separators=(',', ':'))
+    except ValueError:
+        return None
+
+
+def getFlaskStreamingResponse(lines):
+    """
+    Returns a Flask response object that writes the specified iterator of
+    newline delimited JSON lines to the client as they are generated.
+    """
+    return flask.Response(
+        flask.stream_with_context(lines), mimetype=STREAMING_MIMETYPE)
+
+
+def getResponseMimetype(request, mimetypes):
     """
-    Returns a Flask response object for the specified data and HTTP status.
+    Returns the mimetype from the specified list that best matches the
+    Accept header of the specified request. The first mimetype in the
+    list is returned if the client did not express a preference.
     """
-    return flask.Response(responseString, status=httpStatus, mimetype=MIMETYPE)
+    bestMatch = request.accept_mimetypes.best_match(mimetypes)
+    if bestMatch is None:
+        bestMatch = mimetypes[0]
+    return bestMatch
 
 
 def handleHttpPost(request, endpoint):
     """
     Handles the specified HTTP POST request, which maps to the specified
-    protocol handler endpoint and protocol request class.
+    protocol handler endpoint and protocol request class. Requests may be
+    sent as JSON or as binary protobuf, and the response is serialised in
+    the format that best matches the Accept header: JSON, binary protobuf
+    or a stream of newline delimited JSON objects. The optional "fields"
+    query parameter is a comma separated list of the fields of the
+    returned objects to fill in.
+    """
+    requestMimetype = request.mimetype
+    if requestMimetype not in [MIMETYPE, PROTOBUF_MIMETYPE]:
+        raise exceptions.UnsupportedMediaTypeException()
+    responseMimetype = getResponseMimetype(
+        request, [MIMETYPE, PROTOBUF_MIMETYPE, STREAMING_MIMETYPE])
+    fieldMask = None
+    if "fields" in request.args:
+        fieldMask = protocol.FieldMask.parse(request.args["fields"])
+    requestStr = getRequestData(request)
+    flask.g.requestCapture = collections.OrderedDict([
+        ("endpoint", endpoint.__name__),
+        ("fields", None if fieldMask is None else str(fieldMask))])
+    if responseMimetype == STREAMING_MIMETYPE:
+        lines = callBackend(
+            endpoint, requestStr, requestMimetype, responseMimetype,
+            fieldMask)
+        return getFlaskStreamingResponse(iterateBackend(lines))
+    if requestMimetype == MIMETYPE:
+        requestKey = getCanonicalJson(requestStr)
+    else:
+        requestKey = requestStr
+    return getCachedFlaskResponse(
+        (requestKey, str(fieldMask)), responseMimetype, endpoint,
+        requestStr, requestMimetype, responseMimetype, fieldMask)
+
+
+def handleHttpBatchGet(request, objectType):
+    """
+    Handles the specified HTTP POST request for a batch of objects of the
+    specified type.
     """
     if request.mimetype != MIMETYPE:
         raise exceptions.UnsupportedMediaTypeException()
-    responseStr = endpoint(request.get_data())
-    return getFlaskResponse(responseStr)
+    requestStr = getRequestData(request)
+    return getCachedFlaskResponse(
+        getCanonicalJson(requestStr), MIMETYPE, app.backend.runBatchGet,
+        objectType, requestStr)
+
+
+def handleHttpJsonGet(id_, endpoint):
+    """
+    Handles the specified HTTP GET request for a JSON document that has
+    no protobuf equivalent, which maps to the specified backend endpoint.
+    """
+    if flask.request.method != "GET":
+        raise exceptions.MethodNotAllowedException()
+    requestKey = endpoint.__name__, id_
+    flask.g.requestCapture = collections.OrderedDict([
+        ("endpoint", endpoint.__name__), ("id", id_)])
+    return getCachedFlaskResponse(
+        requestKey, MIMETYPE, endpoint, id_, MIMETYPE)
+
+
+def handleHttpJsonList(id_, endpoint):
+    """
+    Handles the specified HTTP GET request with query arguments for a
+    JSON document that has no protobuf equivalent, which maps to the
+    specified backend endpoint.
+    """
+    if flask.request.method != "GET":
+        raise exceptions.MethodNotAllowedException()
+    requestArgs = tuple(sorted(flask.request.args.items(multi=True)))
+    requestKey = endpoint.__name__, id_, requestArgs
+    return getCachedFlaskResponse(
+        requestKey, MIMETYPE, endpoint, id_, flask.request.args)
 
 
 def handleList(id_, endpoint, request):
     """
     Handles the specified HTTP GET request, mapping to a list request
     """
-    responseStr = endpoint(id_, request.args)
-    return getFlaskResponse(responseStr)
+    responseMimetype = getResponseMimetype(
+        request, [MIMETYPE, PROTOBUF_MIMETYPE])
+    requestArgs = tuple(sorted(request.args.items(multi=True)))
+    requestKey = endpoint.__name__, id_, requestArgs, responseMimetype
+    return getCachedFlaskResponse(
+        requestKey, responseMimetype, app.backend.getRequestCoalescer().run,
+        requestKey, endpoint, id_, request.args, responseMimetype)
 
 
 def handleHttpGet(id_, endpoint):
@@ -329,8 +832,14 @@ def handleHttpGet(id_, endpoint):
     Handles the specified HTTP GET request, which maps to the specified
     protocol handler endpoint and protocol request class
     """
-    responseStr = endpoint(id_)
-    return getFlaskResponse(responseStr)
+    responseMimetype = getResponseMimetype(
+        flask.request, [MIMETYPE, PROTOBUF_MIMETYPE])
+    requestKey = endpoint.__name__, id_, responseMimetype
+    flask.g.requestCapture = collections.OrderedDict([
+        ("endpoint", endpoint.__name__), ("id", id_)])
+    return getCachedFlaskResponse(
+        requestKey, responseMimetype, app.backend.getRequestCoalescer().run,
+        requestKey, endpoint, id_, responseMimetype)
 
 
 def handleHttpOptions():
@@ -381,6 +890,275 @@ def startLogin():
     return flask.redirect(result.url)
 
 
+def addRequestMetrics(metricsRegistry):
+    """
+    Adds the metrics recorded for every HTTP request to the specified
+    registry.
+    """
+    metricsRegistry.addCounter(
+        "ga4gh_http_requests_total",
+        "HTTP requests, by route, method and status.",
+        ["route", "method", "status"])
+    metricsRegistry.addHistogram(
+        "ga4gh_http_request_duration_seconds",
+        "Time taken to generate HTTP responses, by route and status.",
+        ["route", "status"],
+        [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10])
+    metricsRegistry.addCounter(
+        "ga4gh_http_response_bytes_total",
+        "Bytes in HTTP response bodies, by route. Streamed responses are "
+        "not counted.", ["route"])
+    metricsRegistry.addGauge(
+        "ga4gh_http_requests_in_flight",
+        "HTTP requests currently being handled.")
+
+
+# The request metrics hooks are registered before any others, so that
+# they see every request and the final (compressed) response.
+@app.before_request
+def startRequestMetrics():
+    """
+    Records the start of a request.
+    """
+    flask.g.requestStartTime = time.time()
+    app.backend.getMetricsRegistry().increment(
+        "ga4gh_http_requests_in_flight")
+
+
+@app.after_request
+def recordRequestMetrics(response):
+    """
+    Records the status, latency and size of the response to a request.
+    The latency of a streamed response is the time taken to start it.
+    """
+    metricsRegistry = app.backend.getMetricsRegistry()
+    route = "unmatched"
+    if flask.request.url_rule is not None:
+        route = flask.request.url_rule.rule
+    status = str(response.status_code)
+    metricsRegistry.increment(
+        "ga4gh_http_requests_total",
+        (route, flask.request.method, status))
+    metricsRegistry.observe(
+        "ga4gh_http_request_duration_seconds", (route, status),
+        time.time() - flask.g.requestStartTime)
+    # Calculating the length of a streamed response would consume it.
+    if not response.is_streamed:
+        metricsRegistry.increment(
+            "ga4gh_http_response_bytes_total", (route,),
+            response.calculate_content_length())
+    return response
+
+
+@app.teardown_request
+def endRequestMetrics(exception):
+    """
+    Records the end of a request, whether or not it succeeded.
+    """
+    if getattr(flask.g, "requestStartTime", None) is not None:
+        app.backend.getMetricsRegistry().increment(
+            "ga4gh_http_requests_in_flight", amount=-1)
+
+
+def configureRequestLog(logger, logFile, maxBytes=0, backupCount=0):
+    """
+    Sends the specified per-request logger to the specified file, or
+    disables it if the file is None. If maxBytes is non-zero, the file is
+    rotated when it reaches this size, keeping backupCount old files.
+    """
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    logger.propagate = False
+    if logFile is None:
+        logger.setLevel(logging.CRITICAL)
+    else:
+        logger.setLevel(logging.INFO)
+        handler = logging.handlers.RotatingFileHandler(
+            logFile, maxBytes=maxBytes, backupCount=backupCount)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+
+
+def getServerTimingHeader(timer):
+    """
+    Returns the value of the Server-Timing header for the request timed by
+    the specified RequestTimer.
+    """
+    metrics = [
+        "{};dur={:.3f};cpu={:.3f}".format(phase, wallTime * 1000,
+                                          cpuTime * 1000)
+        for phase, wallTime, cpuTime in timer.getPhases()]
+    metrics.append("total;dur={:.3f}".format(timer.getElapsedTime() * 1000))
+    metrics.extend(
+        "{};count={}".format(name, count)
+        for name, count in timer.getCounts())
+    return ", ".join(metrics)
+
+
+def getPhaseTimings(timer):
+    """
+    Returns the wall clock and CPU times in milliseconds of each phase
+    timed by the specified RequestTimer, for the request logs.
+    """
+    return collections.OrderedDict(
+        (phase, {"wallMs": round(wallTime * 1000, 3),
+                 "cpuMs": round(cpuTime * 1000, 3)})
+        for phase, wallTime, cpuTime in timer.getPhases())
+
+
+@app.before_request
+def startRequestTimer():
+    """
+    Starts timing the phases of a request, if this is enabled.
+    """
+    flask.g.requestTimer = None
+    flask.g.requestCapture = None
+    if (app.requestTiming or accessLogger.isEnabledFor(logging.INFO) or
+            slowRequestLogger.isEnabledFor(logging.INFO)):
+        flask.g.requestTimer = datamodel.RequestTimer()
+
+
+@app.after_request
+def recordRequestTimer(response):
+    """
+    Reports the phase timings of a request in the Server-Timing header of
+    the response, in the access log and, if the request was slow, in the
+    slow request log.
+    """
+    timer = flask.g.requestTimer
+    if timer is None:
+        return response
+    if app.requestTiming:
+        response.headers["Server-Timing"] = getServerTimingHeader(timer)
+    if accessLogger.isEnabledFor(logging.INFO):
+        entry = collections.OrderedDict([
+            ("time", datetime.datetime.utcnow().isoformat() + "Z"),
+            ("method", flask.request.method),
+            ("path", flask.request.path),
+            ("status", response.status_code),
+            ("bytes", None),
+        ])
+        if response.is_streamed:
+            # Streams are timed as they are written, so they are logged
+            # once the response has been closed.
+            response.call_on_close(
+                functools.partial(writeAccessLogEntry, entry, timer))
+        else:
+            entry["bytes"] = response.calculate_content_length()
+            writeAccessLogEntry(entry, timer)
+    if (slowRequestLogger.isEnabledFor(logging.INFO) and
+            not response.is_streamed and
+            timer.getElapsedTime() >= app.slowRequestThreshold):
+        entry = getSlowRequestEntry(timer, response)
+        if entry is not None:
+            slowRequestLogger.info(json.dumps(entry))
+    return response
+
+
+def writeAccessLogEntry(entry, timer):
+    """
+    Writes the specified access log entry, completed with the duration,
+    phase timings and object counts of the request timed by the specified
+    RequestTimer.
+    """
+    entry["durationMs"] = round(timer.getElapsedTime() * 1000, 3)
+    entry["phases"] = getPhaseTimings(timer)
+    entry["objects"] = collections.OrderedDict(timer.getCounts())
+    accessLogger.info(json.dumps(entry))
+
+
+def getSlowRequestEntry(timer, response):
+    """
+    Returns the slow request log entry for the request timed by the
+    specified RequestTimer, holding everything needed to replay the
+    request against a Backend, or None if the request cannot be replayed.
+    """
+    capture = flask.g.requestCapture
+    if capture is None:
+        return None
+    entry = collections.OrderedDict([
+        ("time", datetime.datetime.utcnow().isoformat() + "Z"),
+        ("path", flask.request.path),
+        ("status", response.status_code),
+        ("durationMs", round(timer.getElapsedTime() * 1000, 3)),
+    ])
+    entry.update(capture)
+    if "id" not in capture:
+        # Search requests are logged in their canonical JSON form, which
+        # is only known once the backend has parsed them. Responses from
+        # the cache or from a coalesced request were not parsed.
+        request = timer.getRequest()
+        if request is None:
+            return None
+        entry["request"] = getCanonicalJson(protocol.toJson(request))
+        entry["pageToken"] = request.page_token or None
+    entry["phases"] = getPhaseTimings(timer)
+    entry["objects"] = collections.OrderedDict(timer.getCounts())
+    return entry
+
+
+@app.before_request
+def startRequestProfile():
+    """
+    Creates a profiler for the request if the client asks for one with the
+    profile header, which must be accompanied by the profiling key.
+    """
+    flask.g.requestProfiler = None
+    profileType = flask.request.headers.get(PROFILE_HEADER)
+    if profileType is None:
+        return
+    profileKey = app.config["PROFILE_KEY"]
+    requestKey = flask.request.headers.get(PROFILE_KEY_HEADER, "")
+    if profileKey is None or not hmac.compare_digest(
+            profileKey.encode("utf-8"), requestKey.encode("utf-8")):
+        raise exceptions.NotAuthenticatedException()
+    if profileType not in backend.requestProfilerClasses:
+        raise exceptions.BadProfileTypeException(
+            profileType, sorted(backend.requestProfilerClasses.keys()))
+    flask.g.requestProfiler = backend.requestProfilerClasses[profileType]()
+
+
+@app.after_request
+def saveRequestProfile(response):
+    """
+    Writes the report of the request's profiler, if it has one, to a new
+    file in the profile directory, and names the file in the response.
+    """
+    profiler = getattr(flask.g, "requestProfiler", None)
+    if profiler is None:
+        return response
+    directory = app.config["PROFILE_DIRECTORY"]
+    if directory is None:
+        directory = tempfile.gettempdir()
+    fd, path = tempfile.mkstemp(
+        prefix="ga4gh-profile-", suffix=".txt", dir=directory)
+    title = "{} {} {}".format(
+        flask.request.method, flask.request.full_path, response.status_code)
+    if response.is_streamed:
+        # Streams are profiled as they are written, so the report is
+        # written once the response has been closed.
+        response.call_on_close(functools.partial(
+            writeProfileReport, fd, title, profiler,
+            app.config["PROFILE_NUM_ENTRIES"]))
+    else:
+        writeProfileReport(
+            fd, title, profiler, app.config["PROFILE_NUM_ENTRIES"])
+    response.headers[PROFILE_REPORT_HEADER] = os.path.basename(path)
+    return response
+
+
+def writeProfileReport(fd, title, profiler, numEntries):
+    """
+    Writes the specified title and the report of the specified number of
+    entries of the specified request profiler to the open file descriptor
+    fd, which is closed.
+    """
+    with os.fdopen(fd, "w") as reportFile:
+        reportFile.write("{}\n\n".format(title))
+        reportFile.write(profiler.getReport(numEntries))
+
+
 @app.before_request
 def checkAuthentication():
     """
@@ -409,6 +1187,14 @@ def checkAuthentication():
             return startLogin()
 
 
+@app.after_request
+def compressResponse(response):
+    """
+    Compresses the response if the client accepts a compressed encoding.
+    """
+    return app.responseCompressor.compressResponse(response, flask.request)
+
+
 def handleFlaskGetRequest(id_, flaskRequest, endpoint):
     """
     Handles the specified flask request for one of the GET URLs
@@ -480,6 +1266,13 @@ def index():
     return flask.render_template('index.html', info=app.serverStatus)
 
 
+@app.route('/metrics')
+def metrics():
+    return flask.Response(
+        app.backend.getMetricsRegistry().getText(),
+        content_type=METRICS_CONTENT_TYPE)
+
+
 @app.route('/favicon.ico')
 @app.route('/robots.txt')
 def robots():
@@ -487,13 +1280,17 @@ def robots():
         app.static_folder, flask.request.path[1:])
 
 
-@DisplayedRoute('/references/<id>')
+@DisplayedRoute(
+    '/references/<no(search, batchGet):id>',
+    pathDisplay='/references/<id>')
 def getReference(id):
     return handleFlaskGetRequest(
         id, flask.request, app.backend.runGetReference)
 
 
-@DisplayedRoute('/referencesets/<id>')
+@DisplayedRoute(
+    '/referencesets/<no(search, batchGet):id>',
+    pathDisplay='/referencesets/<id>')
 def getReferenceSet(id):
     return handleFlaskGetRequest(
         id, flask.request, app.backend.runGetReferenceSet)
@@ -577,16 +1374,36 @@ def searchFeatures():
         flask.request, app.backend.runSearchFeatures)
 
 
+@DisplayedRoute('/<objectType>/batchGet', postMethod=True)
+def batchGet(objectType):
+    if flask.request.method == "POST":
+        return handleHttpBatchGet(flask.request, objectType)
+    elif flask.request.method == "OPTIONS":
+        return handleHttpOptions()
+    else:
+        raise exceptions.MethodNotAllowedException()
+
+
 @DisplayedRoute(
-    '/variantsets/<no(search):id>',
+    '/variantsets/<no(search, batchGet):id>',
     pathDisplay='/variantsets/<id>')
 def getVariantSet(id):
     return handleFlaskGetRequest(
         id, flask.request, app.backend.runGetVariantSet)
 
 
+@DisplayedRoute('/variantsets/<id>/stats')
+def getVariantSetStatistics(id):
+    return handleHttpJsonGet(id, app.backend.runGetVariantSetStatistics)
+
+
+@DisplayedRoute('/variantsets/<id>/density')
+def getVariantDensity(id):
+    return handleHttpJsonList(id, app.backend.runGetVariantDensity)
+
+
 @DisplayedRoute(
-    '/variants/<no(search):id>',
+    '/variants/<no(search, batchGet):id>',
     pathDisplay='/variants/<id>')
 def getVariant(id):
     return handleFlaskGetRequest(
@@ -594,21 +1411,23 @@ def getVariant(id):
 
 
 @DisplayedRoute(
-    '/readgroupsets/<no(search):id>',
+    '/readgroupsets/<no(search, batchGet):id>',
     pathDisplay='/readgroupsets/<id>')
 def getReadGroupSet(id):
     return handleFlaskGetRequest(
         id, flask.request, app.backend.runGetReadGroupSet)
 
 
-@DisplayedRoute('/readgroups/<id>')
+@DisplayedRoute(
+    '/readgroups/<no(search, batchGet):id>',
+    pathDisplay='/readgroups/<id>')
 def getReadGroup(id):
     return handleFlaskGetRequest(
         id, flask.request, app.backend.runGetReadGroup)
 
 
 @DisplayedRoute(
-    '/callsets/<no(search):id>',
+    '/callsets/<no(search, batchGet):id>',
     pathDisplay='/callsets/<id>')
 def getCallSet(id):
     return handleFlaskGetRequest(
@@ -616,7 +1435,7 @@ def getCallSet(id):
 
 
 @DisplayedRoute(
-    '/featuresets/<no(search):id>',
+    '/featuresets/<no(search, batchGet):id>',
     pathDisplay='/featuresets/<id>')
 def getFeatureSet(id):
     return handleFlaskGetRequest(
@@ -624,7 +1443,7 @@ def getFeatureSet(id):
 
 
 @DisplayedRoute(
-    '/features/<no(search):id>',
+    '/features/<no(search, batchGet):id>',
     pathDisplay='/features/<id>')
 def getFeature(id):
     return handleFlaskGetRequest(
@@ -692,7 +1511,7 @@ def oidcCallback():
 
 
 @DisplayedRoute(
-    '/datasets/<no(search):id>',
+    '/datasets/<no(search, batchGet):id>',
     pathDisplay='/datasets/<id>')
 def getDataset(id):
     return handleFlaskGetRequest(
@@ -700,7 +1519,7 @@ def getDataset(id):
 
 
 @DisplayedRoute(
-    '/variantannotationsets/<no(search):id>',
+    '/variantannotationsets/<no(search, batchGet):id>',
     pathDisplay='/variantannotationsets/<id>')
 def getVariantAnnotationSet(id):
     return handleFlaskGetRequest(
@@ -8,8 +8,11 @@ from __future__ import unicode_literals
 import datetime
 import json
 import inspect
+import re
 from sys import modules
 
+import google.protobuf.internal.encoder as encoder
+import google.protobuf.internal.wire_format as wire_format
 import google.protobuf.json_format as json_format
 import google.protobuf.message as message
 import google.protobuf.struct_pb2 as struct_pb2
@@ -31,6 +34,12 @@ from ga4gh.allele_annotation_service_pb2 import *  # noqa
 from ga4gh.sequence_annotations_pb2 import *  # noqa
 from ga4gh.sequence_annotation_service_pb2 import *  # noqa
 
+# The wire formats that protocol messages can be serialised to.
+JSON_MIMETYPE = "application/json"
+PROTOBUF_MIMETYPE = "application/x-protobuf"
+# Newline delimited JSON, with one value per line.
+NDJSON_MIMETYPE = "application/x-ndjson"
+
 # A map of response objects to the name of the attribute used to
 # store the values returned.
 _valueListNameMap = {
@@ -88,6 +97,35 @@ def toJson(protoObject, indent=None):
     return json.dumps(js, indent=indent)
 
 
+def serialize(protoObject, mimetype=JSON_MIMETYPE):
+    """
+    Serialises a protobuf object in the wire format for the specified
+    mimetype.
+    """
+    if mimetype == PROTOBUF_MIMETYPE:
+        return protoObject.SerializeToString()
+    return toJson(protoObject)
+
+
+def deserialize(data, protoClass, mimetype=JSON_MIMETYPE):
+    """
+    Deserialises an instance of the specified protobuf class from data in
+    the wire format for the specified mimetype. Raises a ValueError if the
+    data cannot be parsed.
+    """
+    if mimetype == PROTOBUF_MIMETYPE:
+        protoObject = protoClass()
+        try:
+            protoObject.ParseFromString(data)
+        except message.DecodeError as decodeError:
+            raise ValueError(str(decodeError))
+        return protoObject
+    try:
+        return fromJson(data, protoClass)
+    except json_format.ParseError as parseError:
+        raise ValueError(str(parseError))
+
+
 def toJsonDict(protoObject):
     """
     Converts a protobuf object to the raw attributes
@@ -116,26 +154,163 @@ def validate(json, protoClass):
         return False
 
 
+class FieldMask(object):
+    """
+    A projection of a protocol object onto a subset of its fields. Each
+    path in the mask names a field, in either its protobuf (snake_case)
+    or its JSON (camelCase) form, and the fields of nested messages are
+    selected using dotted paths such as "calls.genotype". A field named
+    without any sub-fields is included in full, and an empty mask
+    includes every field.
+    """
+    def __init__(self, paths=[]):
+        subPaths = {}
+        for path in paths:
+            names = path.split(".", 1)
+            name = re.sub("([A-Z])", r"_\1", names[0]).lower()
+            if len(names) == 1:
+                subPaths[name] = None
+            elif name not in subPaths:
+                subPaths[name] = [names[1]]
+            elif subPaths[name] is not None:
+                subPaths[name].append(names[1])
+        self._subMasks = {}
+        for name, fieldPaths in subPaths.items():
+            self._subMasks[name] = FieldMask(
+                [] if fieldPaths is None else fieldPaths)
+
+    @classmethod
+    def parse(cls, maskString):
+        """
+        Returns the FieldMask for the specified comma separated list of
+        field paths.
+        """
+        paths = [path.strip() for path in maskString.split(",")]
+        return cls([path for path in paths if path != ""])
+
+    def isEmpty(self):
+        """
+        Returns True if this mask includes every field.
+        """
+        return len(self._subMasks) == 0
+
+    def includes(self, fieldName):
+        """
+        Returns True if the field with the specified protobuf name is
+        included, in full or in part, by this mask.
+        """
+        return len(self._subMasks) == 0 or fieldName in self._subMasks
+
+    def getSubMask(self, fieldName):
+        """
+        Returns the mask to apply to the value of the field with the
+        specified protobuf name. This should only be called for fields
+        that are included by this mask.
+        """
+        return self._subMasks.get(fieldName, _allFieldsMask)
+
+    def getInvalidPath(self, descriptor):
+        """
+        Returns the first path in this mask that does not name a field of
+        the protocol message with the specified descriptor, or None if
+        every path is valid.
+        """
+        for name in sorted(self._subMasks.keys()):
+            subMask = self._subMasks[name]
+            field = descriptor.fields_by_name.get(name)
+            if field is None:
+                return name
+            if not subMask.isEmpty():
+                if field.message_type is None or _isMapField(field):
+                    return name + "." + str(subMask).split(",")[0]
+                invalidPath = subMask.getInvalidPath(field.message_type)
+                if invalidPath is not None:
+                    return name + "." + invalidPath
+        return None
+
+    def apply(self, protoObject):
+        """
+        Clears the fields of the specified protocol object that are not
+        included by this mask.
+        """
+        if len(self._subMasks) == 0:
+            return
+        for field, value in protoObject.ListFields():
+            subMask = self._subMasks.get(field.name)
+            if subMask is None:
+                protoObject.ClearField(field.name)
+            elif (not subMask.isEmpty() and
+                    field.message_type is not None and
+                    not _isMapField(field)):
+                if field.label == field.LABEL_REPEATED:
+                    for element in value:
+                        subMask.apply(element)
+                else:
+                    subMask.apply(value)
+
+    def __str__(self):
+        """
+        Returns the canonical form of this mask, with its paths sorted.
+        """
+        paths = []
+        for name in sorted(self._subMasks.keys()):
+            subMask = self._subMasks[name]
+            if subMask.isEmpty():
+                paths.append(name)
+            else:
+                paths.extend(
+                    name + "." + path for path in str(subMask).split(","))
+        return ",".join(paths)
+
+
+_allFieldsMask = FieldMask()
+
+
+def _isMapField(field):
+    """
+    Returns True if the specified field descriptor is for a map field.
+    """
+    messageType = field.message_type
+    return (
+        messageType is not None and messageType.has_options and
+        messageType.GetOptions().map_entry)
+
+
 class SearchResponseBuilder(object):
     """
     A class to allow sequential building of SearchResponse objects.
+    Each value is serialised once, as it is added, and the serialised
+    values are spliced into the response envelope when the response is
+    requested. No copy of the values is made.
     """
-    def __init__(self, responseClass, pageSize, maxBufferSize):
+    def __init__(
+            self, responseClass, pageSize, maxBufferSize,
+            mimetype=JSON_MIMETYPE):
         """
         Allocates a new SearchResponseBuilder for the specified
         responseClass, user-requested pageSize and the system mandated
         maxBufferSize (in bytes). The maxBufferSize is an
         approximate limit on the overall length of the serialised
-        response.
+        response. The response is serialised in the wire format for the
+        specified mimetype.
         """
         self._responseClass = responseClass
         self._pageSize = pageSize
         self._maxBufferSize = maxBufferSize
+        self._mimetype = mimetype
         self._numElements = 0
         self._nextPageToken = None
         self._protoObject = responseClass()
         self._valueListName = getValueListName(responseClass)
-        self._bufferSize = self._protoObject.ByteSize()
+        self._fragments = []
+        self._bufferSize = 0
+        valueListField = responseClass.DESCRIPTOR.fields_by_name[
+            self._valueListName]
+        self._valueListJsonName = valueListField.camelcase_name
+        # In the protobuf wire format, each value in the list is written
+        # as a length delimited field, preceded by the field's tag.
+        self._valueTag = encoder.TagBytes(
+            valueListField.number, wire_format.WIRETYPE_LENGTH_DELIMITED)
 
     def getPageSize(self):
         """
@@ -148,8 +323,9 @@ class SearchResponseBuilder(object):
     def getMaxBufferSize(self):
         """
         Returns the maximum internal buffer size for responses, which
-        corresponds to total length (in bytes) of the serialised protobuf
-        objects. This will always be less than the size of JSON output.
+        corresponds to total length (in bytes) of the serialised values.
+        This is slightly less than the size of the output, which also
+        includes the response envelope.
         """
         return self._maxBufferSize
 
@@ -171,11 +347,15 @@ class SearchResponseBuilder(object):
         Appends the specified protocolElement to the value list for this
         response.
         """
+        if self._mimetype == PROTOBUF_MIMETYPE:
+            value = protocolElement.SerializeToString()
+            fragment = b"".join([
+                self._valueTag, encoder._VarintBytes(len(value)), value])
+        else:
+            fragment = toJson(protocolElement)
         self._numElements += 1
-        self._bufferSize += protocolElement.ByteSize()
-        attr = getattr(self._protoObject, self._valueListName)
-        obj = attr.add()
-        obj.CopyFrom(protocolElement)
+        self._bufferSize += len(fragment)
+        self._fragments.append(fragment)
 
     def isFull(self):
         """
@@ -198,8 +378,21 @@ class SearchResponseBuilder(object):
         been built by this SearchResponseBuilder.
         """
         self._protoObject.next_page_token = pb.string(self._nextPageToken)
-        s = toJson(self._protoObject)
-        return s
+        if self._mimetype == PROTOBUF_MIMETYPE:
+            # Fields may appear in any order in the wire format, so the
+            # values can simply be followed by the rest of the message.
+            return b"".join(
+                self._fragments + [self._protoObject.SerializeToString()])
+        # The value list is empty in the envelope. We splice in the
+        # pre-rendered values in its place.
+        envelope = json_format._MessageToJsonObject(self._protoObject, True)
+        del envelope[self._valueListJsonName]
+        valueList = "{}: [{}]".format(
+            json.dumps(self._valueListJsonName), ", ".join(self._fragments))
+        otherFields = json.dumps(envelope)[1:-1]
+        if otherFields:
+            return "{" + valueList + ", " + otherFields + "}"
+        return "{" + valueList + "}"
 
 
 def getProtocolClasses(superclass=message.Message):
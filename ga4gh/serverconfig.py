@@ -19,7 +19,10 @@ class BaseConfig(object):
     MAX_RESPONSE_LENGTH = 1024 * 1024  # 1MB
     REQUEST_VALIDATION = True
     RESPONSE_VALIDATION = False
+    REQUEST_COALESCING = False
     DEFAULT_PAGE_SIZE = 100
+    MAX_BATCH_GET_SIZE = 1000
+    MAX_DENSITY_BINS = 10000
     DATA_SOURCE = "empty://"
 
     # Options for the simulated backend.
@@ -34,6 +37,30 @@ class BaseConfig(object):
 
     FILE_HANDLE_CACHE_MAX_SIZE = 50
 
+    CURSOR_CACHE_MAX_SIZE = 100
+    CURSOR_CACHE_TIME_TO_LIVE = 120  # seconds
+
+    RESPONSE_CACHE_MAX_SIZE = 64 * 1024 * 1024  # 64MB
+
+    RESPONSE_COMPRESSION_LEVEL = 6
+    RESPONSE_COMPRESSION_MIN_SIZE = 1024  # bytes
+
+    ASYNC_BACKEND_THREADS = 10
+
+    METRICS_DIRECTORY = None
+    METRICS_SNAPSHOT_INTERVAL = 1  # seconds
+
+    REQUEST_TIMING = False
+    ACCESS_LOG_FILE = None
+    SLOW_REQUEST_LOG_FILE = None
+    SLOW_REQUEST_THRESHOLD = 1  # seconds
+    SLOW_REQUEST_LOG_MAX_BYTES = 10 * 1024 * 1024  # 10MB
+    SLOW_REQUEST_LOG_BACKUP_COUNT = 5
+
+    PROFILE_KEY = None
+    PROFILE_DIRECTORY = None
+    PROFILE_NUM_ENTRIES = 30
+
     LANDING_MESSAGE_HTML = "landing_message.html"
 
 
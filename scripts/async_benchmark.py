@@ -0,0 +1,229 @@
+"""
+Benchmarks the asynchronous serving mode of the GA4GH reference server
+against the default WSGI server. For each mode a server is started on
+the specified data source, a number of idle keep-alive connections are
+opened to it, and then a fixed number of variant searches are run by a
+pool of concurrent clients. The throughput and the latency distribution
+of the searches are reported for each mode.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+import utils
+utils.ga4ghImportGlue()
+import ga4gh.protocol as protocol  # noqa
+
+
+configTemplate = """
+DATA_SOURCE = "{dataSource}"
+SIMULATED_BACKEND_NUM_CALLS = 10
+SIMULATED_BACKEND_VARIANT_DENSITY = 0.5
+# Every search must reach the backend
+RESPONSE_CACHE_MAX_SIZE = 0
+REQUEST_COALESCING = False
+ASYNC_BACKEND_THREADS = {numThreads}
+"""
+
+
+class ServerProcess(object):
+    """
+    A GA4GH server running in a subprocess.
+    """
+    def __init__(self, configFile, port, useAsync):
+        self.port = port
+        self.url = "http://127.0.0.1:{}".format(port)
+        serverDev = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            "server_dev.py")
+        cmd = [
+            sys.executable, serverDev, "--port", str(port),
+            "--config", "BaseConfig", "--config-file", configFile,
+            "--dont-use-reloader"]
+        if useAsync:
+            cmd.append("--async")
+        self.process = subprocess.Popen(cmd)
+
+    def waitUntilReady(self, timeout=60):
+        """
+        Waits until the server accepts requests.
+        """
+        startTime = time.time()
+        while time.time() - startTime < timeout:
+            if self.process.poll() is not None:
+                raise Exception("Server exited with status {}".format(
+                    self.process.returncode))
+            try:
+                requests.get(self.url, timeout=1)
+                return
+            except requests.exceptions.RequestException:
+                time.sleep(0.1)
+        raise Exception("Server did not start within {}s".format(timeout))
+
+    def shutdown(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def getVariantsRequest(url, referenceName, end):
+    """
+    Returns a search request for the variants in the first variant set
+    of the first dataset on the server at the specified URL.
+    """
+    response = requests.post(
+        url + "/datasets/search", data="{}",
+        headers={"Content-type": "application/json"})
+    datasetId = protocol.fromJson(
+        response.text, protocol.SearchDatasetsResponse).datasets[0].id
+    request = protocol.SearchVariantSetsRequest()
+    request.dataset_id = datasetId
+    response = requests.post(
+        url + "/variantsets/search", data=protocol.toJson(request),
+        headers={"Content-type": "application/json"})
+    variantSetId = protocol.fromJson(
+        response.text, protocol.SearchVariantSetsResponse).variant_sets[0].id
+    request = protocol.SearchVariantsRequest()
+    request.variant_set_id = variantSetId
+    request.reference_name = referenceName
+    request.start = 0
+    request.end = end
+    return request
+
+
+def openIdleConnections(port, numConnections):
+    """
+    Opens the specified number of client connections that never send a
+    request, standing in for idle keep-alive clients.
+    """
+    connections = []
+    for _ in range(numConnections):
+        connections.append(socket.create_connection(("127.0.0.1", port)))
+    return connections
+
+
+def runClients(url, request, numRequests, concurrency, timeout):
+    """
+    Runs the specified number of searches from the specified number of
+    concurrent clients, and returns (elapsed time, latencies, errors).
+    """
+    data = protocol.toJson(request)
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client(numClientRequests):
+        session = requests.Session()
+        session.headers.update({"Content-type": "application/json"})
+        for _ in range(numClientRequests):
+            startTime = time.time()
+            try:
+                response = session.post(
+                    url + "/variants/search", data=data, timeout=timeout)
+                response.raise_for_status()
+                with lock:
+                    latencies.append(time.time() - startTime)
+            except requests.exceptions.RequestException as exception:
+                with lock:
+                    errors.append(exception)
+
+    threads = []
+    for i in range(concurrency):
+        numClientRequests = numRequests // concurrency
+        if i < numRequests % concurrency:
+            numClientRequests += 1
+        threads.append(threading.Thread(
+            target=client, args=(numClientRequests,)))
+    startTime = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - startTime, latencies, errors
+
+
+def benchmarkMode(args, configFile, useAsync):
+    server = ServerProcess(configFile, args.port, useAsync)
+    try:
+        server.waitUntilReady()
+        request = getVariantsRequest(
+            server.url, args.referenceName, args.end)
+        idleConnections = openIdleConnections(
+            args.port, args.idleConnections)
+        try:
+            elapsedTime, latencies, errors = runClients(
+                server.url, request, args.numRequests, args.concurrency,
+                args.timeout)
+        finally:
+            for connection in idleConnections:
+                connection.close()
+    finally:
+        server.shutdown()
+    latencies.sort()
+    print("{:<6} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>8}".format(
+        "async" if useAsync else "wsgi", len(latencies) / elapsedTime,
+        utils.getPercentile(latencies, 50) * 1000,
+        utils.getPercentile(latencies, 95) * 1000,
+        utils.getPercentile(latencies, 100) * 1000, len(errors)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="GA4GH reference server asynchronous mode benchmark")
+    parser.add_argument(
+        "--dataSource", default="simulated://",
+        help="The data source to serve (default: %(default)s)")
+    parser.add_argument(
+        "--referenceName", default="1",
+        help="The reference to search for variants on")
+    parser.add_argument(
+        "--end", type=int, default=1000,
+        help="The end of the variant search window")
+    parser.add_argument(
+        "--numRequests", type=int, default=200, metavar='N',
+        help="The total number of searches (default: %(default)s)")
+    parser.add_argument(
+        "--concurrency", type=int, default=8, metavar='N',
+        help="The number of concurrent clients (default: %(default)s)")
+    parser.add_argument(
+        "--idleConnections", type=int, default=0, metavar='N',
+        help="The number of idle connections held open during the run. "
+             "The WSGI server handles one connection at a time, so it "
+             "times out on every search if this is non-zero.")
+    parser.add_argument(
+        "--numThreads", type=int, default=10, metavar='N',
+        help="The number of backend threads in asynchronous mode")
+    parser.add_argument(
+        "--timeout", type=float, default=30,
+        help="The timeout for each search in seconds")
+    parser.add_argument(
+        "--port", type=int, default=8765,
+        help="The port to run the servers on")
+    parser.add_argument(
+        "--mode", default="both", choices=["both", "wsgi", "async"],
+        help="The serving modes to benchmark")
+    args = parser.parse_args()
+
+    configFile = tempfile.NamedTemporaryFile(suffix=".py", delete=False)
+    configFile.write(configTemplate.format(
+        dataSource=args.dataSource, numThreads=args.numThreads))
+    configFile.close()
+    try:
+        print("{:<6} {:>10} {:>10} {:>10} {:>10} {:>8}".format(
+            "mode", "req/s", "p50 (ms)", "p95 (ms)", "max (ms)", "errors"))
+        if args.mode in ["both", "wsgi"]:
+            benchmarkMode(args, configFile.name, False)
+        if args.mode in ["both", "async"]:
+            benchmarkMode(args, configFile.name, True)
+    finally:
+        os.unlink(configFile.name)
@@ -0,0 +1,424 @@
+"""
+Micro-benchmarks for the functions that convert each record read from a
+data file into a protocol object, and for the other functions run once
+per returned object. Every benchmark calls a single function over a fixed
+list of inputs drawn from the files in tests/data, so that the effect of
+optimising one converter can be measured in isolation.
+
+For each benchmark we report the records converted per second, and the
+number of objects tracked by the garbage collector that are allocated per
+record. Python 2 has no tracemalloc, so the allocations are counted with
+the collector's own allocation counter, which is decremented when a
+tracked object is freed: with the collector disabled, it gives the net
+number of container objects (messages, lists, dicts and so on) that each
+call leaves alive, which here is the converted record.
+
+Run this from the root of the repository.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import collections
+import gc
+import json
+import re
+import sqlite3
+import sys
+import time
+
+import pysam
+
+import utils
+utils.ga4ghImportGlue()
+import ga4gh.datamodel as datamodel  # noqa
+import ga4gh.datamodel.datasets as datasets  # noqa
+import ga4gh.datamodel.ontologies as ontologies  # noqa
+import ga4gh.datamodel.reads as reads  # noqa
+import ga4gh.datamodel.sequenceAnnotations as sequenceAnnotations  # noqa
+import ga4gh.datamodel.variants as variants  # noqa
+import ga4gh.protocol as protocol  # noqa
+import ga4gh.sqliteBackend as sqliteBackend  # noqa
+
+
+testDataDir = "tests/data"
+variantsDir = testDataDir + "/datasets/dataset1/variants"
+vcfDir = variantsDir + "/1kgPhase1"
+annotationVcfDirs = collections.OrderedDict([
+    (variants.ANNOTATIONS_SNPEFF, variantsDir + "/WASH7P_annotation"),
+    (variants.ANNOTATIONS_VEP_V82, variantsDir + "/1KG_GRCh37_VEP_edit"),
+    (variants.ANNOTATIONS_VEP_V77, variantsDir + "/1kg.3.annotations"),
+])
+bamPath = testDataDir + "/datasets/dataset1/reads/chr17.1-250.bam"
+featuresPath = (
+    testDataDir + "/datasets/dataset1/sequenceAnnotations/gencodeV21Set1.db")
+ontologyPath = testDataDir + "/ontologies/so-xp-simple.obo"
+
+benchmarks = collections.OrderedDict()
+
+
+def benchmark(name):
+    """
+    Registers the decorated function as the benchmark with the specified
+    name. The function is called with the Fixtures, and returns the
+    function to benchmark and the list of argument tuples to call it with,
+    one per record.
+    """
+    def decorator(function):
+        benchmarks[name] = function
+        return function
+    return decorator
+
+
+class Fixtures(object):
+    """
+    The datamodel objects and input records used by the benchmarks, each
+    of which is loaded the first time it is needed.
+    """
+    def __init__(self, numRecords):
+        self.numRecords = numRecords
+        self._loaded = {}
+        self._dataset = datasets.Dataset("benchmark")
+
+    def _load(self, name, loader):
+        if name not in self._loaded:
+            self._loaded[name] = loader()
+        return self._loaded[name]
+
+    def _getPysamVariants(self, variantSet):
+        records = []
+        referenceNames = sorted(
+            variantSet.getReferenceToDataUrlIndexMap().keys())
+        for referenceName in referenceNames:
+            for record in variantSet.getPysamVariants(
+                    referenceName, 0, 2**31):
+                records.append(record)
+                if len(records) == self.numRecords:
+                    return records
+        return records
+
+    def getOntology(self):
+        def loader():
+            ontology = ontologies.Ontology("so-xp-simple")
+            ontology.populateFromFile(ontologyPath)
+            return ontology
+        return self._load("ontology", loader)
+
+    def getVariantSet(self):
+        def loader():
+            variantSet = variants.HtslibVariantSet(self._dataset, "variants")
+            variantSet.populateFromDirectory(vcfDir)
+            return variantSet
+        return self._load("variantSet", loader)
+
+    def getVariantRecords(self):
+        return self._load("variantRecords", lambda: self._getPysamVariants(
+            self.getVariantSet()))
+
+    def getVariants(self):
+        def loader():
+            variantSet = self.getVariantSet()
+            callSetIds = [
+                callSet.getId() for callSet in variantSet.getCallSets()]
+            return [
+                variantSet.convertVariant(record, callSetIds)
+                for record in self.getVariantRecords()]
+        return self._load("variants", loader)
+
+    def getVariantAnnotationSet(self, annotationType):
+        def loader():
+            variantSet = variants.HtslibVariantSet(
+                self._dataset, annotationType)
+            variantSet.populateFromDirectory(
+                annotationVcfDirs[annotationType])
+            annotationSet = variantSet.getVariantAnnotationSets()[0]
+            annotationSet.setOntology(self.getOntology())
+            return annotationSet
+        return self._load("annotationSet" + annotationType, loader)
+
+    def getAnnotationRecords(self, annotationType):
+        return self._load(
+            "annotationRecords" + annotationType,
+            lambda: self._getPysamVariants(
+                self.getVariantAnnotationSet(annotationType)._variantSet))
+
+    def getReadGroupSet(self):
+        def loader():
+            readGroupSet = reads.HtslibReadGroupSet(self._dataset, "reads")
+            readGroupSet.populateFromFile(bamPath)
+            return readGroupSet
+        return self._load("readGroupSet", loader)
+
+    def getReadRecords(self):
+        def loader():
+            alignmentFile = pysam.AlignmentFile(bamPath)
+            records = []
+            for read in alignmentFile.fetch(until_eof=True):
+                records.append(read)
+                if len(records) == self.numRecords:
+                    break
+            alignmentFile.close()
+            return records
+        return self._load("readRecords", loader)
+
+    def getReadAlignments(self):
+        def loader():
+            readGroupSet = self.getReadGroupSet()
+            readGroupId = readGroupSet.getReadGroups()[0].getId()
+            return [
+                readGroupSet.convertReadAlignment(
+                    read, readGroupSet, readGroupId)
+                for read in self.getReadRecords()]
+        return self._load("readAlignments", loader)
+
+    def getFeatureSet(self):
+        def loader():
+            featureSet = sequenceAnnotations.Gff3DbFeatureSet(
+                self._dataset, "features")
+            featureSet.setOntology(self.getOntology())
+            featureSet.populateFromFile(featuresPath)
+            return featureSet
+        return self._load("featureSet", loader)
+
+    def getFeatureRecords(self):
+        def loader():
+            connection = sqlite3.connect(featuresPath)
+            connection.row_factory = sqlite3.Row
+            query = connection.execute(
+                "SELECT * FROM FEATURE LIMIT ?", (self.numRecords,))
+            records = sqliteBackend.sqliteRows2dicts(query.fetchall())
+            connection.close()
+            return records
+        return self._load("featureRecords", loader)
+
+
+def _getTranscriptConverter(annotationSet):
+    """
+    Returns the transcript effect converter that the specified annotation
+    set uses for its type of annotations.
+    """
+    annotationType = annotationSet.getAnnotationType()
+    if annotationType == variants.ANNOTATIONS_SNPEFF:
+        return annotationSet.convertTranscriptEffectSnpEff
+    elif annotationType == variants.ANNOTATIONS_VEP_V82:
+        return annotationSet.convertTranscriptEffectVEP
+    return annotationSet.convertTranscriptEffectCSQ
+
+
+def _getTranscriptConverterArguments(fixtures, annotationType):
+    """
+    Returns the (annotation string, HGVS.g) argument tuples for each
+    transcript annotation in the records of the specified type.
+    """
+    if annotationType == variants.ANNOTATIONS_VEP_V77:
+        infoKey = b"CSQ"
+    else:
+        infoKey = b"ANN"
+    arguments = []
+    for record in fixtures.getAnnotationRecords(annotationType):
+        annotations = record.info.get(infoKey)
+        if annotations is not None:
+            arguments.extend((annotation, "") for annotation in annotations)
+    return arguments
+
+
+@benchmark("convertVariant")
+def convertVariant(fixtures):
+    variantSet = fixtures.getVariantSet()
+    callSetIds = [callSet.getId() for callSet in variantSet.getCallSets()]
+    return variantSet.convertVariant, [
+        (record, callSetIds) for record in fixtures.getVariantRecords()]
+
+
+@benchmark("convertVariantNoCalls")
+def convertVariantNoCalls(fixtures):
+    variantSet = fixtures.getVariantSet()
+    return variantSet.convertVariant, [
+        (record, []) for record in fixtures.getVariantRecords()]
+
+
+@benchmark("convertGaCalls")
+def convertGaCalls(fixtures):
+    variantSet = fixtures.getVariantSet()
+    callSetIds = [callSet.getId() for callSet in variantSet.getCallSets()]
+
+    def function(record):
+        variantSet._convertGaCalls(protocol.Variant(), record, callSetIds)
+    return function, [(record,) for record in fixtures.getVariantRecords()]
+
+
+@benchmark("convertReadAlignment")
+def convertReadAlignment(fixtures):
+    readGroupSet = fixtures.getReadGroupSet()
+    readGroupId = readGroupSet.getReadGroups()[0].getId()
+    return readGroupSet.convertReadAlignment, [
+        (read, readGroupSet, readGroupId)
+        for read in fixtures.getReadRecords()]
+
+
+def _addAnnotationBenchmarks(annotationType):
+    """
+    Registers the benchmarks for the conversion of annotations of the
+    specified type.
+    """
+    @benchmark("convertVariantAnnotation[{}]".format(annotationType))
+    def convertVariantAnnotation(fixtures):
+        annotationSet = fixtures.getVariantAnnotationSet(annotationType)
+        transcriptConverter = _getTranscriptConverter(annotationSet)
+        return annotationSet.convertVariantAnnotation, [
+            (record, transcriptConverter)
+            for record in fixtures.getAnnotationRecords(annotationType)]
+
+    @benchmark("convertTranscriptEffect[{}]".format(annotationType))
+    def convertTranscriptEffect(fixtures):
+        annotationSet = fixtures.getVariantAnnotationSet(annotationType)
+        return (
+            _getTranscriptConverter(annotationSet),
+            _getTranscriptConverterArguments(fixtures, annotationType))
+
+
+for _annotationType in annotationVcfDirs.keys():
+    _addAnnotationBenchmarks(_annotationType)
+
+
+@benchmark("gaFeatureForFeatureDbRecord")
+def gaFeatureForFeatureDbRecord(fixtures):
+    featureSet = fixtures.getFeatureSet()
+    return featureSet._gaFeatureForFeatureDbRecord, [
+        (record,) for record in fixtures.getFeatureRecords()]
+
+
+@benchmark("VariantCompoundId.parse")
+def parseVariantCompoundId(fixtures):
+    return datamodel.VariantCompoundId.parse, [
+        (variant.id,) for variant in fixtures.getVariants()]
+
+
+@benchmark("VariantCompoundId.__str__")
+def formatVariantCompoundId(fixtures):
+    return str, [
+        (datamodel.VariantCompoundId.parse(variant.id),)
+        for variant in fixtures.getVariants()]
+
+
+@benchmark("ReadAlignmentCompoundId.parse")
+def parseReadAlignmentCompoundId(fixtures):
+    return datamodel.ReadAlignmentCompoundId.parse, [
+        (alignment.id,) for alignment in fixtures.getReadAlignments()]
+
+
+@benchmark("toJson[Variant]")
+def variantToJson(fixtures):
+    return protocol.toJson, [
+        (variant,) for variant in fixtures.getVariants()]
+
+
+@benchmark("toJson[ReadAlignment]")
+def readAlignmentToJson(fixtures):
+    return protocol.toJson, [
+        (alignment,) for alignment in fixtures.getReadAlignments()]
+
+
+def timeCalls(function, arguments, repeat):
+    """
+    Returns the shortest time taken over the specified number of repeats
+    to call the specified function with each of the argument tuples.
+    """
+    times = []
+    for _ in range(repeat):
+        startTime = time.time()
+        for args in arguments:
+            function(*args)
+        times.append(time.time() - startTime)
+    return min(times)
+
+
+def countAllocations(function, arguments):
+    """
+    Returns the net number of objects tracked by the garbage collector
+    that are allocated by calling the specified function with each of the
+    argument tuples, keeping the results alive.
+    """
+    results = [None] * len(arguments)
+    gc.collect()
+    gc.disable()
+    try:
+        startCount = gc.get_count()[0]
+        for i, args in enumerate(arguments):
+            results[i] = function(*args)
+        count = gc.get_count()[0] - startCount
+    finally:
+        gc.enable()
+    return count
+
+
+def runBenchmarks(args):
+    """
+    Runs the selected benchmarks, and returns the results document.
+    """
+    fixtures = Fixtures(args.numRecords)
+    results = collections.OrderedDict()
+    for name, builder in benchmarks.items():
+        if args.benchmarks is not None and not re.search(
+                args.benchmarks, name):
+            continue
+        function, arguments = builder(fixtures)
+        if len(arguments) == 0:
+            results[name] = {"skipped": "no records"}
+            print("{:<45} skipped: no records".format(name), file=sys.stderr)
+            continue
+        elapsedTime = timeCalls(function, arguments, args.repeat)
+        allocations = countAllocations(function, arguments)
+        result = collections.OrderedDict([
+            ("records", len(arguments)),
+            ("recordsPerSecond", len(arguments) / elapsedTime),
+            ("microsecondsPerRecord", elapsedTime / len(arguments) * 1e6),
+            ("allocationsPerRecord", allocations / len(arguments)),
+        ])
+        results[name] = result
+        print("{:<45} {:>12.0f}/s {:>10.2f}us {:>8.1f} allocs".format(
+            name, result["recordsPerSecond"],
+            result["microsecondsPerRecord"],
+            result["allocationsPerRecord"]), file=sys.stderr)
+    return collections.OrderedDict([
+        ("settings", collections.OrderedDict([
+            ("numRecords", args.numRecords),
+            ("repeat", args.repeat),
+        ])),
+        ("results", results),
+    ])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="GA4GH reference server converter micro-benchmarks")
+    parser.add_argument(
+        "--benchmarks", default=None, metavar="REGEX",
+        help="Only run the benchmarks whose names match this expression")
+    parser.add_argument(
+        "--list", action="store_true",
+        help="List the benchmarks and exit")
+    parser.add_argument(
+        "--numRecords", type=int, default=1000, metavar="N",
+        help="The maximum number of records from each test file "
+             "(default: %(default)s)")
+    parser.add_argument(
+        "--repeat", type=int, default=5, metavar="N",
+        help="How many times to time each benchmark; the fastest time is "
+             "reported (default: %(default)s)")
+    parser.add_argument(
+        "--output", default=None,
+        help="Write the results to this file as well as to standard output")
+    args = parser.parse_args()
+
+    if args.list:
+        for name in benchmarks.keys():
+            print(name)
+        sys.exit(0)
+    results = runBenchmarks(args)
+    resultsJson = json.dumps(results, indent=2)
+    print(resultsJson)
+    if args.output is not None:
+        with open(args.output, "w") as outputFile:
+            outputFile.write(resultsJson + "\n")
@@ -0,0 +1,531 @@
+"""
+Generates load against a running GA4GH server using the HTTP client.
+A weighted mix of request templates is replayed by a pool of worker
+threads, each with its own HttpClient, either as fast as the server
+allows (a fixed concurrency) or at a target rate. The throughput,
+latency percentiles, error rates and bytes received are reported.
+
+With --ramp, the load is run in stages of increasing concurrency or
+rate, which shows where the server saturates: the point beyond which
+more load no longer buys more throughput, and only adds latency.
+
+The request templates are read from a JSON file (see --templates) with
+the form
+
+    [
+        {
+            "name": "variants",
+            "weight": 4,
+            "method": "searchVariants",
+            "arguments": {
+                "variantSetId": "{variantSetId}",
+                "referenceName": "1", "start": 0, "end": 100000
+            }
+        },
+        ...
+    ]
+
+where method is a search or get method of ga4gh.client.HttpClient, and
+string arguments may refer to the IDs discovered on the server:
+{datasetId}, {variantSetId}, {callSetId}, {variantId}, {readGroupSetId},
+{readGroupId}, {referenceSetId}, {referenceId}, {featureSetId} and
+{variantAnnotationSetId}. Without --templates, a mix of the variant,
+read and metadata requests supported by the server is used.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import collections
+import json
+import logging
+import random
+import threading
+import time
+
+import utils
+utils.ga4ghImportGlue()
+import ga4gh.client as client  # noqa
+import ga4gh.protocol as protocol  # noqa
+import tests.end_to_end.server as server  # noqa
+
+
+class RequestTemplate(object):
+    """
+    A request made by the load generator: a method of the HttpClient and
+    the arguments to call it with.
+    """
+    def __init__(self, name, weight, method, arguments):
+        self.name = name
+        self.weight = weight
+        self.method = method
+        self.arguments = arguments
+
+    def getArguments(self, ids):
+        """
+        Returns the arguments of this request with the references to the
+        specified discovered IDs filled in.
+        """
+        arguments = {}
+        for key, value in self.arguments.items():
+            if isinstance(value, basestring):
+                value = value.format(**ids)
+            elif isinstance(value, list):
+                value = [
+                    item.format(**ids) if isinstance(item, basestring)
+                    else item for item in value]
+            arguments[key] = value
+        return arguments
+
+    def run(self, httpClient, arguments):
+        """
+        Runs this request with the specified client, reading all pages
+        of the results of searches.
+        """
+        result = getattr(httpClient, self.method)(**arguments)
+        if isinstance(result, collections.Iterator):
+            for _ in result:
+                pass
+
+
+def _getFirst(iterator):
+    for value in iterator:
+        return value
+    return None
+
+
+def discoverIds(httpClient, referenceName, start, end):
+    """
+    Returns the IDs of the first objects of each type on the server,
+    which the request templates may refer to. The IDs of objects the
+    server does not have are omitted.
+    """
+    ids = {}
+    dataset = _getFirst(httpClient.searchDatasets())
+    if dataset is None:
+        raise Exception("The server has no datasets")
+    ids["datasetId"] = dataset.id
+    variantSet = _getFirst(httpClient.searchVariantSets(dataset.id))
+    if variantSet is not None:
+        ids["variantSetId"] = variantSet.id
+        callSet = _getFirst(httpClient.searchCallSets(variantSet.id))
+        if callSet is not None:
+            ids["callSetId"] = callSet.id
+        variant = _getFirst(httpClient.searchVariants(
+            variantSet.id, start, end, referenceName, []))
+        if variant is not None:
+            ids["variantId"] = variant.id
+        annotationSet = _getFirst(
+            httpClient.searchVariantAnnotationSets(variantSet.id))
+        if annotationSet is not None:
+            ids["variantAnnotationSetId"] = annotationSet.id
+    referenceSetId = None
+    readGroupSet = _getFirst(httpClient.searchReadGroupSets(dataset.id))
+    if readGroupSet is not None:
+        ids["readGroupSetId"] = readGroupSet.id
+        if len(readGroupSet.read_groups) > 0:
+            readGroup = readGroupSet.read_groups[0]
+            ids["readGroupId"] = readGroup.id
+            # Search for reads on a reference the read group is aligned to
+            referenceSetId = readGroup.reference_set_id or None
+    if referenceSetId is None:
+        referenceSet = _getFirst(httpClient.searchReferenceSets())
+        if referenceSet is not None:
+            referenceSetId = referenceSet.id
+    if referenceSetId is not None:
+        ids["referenceSetId"] = referenceSetId
+        reference = _getFirst(httpClient.searchReferences(referenceSetId))
+        if reference is not None:
+            ids["referenceId"] = reference.id
+    featureSet = _getFirst(httpClient.searchFeatureSets(dataset.id))
+    if featureSet is not None:
+        ids["featureSetId"] = featureSet.id
+    return ids
+
+
+def getDefaultTemplates(ids, referenceName, start, end):
+    """
+    Returns the default mix of requests, using the objects that are
+    available on the server.
+    """
+    templates = [
+        RequestTemplate("datasets", 1, "searchDatasets", {}),
+    ]
+    if "variantSetId" in ids:
+        templates.extend([
+            RequestTemplate("variants", 4, "searchVariants", {
+                "variantSetId": "{variantSetId}",
+                "referenceName": referenceName, "start": start,
+                "end": end, "callSetIds": []}),
+            RequestTemplate("callsets", 1, "searchCallSets", {
+                "variantSetId": "{variantSetId}"}),
+        ])
+    if "callSetId" in ids:
+        templates.append(RequestTemplate(
+            "variantsWithCalls", 2, "searchVariants", {
+                "variantSetId": "{variantSetId}",
+                "referenceName": referenceName, "start": start,
+                "end": end, "callSetIds": ["{callSetId}"]}))
+    if "variantId" in ids:
+        templates.append(RequestTemplate(
+            "getVariant", 2, "getVariant", {"variantId": "{variantId}"}))
+    if "readGroupId" in ids and "referenceId" in ids:
+        templates.append(RequestTemplate("reads", 2, "searchReads", {
+            "readGroupIds": ["{readGroupId}"],
+            "referenceId": "{referenceId}", "start": start, "end": end}))
+    if "featureSetId" in ids:
+        templates.append(RequestTemplate("features", 1, "searchFeatures", {
+            "featureSetId": "{featureSetId}",
+            "referenceName": referenceName, "start": start, "end": end}))
+    return templates
+
+
+def loadTemplates(templatesFile):
+    """
+    Returns the request templates in the specified JSON file.
+    """
+    with open(templatesFile) as templatesStream:
+        entries = json.load(templatesStream)
+    return [
+        RequestTemplate(
+            entry.get("name", entry["method"]), entry.get("weight", 1),
+            entry["method"], entry.get("arguments", {}))
+        for entry in entries]
+
+
+class StageResults(object):
+    """
+    The outcomes of the requests made in one stage of a load test.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.defaultdict(collections.Counter)
+        self.bytesReceived = 0
+        self.elapsedTime = 0
+
+    def addLatency(self, name, latency):
+        with self._lock:
+            self.latencies[name].append(latency)
+
+    def addError(self, name, exception):
+        with self._lock:
+            self.errors[name][type(exception).__name__] += 1
+
+    def addBytesReceived(self, bytesReceived):
+        with self._lock:
+            self.bytesReceived += bytesReceived
+
+    def getSummary(self, name=None):
+        """
+        Returns the summary statistics for the requests made using the
+        template with the specified name, or for all requests.
+        """
+        if name is None:
+            latencies = sum(self.latencies.values(), [])
+            errors = collections.Counter()
+            for counter in self.errors.values():
+                errors.update(counter)
+        else:
+            latencies = self.latencies[name]
+            errors = self.errors[name]
+        latencies.sort()
+        numErrors = sum(errors.values())
+        numRequests = len(latencies) + numErrors
+        summary = collections.OrderedDict([
+            ("requests", numRequests),
+            ("requestsPerSecond", len(latencies) / self.elapsedTime),
+            ("errorRate", numErrors / numRequests if numRequests else 0),
+            ("errors", dict(errors)),
+        ])
+        for percentile in [50, 90, 99, 100]:
+            summary["p{}Ms".format(percentile)] = utils.getPercentile(
+                latencies, percentile) * 1000
+        if name is None:
+            summary["bytesReceived"] = self.bytesReceived
+            summary["bytesPerSecond"] = self.bytesReceived / self.elapsedTime
+        return summary
+
+
+def runStage(args, templates, ids, concurrency, rate, duration):
+    """
+    Runs the request templates from the specified number of workers for
+    the specified number of seconds, and returns the StageResults. If a
+    rate is specified, requests are started on a fixed schedule at that
+    rate, and each latency is measured from the time the request was due
+    to start so that requests delayed by a saturated server are counted
+    as slow rather than as missing.
+    """
+    results = StageResults()
+    names = [template.name for template in templates]
+    weights = [template.weight for template in templates]
+    arguments = [template.getArguments(ids) for template in templates]
+    schedule = {"next": 0}
+    scheduleLock = threading.Lock()
+    startTime = time.time()
+    endTime = startTime + duration
+
+    def getDueTime():
+        if rate is None:
+            now = time.time()
+            return None if now >= endTime else now
+        with scheduleLock:
+            dueTime = startTime + schedule["next"] / rate
+            schedule["next"] += 1
+        if dueTime >= endTime:
+            return None
+        delay = dueTime - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        return dueTime
+
+    def worker(seed):
+        randomGenerator = random.Random(seed)
+        httpClient = client.HttpClient(
+            args.url, logLevel=logging.CRITICAL, authenticationKey=args.key,
+            mimetype=args.mimetype)
+        httpClient.setPageSize(args.pageSize)
+        while True:
+            dueTime = getDueTime()
+            if dueTime is None:
+                break
+            index = weightedChoice(randomGenerator, weights)
+            try:
+                templates[index].run(httpClient, arguments[index])
+                results.addLatency(names[index], time.time() - dueTime)
+            except Exception as exception:
+                results.addError(names[index], exception)
+        results.addBytesReceived(httpClient.getProtocolBytesReceived())
+
+    threads = [
+        threading.Thread(target=worker, args=(args.seed + i,))
+        for i in range(concurrency)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.elapsedTime = time.time() - startTime
+    return results
+
+
+def weightedChoice(randomGenerator, weights):
+    """
+    Returns the index of an item chosen at random with the specified
+    weights.
+    """
+    value = randomGenerator.uniform(0, sum(weights))
+    for index, weight in enumerate(weights):
+        value -= weight
+        if value < 0:
+            return index
+    return len(weights) - 1
+
+
+def printSummaryHeader(label):
+    print("{:<18} {:>9} {:>9} {:>8} {:>9} {:>9} {:>9} {:>9} {:>10}".format(
+        label, "requests", "req/s", "errors", "p50 (ms)", "p90 (ms)",
+        "p99 (ms)", "max (ms)", "KB/s"))
+
+
+def printSummary(label, summary):
+    bytesPerSecond = summary.get("bytesPerSecond")
+    print(
+        "{:<18} {:>9} {:>9.1f} {:>7.1f}% {:>9.1f} {:>9.1f} {:>9.1f} "
+        "{:>9.1f} {:>10}".format(
+            label, summary["requests"], summary["requestsPerSecond"],
+            summary["errorRate"] * 100, summary["p50Ms"],
+            summary["p90Ms"], summary["p99Ms"], summary["p100Ms"],
+            "" if bytesPerSecond is None else
+            "{:.1f}".format(bytesPerSecond / 1024)))
+
+
+def findSaturationLevel(stages, minGain, byRate):
+    """
+    Returns the level of the first stage at which the server was
+    saturated, or None. Ramping by concurrency, the server is saturated
+    when the throughput grows by less than the specified fraction over
+    the previous stage; ramping by rate, when the throughput falls short
+    of the target rate by more than the specified fraction.
+    """
+    previousThroughput = None
+    for stage in stages:
+        throughput = stage["summary"]["requestsPerSecond"]
+        if byRate:
+            if throughput < stage["level"] * (1 - minGain):
+                return stage["level"]
+        elif (previousThroughput is not None and
+                throughput < previousThroughput * (1 + minGain)):
+            return stage["level"]
+        previousThroughput = throughput
+    return None
+
+
+def runLoadTest(args):
+    """
+    Runs the load test described by the specified arguments, and
+    returns the results document.
+    """
+    httpClient = client.HttpClient(
+        args.url, logLevel=logging.CRITICAL, authenticationKey=args.key,
+        mimetype=args.mimetype)
+    ids = discoverIds(httpClient, args.referenceName, args.start, args.end)
+    if args.templates is None:
+        templates = getDefaultTemplates(
+            ids, args.referenceName, args.start, args.end)
+    else:
+        templates = loadTemplates(args.templates)
+    byRate = args.rampBy == "rate"
+    if args.ramp is None:
+        stageSettings = [(args.concurrency, args.rate)]
+    elif byRate:
+        stageSettings = [(args.concurrency, level) for level in args.ramp]
+    else:
+        stageSettings = [(level, args.rate) for level in args.ramp]
+    if args.warmup > 0:
+        concurrency, rate = stageSettings[0]
+        runStage(args, templates, ids, concurrency, rate, args.warmup)
+
+    stages = []
+    printSummaryHeader("concurrency/rate")
+    for concurrency, rate in stageSettings:
+        results = runStage(
+            args, templates, ids, concurrency, rate, args.duration)
+        summary = results.getSummary()
+        label = "{}/{}".format(concurrency, "-" if rate is None else rate)
+        printSummary(label, summary)
+        stages.append(collections.OrderedDict([
+            ("concurrency", concurrency),
+            ("rate", rate),
+            ("level", rate if byRate else concurrency),
+            ("summary", summary),
+            ("requests", collections.OrderedDict(
+                (template.name, results.getSummary(template.name))
+                for template in templates)),
+        ]))
+    if args.ramp is None:
+        print()
+        printSummaryHeader("request")
+        for name, summary in stages[0]["requests"].items():
+            printSummary(name, summary)
+    document = collections.OrderedDict([
+        ("url", args.url),
+        ("ids", ids),
+        ("templates", [template.__dict__ for template in templates]),
+        ("stages", stages),
+    ])
+    if args.ramp is not None:
+        saturationLevel = findSaturationLevel(
+            stages, args.saturationGain, byRate)
+        document["saturationLevel"] = saturationLevel
+        best = max(
+            stages, key=lambda stage: stage["summary"]["requestsPerSecond"])
+        print()
+        print("Peak throughput {:.1f} req/s at {} {}".format(
+            best["summary"]["requestsPerSecond"], args.rampBy,
+            best["level"]))
+        if saturationLevel is None:
+            print("The server did not saturate")
+        else:
+            print("Saturated at {} {}".format(args.rampBy, saturationLevel))
+    return document
+
+
+def parseLevels(levels):
+    return [int(level) for level in levels.split(",")]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Generate load against a GA4GH server")
+    parser.add_argument(
+        "url", nargs="?", default=None,
+        help="The URL of the server; required unless --startServer is "
+             "given")
+    parser.add_argument(
+        "--startServer", action="store_true",
+        help="Start a local test server (see tests/end_to_end/server.py) "
+             "for the duration of the run")
+    parser.add_argument(
+        "--dataSource", default=None,
+        help="The data source of the server started by --startServer "
+             "(default: simulated data)")
+    parser.add_argument(
+        "--templates", default=None,
+        help="A JSON file of weighted request templates")
+    parser.add_argument(
+        "--concurrency", type=int, default=8, metavar="N",
+        help="The number of concurrent workers (default: %(default)s)")
+    parser.add_argument(
+        "--rate", type=float, default=None, metavar="R",
+        help="Start requests at this many per second, rather than as fast "
+             "as the workers can make them")
+    parser.add_argument(
+        "--ramp", type=parseLevels, default=None, metavar="L1,L2,...",
+        help="Run a stage at each of these levels of concurrency (or rate, "
+             "with --rampBy rate) to find the saturation point")
+    parser.add_argument(
+        "--rampBy", default="concurrency", choices=["concurrency", "rate"],
+        help="What the --ramp levels set (default: %(default)s)")
+    parser.add_argument(
+        "--saturationGain", type=float, default=0.1, metavar="F",
+        help="The server is taken to be saturated when a stage gains less "
+             "than this fraction of throughput over the previous stage, "
+             "or falls short of its target rate by more than this fraction "
+             "(default: %(default)s)")
+    parser.add_argument(
+        "--duration", type=float, default=30, metavar="SECONDS",
+        help="The length of each stage (default: %(default)s)")
+    parser.add_argument(
+        "--warmup", type=float, default=5, metavar="SECONDS",
+        help="The length of an unreported warm-up run at the first level "
+             "(default: %(default)s)")
+    parser.add_argument(
+        "--referenceName", default="1",
+        help="The reference searched by the default templates")
+    parser.add_argument(
+        "--start", type=int, default=0,
+        help="The start of the window searched by the default templates")
+    parser.add_argument(
+        "--end", type=int, default=10000,
+        help="The end of the window searched by the default templates")
+    parser.add_argument(
+        "--pageSize", type=int, default=None,
+        help="The page size requested by the workers")
+    parser.add_argument(
+        "--mimetype", default=protocol.PROTOBUF_MIMETYPE,
+        choices=[protocol.PROTOBUF_MIMETYPE, protocol.JSON_MIMETYPE],
+        help="The wire format of the requests (default: %(default)s)")
+    parser.add_argument(
+        "--key", default=None,
+        help="The authentication key to send with each request")
+    parser.add_argument(
+        "--seed", type=int, default=0,
+        help="The seed for the choice of requests (default: %(default)s)")
+    parser.add_argument(
+        "--output", default=None,
+        help="Write the results to this file as JSON")
+    args = parser.parse_args()
+
+    testServer = None
+    if args.startServer:
+        if args.dataSource is None:
+            testServer = server.Ga4ghServerForTesting()
+        else:
+            testServer = server.Ga4ghServerForTestingDataSource(
+                args.dataSource)
+        testServer.start()
+        args.url = testServer.getUrl()
+    elif args.url is None:
+        parser.error("A server URL or --startServer is required")
+    logging.getLogger("requests").setLevel(logging.CRITICAL)
+    try:
+        document = runLoadTest(args)
+    finally:
+        if testServer is not None:
+            testServer.shutdown()
+    if args.output is not None:
+        with open(args.output, "w") as outputFile:
+            json.dump(document, outputFile, indent=2)
+            outputFile.write("\n")
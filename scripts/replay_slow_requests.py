@@ -0,0 +1,127 @@
+"""
+Replays the requests captured in the slow request log of a GA4GH
+reference server (see SLOW_REQUEST_LOG_FILE) against a data repository,
+running the backend under cProfile. The time taken by each request when
+it was logged and when it was replayed is reported, followed by the
+profile of all of the replayed requests.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import cProfile
+import json
+import pstats
+import time
+
+import utils
+utils.ga4ghImportGlue()
+import ga4gh.backend as backend  # noqa
+import ga4gh.datarepo as datarepo  # noqa
+import ga4gh.exceptions as exceptions  # noqa
+import ga4gh.protocol as protocol  # noqa
+
+
+def readSlowRequests(logFiles):
+    """
+    Yields the entries of the specified slow request logs.
+    """
+    for logFile in logFiles:
+        with open(logFile) as logStream:
+            for line in logStream:
+                if line.strip() != "":
+                    yield json.loads(line)
+
+
+def replayRequest(theBackend, entry):
+    """
+    Runs the request in the specified slow request log entry against the
+    specified backend, returning the JSON response.
+    """
+    endpoint = getattr(theBackend, entry["endpoint"])
+    if "id" in entry:
+        return endpoint(entry["id"], protocol.JSON_MIMETYPE)
+    fieldMask = None
+    if entry["fields"] is not None:
+        fieldMask = protocol.FieldMask.parse(entry["fields"])
+    return endpoint(
+        entry["request"], protocol.JSON_MIMETYPE, protocol.JSON_MIMETYPE,
+        fieldMask)
+
+
+def replaySlowRequests(theBackend, entries, repeat, profiler):
+    """
+    Replays the specified slow request log entries the specified number
+    of times, profiling them with the specified profiler.
+    """
+    print("{:>4} {:<30} {:>8} {:>12} {:>12}".format(
+        "#", "endpoint", "status", "logged (ms)", "replay (ms)"))
+    for i, entry in enumerate(entries):
+        status = "ok"
+        replayTimes = []
+        for _ in range(repeat):
+            startTime = time.time()
+            profiler.enable()
+            try:
+                replayRequest(theBackend, entry)
+            except exceptions.BaseServerException as exception:
+                status = str(exception.httpStatus)
+            finally:
+                profiler.disable()
+            replayTimes.append(time.time() - startTime)
+        print("{:>4} {:<30} {:>8} {:>12.1f} {:>12.1f}".format(
+            i, entry["endpoint"], status, entry["durationMs"],
+            min(replayTimes) * 1000))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Replay a GA4GH server slow request log under cProfile")
+    parser.add_argument(
+        "registryPath",
+        help="The data repository the logged requests were made against")
+    parser.add_argument(
+        "logFiles", nargs="+",
+        help="The slow request logs to replay")
+    parser.add_argument(
+        "--endpoint", default=None,
+        help="Only replay the requests to this backend endpoint, such as "
+             "runSearchVariants")
+    parser.add_argument(
+        "--limit", type=int, default=None, metavar='N',
+        help="Only replay the N slowest logged requests")
+    parser.add_argument(
+        "--repeat", type=int, default=1, metavar='N',
+        help="How many times to replay each request (default: %(default)s)")
+    parser.add_argument(
+        "--sort", default="cumulative",
+        help="The key to sort the profile by (default: %(default)s)")
+    parser.add_argument(
+        "--numStats", type=int, default=30, metavar='N',
+        help="The number of profile entries to print (default: "
+             "%(default)s)")
+    parser.add_argument(
+        "--profileFile", default=None,
+        help="Write the profile to this file, for use with tools such as "
+             "snakeviz or gprof2dot")
+    args = parser.parse_args()
+
+    entries = list(readSlowRequests(args.logFiles))
+    if args.endpoint is not None:
+        entries = [
+            entry for entry in entries if entry["endpoint"] == args.endpoint]
+    if args.limit is not None:
+        entries.sort(key=lambda entry: entry["durationMs"], reverse=True)
+        entries = entries[:args.limit]
+    repo = datarepo.SqlDataRepository(args.registryPath)
+    repo.open(datarepo.MODE_READ)
+    theBackend = backend.Backend(repo)
+    profiler = cProfile.Profile()
+    replaySlowRequests(theBackend, entries, args.repeat, profiler)
+    if len(entries) > 0:
+        stats = pstats.Stats(profiler)
+        stats.sort_stats(args.sort)
+        stats.print_stats(args.numStats)
+        if args.profileFile is not None:
+            stats.dump_stats(args.profileFile)
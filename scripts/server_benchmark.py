@@ -1,181 +1,678 @@
 """
-Stand-alone benchmark for the GA4GH reference implementation.
+Benchmark suite for the GA4GH reference server backend.
+
+Each named scenario repeatedly runs a single search or get request against
+a Backend, and the throughput and latency percentiles of every scenario
+are reported as JSON. The scenarios run against a simulated data
+repository, whose contents are fixed by the random seed, and against the
+test data repository built by scripts/build_test_data.py. The results of a
+previous run can be given as a baseline, in which case any scenario whose
+latency has grown by more than the tolerance is reported as a regression
+and the script exits with a non-zero status.
+
+Run this from the root of the repository, so that the paths in the test
+data repository resolve.
 """
 from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import argparse
+import collections
+import json
+import platform
 import re
+import sys
 import time
-import pstats
-import argparse
-import cProfile
-
-import guppy
 
 import utils
 utils.ga4ghImportGlue()
 import ga4gh.backend as backend  # noqa
-import ga4gh.protocol as protocol  # noqa
 import ga4gh.datarepo as datarepo  # noqa
+import ga4gh.protocol as protocol  # noqa
+
+
+class SkipScenario(Exception):
+    """
+    Raised when a scenario cannot be run against a data repository because
+    the repository does not hold the data it needs.
+    """
+
+
+scenarios = collections.OrderedDict()
+
+
+def scenario(name):
+    """
+    Registers the decorated function as the scenario with the specified
+    name. The function is called with the BenchmarkData for a repository,
+    and returns the backend function to benchmark followed by its
+    arguments.
+    """
+    def decorator(function):
+        scenarios[name] = function
+        return function
+    return decorator
+
+
+class BenchmarkData(object):
+    """
+    The backend for a data repository, and the objects in the repository
+    that the scenarios make requests for. Objects are found the first
+    time they are needed.
+    """
+    def __init__(self, dataRepository, pageSize, deepPages):
+        self.backend = backend.Backend(dataRepository)
+        self.repository = dataRepository
+        self.pageSize = pageSize
+        self.deepPages = deepPages
+        self._found = {}
+
+    def search(self, function, request, responseClass):
+        """
+        Runs the specified search request with the specified backend
+        function, and returns the parsed response of the specified class.
+        """
+        return protocol.fromJson(
+            function(protocol.toJson(request)), responseClass)
+
+    def _find(self, name, finder):
+        if name not in self._found:
+            try:
+                self._found[name] = finder()
+            except SkipScenario as exception:
+                self._found[name] = exception
+        if isinstance(self._found[name], SkipScenario):
+            raise self._found[name]
+        return self._found[name]
+
+    def _findFirst(self, description, values):
+        for value in values:
+            if value is not None:
+                return value
+        raise SkipScenario("no {}".format(description))
+
+    def getDataset(self):
+        return self._find("dataset", lambda: self._findFirst(
+            "dataset", self.repository.getDatasets()))
+
+    def getReferenceSet(self):
+        return self._find("referenceSet", lambda: self._findFirst(
+            "reference set", self.repository.getReferenceSets()))
+
+    def getReference(self):
+        return self._find("reference", lambda: self._findFirst(
+            "reference", self.getReferenceSet().getReferences()))
+
+    def getVariantSet(self):
+        return self._find("variantSet", lambda: self._findFirst(
+            "variant set", (
+                variantSet for dataset in self.repository.getDatasets()
+                for variantSet in dataset.getVariantSets())))
+
+    def getVariantsRequest(self):
+        """
+        Returns a search for variants on the first reference of the first
+        variant set that has any, with no call sets.
+        """
+        return self._find("variantsRequest", self._findVariantsRequest)
+
+    def _findVariantsRequest(self):
+        variantSet = self.getVariantSet()
+        referenceSet = variantSet.getReferenceSet()
+        if referenceSet is None:
+            raise SkipScenario("no reference set for the variant set")
+        for reference in referenceSet.getReferences():
+            request = protocol.SearchVariantsRequest()
+            request.variant_set_id = variantSet.getId()
+            request.reference_name = reference.getLocalId()
+            request.start = 0
+            request.end = reference.getLength()
+            request.page_size = 1
+            response = self.search(
+                self.backend.runSearchVariants, request,
+                protocol.SearchVariantsResponse)
+            if len(response.variants) > 0:
+                self._found["variant"] = response.variants[0]
+                request.page_size = self.pageSize
+                return request
+        raise SkipScenario("no variants")
+
+    def getVariant(self):
+        self.getVariantsRequest()
+        return self._found["variant"]
+
+    def getVariantAnnotationsRequest(self):
+        """
+        Returns a search for the variant annotations on the first reference
+        of the first variant annotation set that has any.
+        """
+        return self._find(
+            "variantAnnotationsRequest", self._findVariantAnnotationsRequest)
+
+    def _findVariantAnnotationsRequest(self):
+        for dataset in self.repository.getDatasets():
+            for variantSet in dataset.getVariantSets():
+                referenceSet = variantSet.getReferenceSet()
+                if referenceSet is None:
+                    continue
+                for annotationSet in variantSet.getVariantAnnotationSets():
+                    for reference in referenceSet.getReferences():
+                        request = protocol.SearchVariantAnnotationsRequest()
+                        request.variant_annotation_set_id = (
+                            annotationSet.getId())
+                        request.reference_name = reference.getLocalId()
+                        request.start = 0
+                        request.end = reference.getLength()
+                        request.page_size = 1
+                        response = self.search(
+                            self.backend.runSearchVariantAnnotations,
+                            request,
+                            protocol.SearchVariantAnnotationsResponse)
+                        if len(response.variant_annotations) > 0:
+                            self._found["variantAnnotationSet"] = (
+                                annotationSet)
+                            self._found["variantAnnotation"] = (
+                                response.variant_annotations[0])
+                            request.page_size = self.pageSize
+                            return request
+        raise SkipScenario("no variant annotations")
+
+    def getVariantAnnotationSet(self):
+        self.getVariantAnnotationsRequest()
+        return self._found["variantAnnotationSet"]
+
+    def getVariantAnnotationEffect(self):
+        """
+        Returns the first effect of the first annotated variant.
+        """
+        self.getVariantAnnotationsRequest()
+        return self._find("variantAnnotationEffect", lambda: self._findFirst(
+            "variant annotation effects", (
+                effect for transcriptEffect in
+                self._found["variantAnnotation"].transcript_effects
+                for effect in transcriptEffect.effects)))
+
+    def getReadGroupSet(self):
+        return self._find("readGroupSet", lambda: self._findFirst(
+            "read group set", (
+                readGroupSet for dataset in self.repository.getDatasets()
+                for readGroupSet in dataset.getReadGroupSets())))
+
+    def getReadsRequest(self):
+        """
+        Returns a search for the reads of the first read group of the first
+        read group set on the first reference with any.
+        """
+        return self._find("readsRequest", self._findReadsRequest)
+
+    def _findReadsRequest(self):
+        readGroupSet = self.getReadGroupSet()
+        referenceSet = readGroupSet.getReferenceSet()
+        if referenceSet is None:
+            raise SkipScenario("no reference set for the read group set")
+        readGroup = readGroupSet.getReadGroups()[0]
+        for reference in referenceSet.getReferences():
+            request = protocol.SearchReadsRequest()
+            request.read_group_ids.append(readGroup.getId())
+            request.reference_id = reference.getId()
+            request.start = 0
+            request.end = reference.getLength()
+            request.page_size = 1
+            response = self.search(
+                self.backend.runSearchReads, request,
+                protocol.SearchReadsResponse)
+            if len(response.alignments) > 0:
+                request.page_size = self.pageSize
+                return request
+        raise SkipScenario("no reads")
+
+    def getFeatureSet(self):
+        return self._find("featureSet", lambda: self._findFirst(
+            "feature set", (
+                featureSet for dataset in self.repository.getDatasets()
+                for featureSet in dataset.getFeatureSets())))
+
+    def getFeaturesRequest(self):
+        """
+        Returns a search for the features on the first reference of the
+        first feature set with any.
+        """
+        return self._find("featuresRequest", self._findFeaturesRequest)
+
+    def _findFeaturesRequest(self):
+        featureSet = self.getFeatureSet()
+        referenceSet = featureSet.getReferenceSet()
+        if referenceSet is None:
+            raise SkipScenario("no reference set for the feature set")
+        for reference in referenceSet.getReferences():
+            request = protocol.SearchFeaturesRequest()
+            request.feature_set_id = featureSet.getId()
+            request.reference_name = reference.getLocalId()
+            request.start = 0
+            request.end = reference.getLength()
+            request.page_size = self.pageSize
+            response = self.search(
+                self.backend.runSearchFeatures, request,
+                protocol.SearchFeaturesResponse)
+            if len(response.features) > 0:
+                self._found["features"] = response.features
+                return request
+        raise SkipScenario("no features")
+
+    def getFeature(self):
+        self.getFeaturesRequest()
+        return self._found["features"][0]
+
+    def getParentFeature(self):
+        """
+        Returns the first feature with children in the first page of
+        features.
+        """
+        self.getFeaturesRequest()
+        return self._find("parentFeature", lambda: self._findFirst(
+            "features with children", (
+                feature for feature in self._found["features"]
+                if len(feature.child_ids) > 0)))
+
+    def getPageToken(self, function, request, responseClass):
+        """
+        Sets the page token of the specified search to that of the page
+        after the configured number of pages.
+        """
+        request.page_token = ""
+        for _ in range(self.deepPages):
+            response = self.search(function, request, responseClass)
+            if response.next_page_token == "":
+                raise SkipScenario("fewer than {} pages".format(
+                    self.deepPages + 1))
+            request.page_token = response.next_page_token
+
+
+def _search(function, request):
+    return function, protocol.toJson(request)
+
+
+def _copy(request):
+    copy = type(request)()
+    copy.CopyFrom(request)
+    return copy
+
+
+@scenario("searchDatasets")
+def searchDatasets(data):
+    return _search(
+        data.backend.runSearchDatasets, protocol.SearchDatasetsRequest())
+
+
+@scenario("searchReferenceSets")
+def searchReferenceSets(data):
+    return _search(
+        data.backend.runSearchReferenceSets,
+        protocol.SearchReferenceSetsRequest())
+
+
+@scenario("searchReferences")
+def searchReferences(data):
+    request = protocol.SearchReferencesRequest()
+    request.reference_set_id = data.getReferenceSet().getId()
+    return _search(data.backend.runSearchReferences, request)
+
+
+@scenario("listReferenceBases")
+def listReferenceBases(data):
+    return data.backend.runListReferenceBases, data.getReference().getId(), {}
 
 
-class HeapProfilerBackend(backend.Backend):
-    def __init__(self, registryDb):
-        repo = datarepo.SqlDataRepository(registryDb)
-        repo.open(datarepo.MODE_READ)
-        super(HeapProfilerBackend, self).__init__(repo)
-        self.profiler = guppy.hpy()
+@scenario("searchVariantSets")
+def searchVariantSets(data):
+    request = protocol.SearchVariantSetsRequest()
+    request.dataset_id = data.getVariantSet().getParentContainer().getId()
+    return _search(data.backend.runSearchVariantSets, request)
 
-    def startProfile(self):
-        self.profiler.setrelheap()
 
-    def endProfile(self):
-        print(self.profiler.heap())
+@scenario("searchCallSets")
+def searchCallSets(data):
+    request = protocol.SearchCallSetsRequest()
+    request.variant_set_id = data.getVariantSet().getId()
+    return _search(data.backend.runSearchCallSets, request)
 
 
-class CpuProfilerBackend(backend.Backend):
-    def __init__(self, registryDb):
-        repo = datarepo.SqlDataRepository(registryDb)
-        repo.open(datarepo.MODE_READ)
-        super(CpuProfilerBackend, self).__init__(repo)
-        self.profiler = cProfile.Profile()
+@scenario("searchVariantsNoCallSets")
+def searchVariantsNoCallSets(data):
+    return _search(data.backend.runSearchVariants, data.getVariantsRequest())
 
-    def startProfile(self):
-        self.profiler.enable()
 
-    def endProfile(self):
-        self.profiler.disable()
+@scenario("searchVariantsOneCallSet")
+def searchVariantsOneCallSet(data):
+    request = _copy(data.getVariantsRequest())
+    callSets = data.getVariantSet().getCallSets()
+    if len(callSets) == 0:
+        raise SkipScenario("no call sets")
+    request.call_set_ids.append(callSets[0].getId())
+    return _search(data.backend.runSearchVariants, request)
 
 
-def _heavyQuery(variantSetId, callSetIds):
+@scenario("searchVariantsAllCallSets")
+def searchVariantsAllCallSets(data):
+    request = _copy(data.getVariantsRequest())
+    callSets = data.getVariantSet().getCallSets()
+    if len(callSets) < 2:
+        raise SkipScenario("fewer than two call sets")
+    request.call_set_ids.extend(callSet.getId() for callSet in callSets)
+    return _search(data.backend.runSearchVariants, request)
+
+
+@scenario("searchVariantsDeepPage")
+def searchVariantsDeepPage(data):
+    request = _copy(data.getVariantsRequest())
+    data.getPageToken(
+        data.backend.runSearchVariants, request,
+        protocol.SearchVariantsResponse)
+    return _search(data.backend.runSearchVariants, request)
+
+
+@scenario("searchVariantAnnotationSets")
+def searchVariantAnnotationSets(data):
+    request = protocol.SearchVariantAnnotationSetsRequest()
+    annotationSet = data.getVariantAnnotationSet()
+    request.variant_set_id = annotationSet.getParentContainer().getId()
+    return _search(data.backend.runSearchVariantAnnotationSets, request)
+
+
+@scenario("searchVariantAnnotations")
+def searchVariantAnnotations(data):
+    return _search(
+        data.backend.runSearchVariantAnnotations,
+        data.getVariantAnnotationsRequest())
+
+
+@scenario("searchVariantAnnotationsEffectFilter")
+def searchVariantAnnotationsEffectFilter(data):
+    request = _copy(data.getVariantAnnotationsRequest())
+    request.effects.add().CopyFrom(data.getVariantAnnotationEffect())
+    return _search(data.backend.runSearchVariantAnnotations, request)
+
+
+@scenario("searchReadGroupSets")
+def searchReadGroupSets(data):
+    request = protocol.SearchReadGroupSetsRequest()
+    request.dataset_id = data.getReadGroupSet().getParentContainer().getId()
+    return _search(data.backend.runSearchReadGroupSets, request)
+
+
+@scenario("searchReadsOneReadGroup")
+def searchReadsOneReadGroup(data):
+    return _search(data.backend.runSearchReads, data.getReadsRequest())
+
+
+@scenario("searchReadsAllReadGroups")
+def searchReadsAllReadGroups(data):
+    request = _copy(data.getReadsRequest())
+    readGroups = data.getReadGroupSet().getReadGroups()
+    if len(readGroups) < 2:
+        raise SkipScenario("fewer than two read groups")
+    del request.read_group_ids[:]
+    request.read_group_ids.extend(
+        readGroup.getId() for readGroup in readGroups)
+    return _search(data.backend.runSearchReads, request)
+
+
+@scenario("searchReadsDeepPage")
+def searchReadsDeepPage(data):
+    request = _copy(data.getReadsRequest())
+    data.getPageToken(
+        data.backend.runSearchReads, request, protocol.SearchReadsResponse)
+    return _search(data.backend.runSearchReads, request)
+
+
+@scenario("searchFeatureSets")
+def searchFeatureSets(data):
+    request = protocol.SearchFeatureSetsRequest()
+    request.dataset_id = data.getFeatureSet().getParentContainer().getId()
+    return _search(data.backend.runSearchFeatureSets, request)
+
+
+@scenario("searchFeatures")
+def searchFeatures(data):
+    return _search(data.backend.runSearchFeatures, data.getFeaturesRequest())
+
+
+@scenario("searchFeaturesByParent")
+def searchFeaturesByParent(data):
+    request = protocol.SearchFeaturesRequest()
+    request.feature_set_id = data.getFeatureSet().getId()
+    request.parent_id = data.getParentFeature().id
+    request.page_size = data.pageSize
+    return _search(data.backend.runSearchFeatures, request)
+
+
+@scenario("getDataset")
+def getDataset(data):
+    return data.backend.runGetDataset, data.getDataset().getId()
+
+
+@scenario("getReferenceSet")
+def getReferenceSet(data):
+    return data.backend.runGetReferenceSet, data.getReferenceSet().getId()
+
+
+@scenario("getReference")
+def getReference(data):
+    return data.backend.runGetReference, data.getReference().getId()
+
+
+@scenario("getVariantSet")
+def getVariantSet(data):
+    return data.backend.runGetVariantSet, data.getVariantSet().getId()
+
+
+@scenario("getCallSet")
+def getCallSet(data):
+    callSets = data.getVariantSet().getCallSets()
+    if len(callSets) == 0:
+        raise SkipScenario("no call sets")
+    return data.backend.runGetCallSet, callSets[0].getId()
+
+
+@scenario("getVariant")
+def getVariant(data):
+    return data.backend.runGetVariant, data.getVariant().id
+
+
+@scenario("getVariantAnnotationSet")
+def getVariantAnnotationSet(data):
+    return (
+        data.backend.runGetVariantAnnotationSet,
+        data.getVariantAnnotationSet().getId())
+
+
+@scenario("getReadGroupSet")
+def getReadGroupSet(data):
+    return data.backend.runGetReadGroupSet, data.getReadGroupSet().getId()
+
+
+@scenario("getReadGroup")
+def getReadGroup(data):
+    readGroup = data.getReadGroupSet().getReadGroups()[0]
+    return data.backend.runGetReadGroup, readGroup.getId()
+
+
+@scenario("getFeatureSet")
+def getFeatureSet(data):
+    return data.backend.runGetFeatureSet, data.getFeatureSet().getId()
+
+
+@scenario("getFeature")
+def getFeature(data):
+    return data.backend.runGetFeature, data.getFeature().id
+
+
+def getDataRepository(dataSource, args):
     """
-    Very heavy query: calls for the specified list of callSetIds
-    on chromosome 2 (11 pages, 90 seconds to fetch the entire thing
-    on a high-end desktop machine)
+    Returns the data repository for the specified data source name.
     """
-    request = protocol.SearchVariantsRequest()
-    request.reference_name = '2'
-    request.variant_set_id = variantSetId
-    for callSetId in callSetIds:
-        request.call_set_ids.add(callSetId)
-    request.page_size = 100
-    request.end = 100000
-    return request
+    if dataSource == "simulated":
+        return datarepo.SimulatedDataRepository(
+            randomSeed=args.randomSeed, numDatasets=1, numCalls=10,
+            variantDensity=0.5, numReadGroupsPerReadGroupSet=2,
+            numAlignments=1000)
+    repo = datarepo.SqlDataRepository(args.registryPath)
+    repo.open(datarepo.MODE_READ)
+    return repo
 
 
-def timeOneSearch(queryString):
+def runScenario(function, arguments, iterations, warmup):
     """
-    Returns (search result as JSON string, time elapsed during search)
+    Calls the specified function with the specified arguments warmup
+    times and then the specified number of times, and returns the results
+    for the timed calls.
     """
-    startTime = time.clock()
-    resultString = backend.runSearchVariants(queryString)
-    endTime = time.clock()
-    elapsedTime = endTime - startTime
-    return resultString, elapsedTime
+    for _ in range(warmup):
+        function(*arguments)
+    latencies = []
+    for _ in range(iterations):
+        startTime = time.time()
+        function(*arguments)
+        latencies.append(time.time() - startTime)
+    latencies.sort()
+    return collections.OrderedDict([
+        ("iterations", iterations),
+        ("throughput", iterations / sum(latencies)),
+        ("meanMs", sum(latencies) / iterations * 1000),
+        ("p50Ms", utils.getPercentile(latencies, 50) * 1000),
+        ("p95Ms", utils.getPercentile(latencies, 95) * 1000),
+        ("p99Ms", utils.getPercentile(latencies, 99) * 1000),
+    ])
 
 
-def extractNextPageToken(resultString):
+def runSuite(args):
     """
-    Calling GASearchVariantsResponse.fromJsonString() can be slower
-    than doing the variant search in the first place; instead we use
-    a regexp to extract the next page token.
+    Runs the selected scenarios against the selected data sources, and
+    returns the results document.
     """
-    m = re.search('(?<=nextPageToken": )(?:")?([0-9]*?:[0-9]*)|null',
-                  resultString)
-    if m is not None:
-        return m.group(1)
-    return None
+    results = collections.OrderedDict()
+    for dataSource in args.dataSources:
+        data = BenchmarkData(
+            getDataRepository(dataSource, args), args.pageSize,
+            args.deepPages)
+        for name, builder in scenarios.items():
+            if args.scenarios is not None and not re.search(
+                    args.scenarios, name):
+                continue
+            key = "{}/{}".format(dataSource, name)
+            try:
+                call = builder(data)
+            except SkipScenario as exception:
+                results[key] = {"skipped": str(exception)}
+                print("{:<50} skipped: {}".format(key, exception),
+                      file=sys.stderr)
+                continue
+            result = runScenario(
+                call[0], call[1:], args.iterations, args.warmup)
+            results[key] = result
+            print("{:<50} {:>10.1f}/s p50 {:>9.2f}ms p99 {:>9.2f}ms".format(
+                key, result["throughput"], result["p50Ms"],
+                result["p99Ms"]), file=sys.stderr)
+    return collections.OrderedDict([
+        ("python", platform.python_version()),
+        ("platform", platform.platform()),
+        ("settings", collections.OrderedDict([
+            ("iterations", args.iterations),
+            ("warmup", args.warmup),
+            ("pageSize", args.pageSize),
+            ("deepPages", args.deepPages),
+            ("randomSeed", args.randomSeed),
+        ])),
+        ("results", results),
+    ])
 
 
-def benchmarkOneQuery(request, repeatLimit=3, pageLimit=3):
+def compareResults(results, baseline, metric, tolerance):
     """
-    Repeat the query several times; perhaps don't go through *all* the
-    pages.  Returns minimum time to run backend.searchVariants() to execute
-    the query (as far as pageLimit allows), *not* including JSON
-    processing to prepare queries or parse responses.
+    Returns the list of (scenario, baseline value, value) tuples for the
+    scenarios whose value of the specified metric exceeds the baseline by
+    more than the specified fraction.
     """
-    times = []
-    queryString = protocol.toJson(request)
-    for i in range(0, repeatLimit):
-        resultString, elapsedTime = timeOneSearch(queryString)
-        accruedTime = elapsedTime
-        pageCount = 1
-        token = extractNextPageToken(resultString)
-        # Iterate to go beyond the first page of results.
-        while token is not None and pageCount < pageLimit:
-            pageRequest = request
-            pageRequest.page_token = token
-            pageRequestString = protocol.toJson(pageRequest)
-            resultString, elapsedTime = timeOneSearch(pageRequestString)
-            accruedTime += elapsedTime
-            pageCount = pageCount + 1
-            token = extractNextPageToken(resultString)
-        times.append(accruedTime)
-
-    # TODO: more sophisticated statistics. Sometimes we want min(),
-    # sometimes mean = sum() / len(), sometimes other measures,
-    # perhaps exclude outliers...
-
-    # If we compute average we should throw out at least the first one.
-    # return sum(times[2:])/len(times[2:])
-    return min(times)
+    regressions = []
+    for key, result in results["results"].items():
+        baselineResult = baseline["results"].get(key)
+        if (baselineResult is None or metric not in baselineResult or
+                metric not in result):
+            continue
+        if result[metric] > baselineResult[metric] * (1 + tolerance):
+            regressions.append(
+                (key, baselineResult[metric], result[metric]))
+    return regressions
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
-        description="GA4GH reference server benchmark")
+        description="GA4GH reference server benchmark suite")
     parser.add_argument(
-        'variantSetId',
-        help="The variant set ID to run the query against")
+        "--dataSources", nargs="+", default=["simulated", "testdata"],
+        choices=["simulated", "testdata"],
+        help="The data repositories to benchmark (default: %(default)s)")
     parser.add_argument(
-        '--profile', default='none',
-        choices=['none', 'heap', 'cpu'],
-        help='"heap" runs a heap profiler once inside the backend, '
-             '"cpu" runs a cpu profiler.')
+        "--registryPath", default="tests/data/repo.db",
+        help="The test data repository (default: %(default)s)")
     parser.add_argument(
-        '--repeatLimit', type=int, default=3, metavar='N',
-        help='how many times to run each test case (default: %(default)s)')
+        "--scenarios", default=None, metavar="REGEX",
+        help="Only run the scenarios whose names match this expression")
     parser.add_argument(
-        '--pageLimit', type=int, default=3, metavar='N',
-        help='how many pages (max) to load '
-             'from each test case (default: %(default)s)')
+        "--list", action="store_true",
+        help="List the scenarios and exit")
     parser.add_argument(
-        "--callSetIds", "-c", default=[],
-        help="""Return variant calls which belong to call sets
-            with these IDs. Pass in IDs as a comma separated list (no spaces),
-            or '*' (with the single quotes!) to indicate 'all call sets'.
-            Omit this option to indicate 'no call sets'.
-            """)
-
+        "--iterations", type=int, default=50, metavar="N",
+        help="How many times to time each scenario (default: %(default)s)")
+    parser.add_argument(
+        "--warmup", type=int, default=3, metavar="N",
+        help="How many untimed runs precede the timed runs of each "
+             "scenario (default: %(default)s)")
+    parser.add_argument(
+        "--pageSize", type=int, default=100, metavar="N",
+        help="The page size of searches (default: %(default)s)")
+    parser.add_argument(
+        "--deepPages", type=int, default=10, metavar="N",
+        help="The number of pages skipped by the deep page scenarios "
+             "(default: %(default)s)")
+    parser.add_argument(
+        "--randomSeed", type=int, default=1,
+        help="The seed of the simulated repository (default: %(default)s)")
+    parser.add_argument(
+        "--output", default=None,
+        help="Write the results to this file as well as to standard output")
+    parser.add_argument(
+        "--baseline", default=None,
+        help="The results of a previous run to compare against")
+    parser.add_argument(
+        "--metric", default="p50Ms", choices=["p50Ms", "p95Ms", "p99Ms"],
+        help="The latency compared against the baseline "
+             "(default: %(default)s)")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2,
+        help="The fraction by which a latency may exceed the baseline "
+             "before it is reported as a regression (default: %(default)s)")
     args = parser.parse_args()
 
-    registryDb = "ga4gh-example-data/repo.db"
-
-    if args.profile == 'heap':
-        backendClass = HeapProfilerBackend
-        backend = backendClass(registryDb)
-        args.repeatLimit = 1
-        args.pageLimit = 1
-    elif args.profile == 'cpu':
-        backendClass = CpuProfilerBackend
-        backend = backendClass(registryDb)
-    else:
-        repo = datarepo.SqlDataRepository(registryDb)
-        repo.open(datarepo.MODE_READ)
-        backend = backend.Backend(repo)
-    # Get our list of callSetids
-    callSetIds = args.callSetIds
-    if callSetIds != []:
-        callSetIds = None
-        if args.callSetIds != "*":
-            callSetIds = args.callSetIds.split(",")
-
-    minTime = benchmarkOneQuery(
-        _heavyQuery(args.variantSetId, callSetIds), args.repeatLimit,
-        args.pageLimit)
-    print(minTime)
-
-    if args.profile == 'cpu':
-        stats = pstats.Stats(backend.profiler)
-        stats.sort_stats('time')
-        stats.print_stats(.25)
+    if args.list:
+        for name in scenarios.keys():
+            print(name)
+        sys.exit(0)
+    results = runSuite(args)
+    resultsJson = json.dumps(results, indent=2)
+    print(resultsJson)
+    if args.output is not None:
+        with open(args.output, "w") as outputFile:
+            outputFile.write(resultsJson + "\n")
+    if args.baseline is not None:
+        with open(args.baseline) as baselineFile:
+            baseline = json.load(baselineFile)
+        regressions = compareResults(
+            results, baseline, args.metric, args.tolerance)
+        for key, baselineValue, value in regressions:
+            print("REGRESSION {}: {} {:.2f}ms -> {:.2f}ms ({:+.0%})".format(
+                key, args.metric, baselineValue, value,
+                value / baselineValue - 1), file=sys.stderr)
+        if len(regressions) > 0:
+            sys.exit(1)
@@ -37,6 +37,17 @@ def log(message):
     print(message)
 
 
+def getPercentile(sortedValues, percentile):
+    """
+    Returns the specified percentile of the specified sorted list of
+    values, or NaN if the list is empty.
+    """
+    if len(sortedValues) == 0:
+        return float("nan")
+    index = int(round(percentile / 100 * (len(sortedValues) - 1)))
+    return sortedValues[index]
+
+
 class Timed(object):
     """
     Decorator that times a method, reporting runtime at finish
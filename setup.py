@@ -52,6 +52,10 @@ setup(
     ],
     keywords='genomics reference',
     install_requires=install_requires,
+    # The asynchronous server, ga4gh_server --async, also requires gevent
+    extras_require={
+        'async': ['gevent==1.1.1'],
+    },
     # Use setuptools_scm to set the version number automatically from Git
     setup_requires=['setuptools_scm'],
     use_scm_version={
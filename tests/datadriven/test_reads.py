@@ -275,6 +275,27 @@ class ReadGroupSetTest(datadriven.DataDrivenTest):
                 self.assertAlignmentListsEqual(
                     gaAlignments, alignments, readGroupInfo)
 
+    def testGetReadAlignmentsFieldMask(self):
+        # The qualities, tags and CIGAR are not converted unless the mask
+        # includes them
+        readGroupSet = self._gaObject
+        fieldMask = protocol.FieldMask.parse("id,alignment.position")
+        for readGroup in readGroupSet.getReadGroups():
+            for reference in self._referenceSet.getReferences():
+                alignments = list(readGroup.getReadAlignments(reference))
+                maskedAlignments = list(readGroup.getReadAlignments(
+                    reference, fieldMask=fieldMask))
+                self.assertEqual(len(alignments), len(maskedAlignments))
+                for alignment, maskedAlignment in zip(
+                        alignments, maskedAlignments):
+                    self.assertEqual(len(maskedAlignment.aligned_quality), 0)
+                    self.assertEqual(len(maskedAlignment.info), 0)
+                    self.assertEqual(
+                        len(maskedAlignment.alignment.cigar), 0)
+                    fieldMask.apply(alignment)
+                    fieldMask.apply(maskedAlignment)
+                    self.assertEqual(alignment, maskedAlignment)
+
     def testGetReadAlignmentSearchRanges(self):
         # test that various range searches work
         readGroupSet = self._gaObject
@@ -5,6 +5,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import ga4gh.backend as backend
 import ga4gh.datarepo as datarepo
 import ga4gh.datamodel as datamodel
 import ga4gh.datamodel.datasets as datasets
@@ -202,3 +203,21 @@ class FeatureSetTests(datadriven.DataDrivenTest):
             features.append(feature)
         self.assertEqual(len(features),
                          self._testData["sampleSiblings"])
+
+    def testStreamFeatures(self):
+        # Streaming ignores the page size, so all of the features in the
+        # region are returned whatever its value.
+        dataset = self._repo.getDatasetByName("dataset1")
+        featureSet = dataset.getFeatureSetByName(
+            self._testData["featureSetName"])
+        testBackend = backend.Backend(self._repo)
+        for pageSize in [0, 10]:
+            request = protocol.SearchFeaturesRequest()
+            request.feature_set_id = featureSet.getId()
+            request.reference_name = self._testData["referenceName"]
+            request.start, request.end = self._testData["region"]
+            request.page_size = pageSize
+            lines = list(testBackend.runSearchFeatures(
+                protocol.toJson(request),
+                responseMimetype=protocol.NDJSON_MIMETYPE))
+            self.assertEqual(len(lines), self._testData["totalFeatures"])
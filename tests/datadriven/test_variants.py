@@ -8,6 +8,8 @@ from __future__ import unicode_literals
 import os
 import glob
 import hashlib
+import sqlite3
+import tempfile
 
 import vcf
 
@@ -429,6 +431,65 @@ class VariantSetTest(datadriven.DataDrivenTest):
                 for call, someId in zip(record.calls, somecall_set_ids):
                     self.assertEqual(call.call_set_id, someId)
 
+    def testGetVariantsCallSetsOrder(self):
+        # The calls must be returned in the order of the requested call
+        # sets, whichever call sets were last requested
+        variantSet = self._gaObject
+        callSetIds = [
+            callSet.getId() for callSet in variantSet.getCallSets()]
+        reversedCallSetIds = list(reversed(callSetIds))
+        for reference_name in self._reference_names:
+            allVariants = list(variantSet.getVariants(
+                reference_name, 0, 2**30, callSetIds))
+            reversedVariants = list(variantSet.getVariants(
+                reference_name, 0, 2**30, reversedCallSetIds))
+            self.assertEqual(len(allVariants), len(reversedVariants))
+            for variant, reversedVariant in zip(
+                    allVariants, reversedVariants):
+                self.assertEqual(
+                    list(reversed(variant.calls)),
+                    list(reversedVariant.calls))
+
+    def testGetVariantsSampleSubset(self):
+        # Decoding only the requested samples must not change their calls
+        variantSet = self._gaObject
+        callSetIds = [
+            callSet.getId() for callSet in variantSet.getCallSets()]
+        someCallSetIds = callSetIds[1:3]
+        for reference_name in self._reference_names:
+            allVariants = list(variantSet.getVariants(
+                reference_name, 0, 2**30, callSetIds))
+            someVariants = list(variantSet.getVariants(
+                reference_name, 0, 2**30, someCallSetIds))
+            self.assertEqual(len(allVariants), len(someVariants))
+            for variant, someVariant in zip(allVariants, someVariants):
+                self.assertEqual(variant.id, someVariant.id)
+                self.assertEqual(
+                    list(variant.calls[1:3]), list(someVariant.calls))
+
+    def testGetVariantsFieldMask(self):
+        # The converted fields must be the same as those of the full
+        # variants when projected onto the mask
+        variantSet = self._gaObject
+        callSetIds = [
+            callSet.getId() for callSet in variantSet.getCallSets()]
+        for maskString in ["start,end", "info", "calls.genotype"]:
+            fieldMask = protocol.FieldMask.parse(maskString)
+            for reference_name in self._reference_names:
+                allVariants = list(variantSet.getVariants(
+                    reference_name, 0, 2**30, callSetIds))
+                maskedVariants = list(variantSet.getVariants(
+                    reference_name, 0, 2**30, callSetIds,
+                    fieldMask=fieldMask))
+                self.assertEqual(len(allVariants), len(maskedVariants))
+                for variant, maskedVariant in zip(
+                        allVariants, maskedVariants):
+                    fieldMask.apply(variant)
+                    fieldMask.apply(maskedVariant)
+                    self.assertEqual(variant, maskedVariant)
+                    if not fieldMask.includes("info"):
+                        self.assertEqual(len(maskedVariant.info), 0)
+
     def testGetVariant(self):
         variantSet = self._gaObject
         for reference_name in self._reference_names:
@@ -467,6 +528,134 @@ class VariantSetTest(datadriven.DataDrivenTest):
                 with self.assertRaises(exceptions.ObjectNotFoundException):
                     variantSet.getVariant(compoundId)
 
+    def testGetVariantWithIdIndex(self):
+        # Variants read through the index must be the same as those found
+        # by scanning the records at their position
+        variantSet = self._gaObject
+        compoundIds = []
+        for reference_name in self._reference_names:
+            for variant in self._getPyvcfVariants(reference_name):
+                compoundIds.append(datamodel.VariantCompoundId(
+                    variantSet.getCompoundId(), reference_name,
+                    str(variant.start), self._hashVariant(variant)))
+        scannedVariants = [
+            variantSet.getVariant(compoundId) for compoundId in compoundIds]
+        fd, variantIdIndexPath = tempfile.mkstemp(
+            prefix="ga4gh_variant_id_index")
+        os.close(fd)
+        try:
+            variantSet.buildVariantIdIndex(variantIdIndexPath)
+            for compoundId, variant in zip(compoundIds, scannedVariants):
+                self.assertEqual(variantSet.getVariant(compoundId), variant)
+            compoundId = datamodel.VariantCompoundId(
+                variantSet.getCompoundId(), compoundIds[0].reference_name,
+                compoundIds[0].start, "wrong hash")
+            with self.assertRaises(exceptions.ObjectNotFoundException):
+                variantSet.getVariant(compoundId)
+            # Variants missing from the index are found by scanning.
+            db = sqlite3.connect(variantIdIndexPath)
+            try:
+                db.execute("DELETE FROM Variant;")
+                db.commit()
+            finally:
+                db.close()
+            for compoundId, variant in zip(compoundIds, scannedVariants):
+                self.assertEqual(variantSet.getVariant(compoundId), variant)
+        finally:
+            variantSet.setVariantIdIndexPath(None)
+            os.unlink(variantIdIndexPath)
+
+    def testComputeStatistics(self):
+        variantSet = self.getDataModelInstance(self._localId, self._dataPath)
+        self.assertIsNone(variantSet.getStatistics())
+        self.assertEqual(variantSet.getNumVariants(), 0)
+        for scan in [False, True]:
+            variantSet.computeStatistics(scan=scan)
+            statistics = variantSet.getStatistics()
+            self.assertEqual(
+                set(statistics.keys()), set(self._reference_names))
+            for reference_name in self._reference_names:
+                records = [
+                    record for record in self._variantRecords
+                    if record.CHROM == reference_name]
+                referenceStatistics = statistics[reference_name]
+                self.assertEqual(
+                    referenceStatistics["numVariants"], len(records))
+                if scan:
+                    self.assertEqual(
+                        referenceStatistics["start"],
+                        min(record.start for record in records))
+                    self.assertEqual(
+                        sum(referenceStatistics[
+                            "variantTypeCounts"].values()),
+                        len(records))
+            self.assertEqual(
+                variantSet.getNumVariants(), len(self._variantRecords))
+            metadata = variantSet.toProtocolElement().metadata
+            self.assertIn(
+                str(len(self._variantRecords)),
+                [entry.value for entry in metadata
+                 if entry.key == "numVariants"])
+
+    def testCheckConsistency(self):
+        # The repo manager's verify command runs this check on every
+        # variant set, so it must accept all of the test data.
+        variantSet = self.getDataModelInstance(self._localId, self._dataPath)
+        for workers in [1, 2]:
+            variantSet.checkConsistency(workers)
+
+    def testGetVariantDensity(self):
+        variantSet = self.getDataModelInstance(self._localId, self._dataPath)
+        queries = [
+            (0, 10**6, 1000), (10**4, 2 * 10**5, 20000), (7, 5000, 1500)]
+        expected = {}
+        for reference_name in self._reference_names:
+            for start, end, binSize in queries:
+                numBins = (end - start + binSize - 1) // binSize
+                counts = [0] * numBins
+                for record in self._variantRecords:
+                    if (record.CHROM == reference_name and
+                            start <= record.start < start + numBins * binSize):
+                        counts[(record.start - start) // binSize] += 1
+                expected[reference_name, start, end, binSize] = counts
+        fd, variantDensityPath = tempfile.mkstemp(
+            prefix="ga4gh_variant_density")
+        os.close(fd)
+        try:
+            # The counts must be the same with and without the pyramid
+            for buildDensity in [False, True]:
+                if buildDensity:
+                    variantSet.buildVariantDensity(variantDensityPath)
+                for key, counts in expected.items():
+                    self.assertEqual(
+                        variantSet.getVariantDensity(*key), counts)
+        finally:
+            os.unlink(variantDensityPath)
+
+    def testGetVariantsByCompoundIds(self):
+        variantSet = self._gaObject
+        compoundIds = []
+        for reference_name in self._reference_names:
+            for variant in self._getPyvcfVariants(reference_name):
+                compoundIds.append(datamodel.VariantCompoundId(
+                    variantSet.getCompoundId(), reference_name,
+                    str(variant.start), self._hashVariant(variant)))
+        missingIds = [
+            datamodel.VariantCompoundId(
+                variantSet.getCompoundId(), "wrong reference name", "0",
+                "wrong hash"),
+            datamodel.VariantCompoundId(
+                variantSet.getCompoundId(), compoundIds[0].reference_name,
+                compoundIds[0].start, "wrong hash")]
+        # The variants must be returned in the order requested
+        requestIds = list(reversed(compoundIds)) + missingIds
+        gotVariants = variantSet.getVariantsByCompoundIds(requestIds)
+        self.assertEqual(len(gotVariants), len(requestIds))
+        for compoundId, gotVariant in zip(compoundIds[::-1], gotVariants):
+            self.assertEqual(
+                gotVariant, variantSet.getVariant(compoundId))
+        self.assertEqual(gotVariants[len(compoundIds):], [None, None])
+
     def _hashVariant(self, record):
         if record.ALT[0] is None:
             alts = tuple()
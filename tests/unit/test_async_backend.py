@@ -0,0 +1,104 @@
+"""
+Tests running overlapping requests on the backend thread pool used by the
+asynchronous server.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import multiprocessing.pool
+import unittest
+
+import tests.paths as paths
+
+import ga4gh.datamodel as datamodel
+import ga4gh.frontend as frontend
+import ga4gh.protocol as protocol
+
+
+class TestAsyncBackend(unittest.TestCase):
+    """
+    Tests that variant and read searches made at the same time on the
+    backend thread pool return the same responses as when they are made
+    one at a time.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.maxCacheSize = datamodel.fileHandleCache.getMaxCacheSize()
+        config = {
+            "DATA_SOURCE": paths.testDataRepo,
+            "RESPONSE_CACHE_MAX_SIZE": 0,
+            # Keep so few handles open that they are regularly evicted
+            # while other searches are using them.
+            "FILE_HANDLE_CACHE_MAX_SIZE": 1,
+        }
+        frontend.reset()
+        frontend.configure(baseConfig="TestConfig", extraConfig=config)
+        dataset = frontend.app.backend.getDataRepository().getDatasets()[0]
+        cls.searches = []
+        variantSet = dataset.getVariantSetByName("vs_0")
+        for referenceName in ["1", "2", "3"]:
+            request = protocol.SearchVariantsRequest()
+            request.variant_set_id = variantSet.getId()
+            request.reference_name = referenceName
+            request.end = 2**32
+            request.page_size = 3
+            cls.searches.append(("/variants/search", request))
+        for name in ["HG00533", "HG00534", "HG00096"]:
+            readGroupSet = dataset.getReadGroupSetByName(name)
+            reference = readGroupSet.getReferenceSet().getReferenceByName("1")
+            request = protocol.SearchReadsRequest()
+            request.read_group_ids.append(
+                readGroupSet.getReadGroups()[0].getId())
+            request.reference_id = reference.getId()
+            request.end = 2**32
+            request.page_size = 2
+            cls.searches.append(("/reads/search", request))
+
+    @classmethod
+    def tearDownClass(cls):
+        datamodel.fileHandleCache.setMaxCacheSize(cls.maxCacheSize)
+
+    def tearDown(self):
+        if frontend.app.backendThreadPool is not None:
+            frontend.app.backendThreadPool.close()
+            frontend.app.backendThreadPool = None
+
+    def _search(self, search):
+        """
+        Returns the responses to all the pages of the specified search,
+        followed by the streamed response to the same search.
+        """
+        path, request = search
+        app = frontend.app.test_client()
+        headers = {'Content-type': 'application/json'}
+        pageRequest = type(request)()
+        pageRequest.CopyFrom(request)
+        responses = []
+        while True:
+            response = app.post(
+                path, headers=headers, data=protocol.toJson(pageRequest))
+            self.assertEqual(response.status_code, 200)
+            responses.append(response.data)
+            pageToken = json.loads(response.data).get("nextPageToken")
+            if not pageToken:
+                break
+            pageRequest.page_token = pageToken
+        headers['Accept'] = frontend.STREAMING_MIMETYPE
+        response = app.post(
+            path, headers=headers, data=protocol.toJson(request))
+        self.assertEqual(response.status_code, 200)
+        responses.append(response.data)
+        return responses
+
+    def testOverlappingSearches(self):
+        expected = [self._search(search) for search in self.searches]
+        frontend.app.backendThreadPool = multiprocessing.pool.ThreadPool(4)
+        clientPool = multiprocessing.pool.ThreadPool(len(self.searches))
+        try:
+            results = clientPool.map(self._search, self.searches * 4)
+        finally:
+            clientPool.close()
+        self.assertEqual(results, expected * 4)
+        self.assertGreater(len(datamodel.getFileHandleCaches()), 1)
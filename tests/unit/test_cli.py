@@ -21,7 +21,7 @@ class TestServerArguments(unittest.TestCase):
     """
     def testParseArguments(self):
         cliInput = """--port 7777 --host 123.4.5.6 --config MockConfigName
-        --config-file /path/to/config --tls --dont-use-reloader"""
+        --config-file /path/to/config --tls --dont-use-reloader --async"""
         parser = cli.getServerParser()
         args = parser.parse_args(cliInput.split())
         self.assertEqual(args.port, 7777)
@@ -30,6 +30,7 @@ class TestServerArguments(unittest.TestCase):
         self.assertEqual(args.config_file, "/path/to/config")
         self.assertTrue(args.tls)
         self.assertTrue(args.dont_use_reloader)
+        self.assertTrue(args.use_async)
 
 
 class TestGa2VcfArguments(unittest.TestCase):
@@ -293,6 +294,12 @@ class TestRepoManagerCli(unittest.TestCase):
         args = self.parser.parse_args(cliInput.split())
         self.assertEquals(args.registryPath, self.registryPath)
         self.assertEquals(args.runner, "verify")
+        self.assertEquals(args.workers, 1)
+
+    def testVerifyWithWorkers(self):
+        cliInput = "verify {} --workers 4".format(self.registryPath)
+        args = self.parser.parse_args(cliInput.split())
+        self.assertEquals(args.workers, 4)
 
     def testList(self):
         cliInput = "list {}".format(self.registryPath)
@@ -389,6 +396,7 @@ class TestRepoManagerCli(unittest.TestCase):
         self.assertEquals(args.datasetName, self.datasetName)
         self.assertEquals(args.dataFiles, [self.filePath])
         self.assertEquals(args.indexFiles, None)
+        self.assertEquals(args.workers, 1)
         self.assertEquals(args.runner, "addVariantSet")
 
     def testAddVariantSetWithIndexFiles(self):
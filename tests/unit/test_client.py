@@ -247,8 +247,9 @@ class DummyResponse(object):
     """
     Stand in for requests Response object;
     """
-    def __init__(self, text):
-        self.text = text
+    def __init__(self, content, mimetype):
+        self.content = content
+        self.headers = {"Content-Type": mimetype}
         self.status_code = 200
 
 
@@ -283,12 +284,14 @@ class DummyRequestsSession(object):
     def checkSessionParameters(self):
         contentType = "Content-type"
         assert contentType in self.headers
-        assert self.headers[contentType] == "application/json"
+        assert self.headers[contentType] in [
+            protocol.JSON_MIMETYPE, protocol.PROTOBUF_MIMETYPE]
+        return self.headers[contentType]
 
     def get(self, url, params):
         # TODO add some more checks for params to see if Key is set,
         # and we're not sending any extra stuff.
-        self.checkSessionParameters()
+        mimetype = self.checkSessionParameters()
         assert url.startswith(self._urlPrefix)
         suffix = url[len(self._urlPrefix):]
         basesSuffix = "/bases"
@@ -307,37 +310,47 @@ class DummyRequestsSession(object):
                 del args['end']
             if args['pageToken'] is "":
                 del args['pageToken']
-            result = self._backend.runListReferenceBases(id_, args)
+            result = self._backend.runListReferenceBases(
+                id_, args, mimetype)
         else:
             assert len(splits) == 3
             assert splits[0] == ''
             datatype, id_ = splits[1:]
             assert datatype in self._getMethodMap
             method = self._getMethodMap[datatype]
-            result = method(id_)
-        return DummyResponse(result)
+            result = method(id_, mimetype)
+        return DummyResponse(result, mimetype)
 
-    def post(self, url, params=None, data=None):
-        self.checkSessionParameters()
+    def post(self, url, params=None, data=None, headers=None):
+        mimetype = self.checkSessionParameters()
         assert url.startswith(self._urlPrefix)
         suffix = url[len(self._urlPrefix):]
+        batchGetSuffix = "/batchGet"
+        if suffix.endswith(batchGetSuffix):
+            assert headers["Content-type"] == protocol.JSON_MIMETYPE
+            datatype = suffix[1:-len(batchGetSuffix)]
+            result = self._backend.runBatchGet(datatype, data)
+            response = DummyResponse(result, protocol.JSON_MIMETYPE)
+            response.text = result
+            return response
         searchSuffix = "/search"
         assert suffix.startswith("/")
         assert suffix.endswith(searchSuffix)
         datatype = suffix[1:-len(searchSuffix)]
         assert datatype in self._searchMethodMap
         method = self._searchMethodMap[datatype]
-        result = method(data)
-        return DummyResponse(result)
+        result = method(data, mimetype, mimetype)
+        return DummyResponse(result, mimetype)
 
 
 class DummyHttpClient(client.HttpClient):
     """
     Client in which we intercept calls to the underlying requests connection.
     """
-    def __init__(self, backend):
+    def __init__(self, backend, mimetype=protocol.JSON_MIMETYPE):
         self._urlPrefix = "http://example.com"
-        super(DummyHttpClient, self).__init__(self._urlPrefix)
+        super(DummyHttpClient, self).__init__(
+            self._urlPrefix, mimetype=mimetype)
         self._session = DummyRequestsSession(backend, self._urlPrefix)
         self._setupHttpSession()
 
@@ -396,6 +409,25 @@ class ExhaustiveListingsMixin(object):
                     0, datamodelReference.getLength())
                 self.assertEqual(bases, otherBases)
 
+    def testGetManyVariants(self):
+        datamodelDataset = self.dataRepo.getDatasets()[0]
+        datamodelVariantSet = datamodelDataset.getVariantSets()[0]
+        variants = list(self.client.searchVariants(
+            datamodelVariantSet.getId(), start=0, end=20,
+            referenceName="fixme"))
+        self.assertGreater(len(variants), 1)
+        ids = [variant.id for variant in reversed(variants)]
+        ids.append("notAnId")
+        self.client.setPageSize(2)
+        objects = self.client.getMany("variants", ids)
+        self.assertEqual(objects[:-1], list(reversed(variants)))
+        self.assertIsInstance(objects[-1], protocol.GAException)
+        callSets = datamodelVariantSet.getCallSets()
+        objects = self.client.getMany(
+            "callsets", [callSet.getId() for callSet in callSets])
+        self.assertEqual(
+            objects, [callSet.toProtocolElement() for callSet in callSets])
+
     def testAllVariantSets(self):
         for dataset in self.client.searchDatasets():
             variantSets = list(self.client.searchVariantSets(dataset.id))
@@ -545,3 +577,21 @@ class TestPagingHttp(PagingMixin, unittest.TestCase):
 
     def getClient(self):
         return DummyHttpClient(self.backend)
+
+
+class TestPagingHttpProtobuf(PagingMixin, unittest.TestCase):
+    """
+    Tests paging using the HTTP client with the binary protobuf wire
+    format. The float fields of references are received with single
+    precision, so we only compare their IDs.
+    """
+
+    def getClient(self):
+        return DummyHttpClient(self.backend, protocol.PROTOBUF_MIMETYPE)
+
+    def verifyAllReferences(self):
+        references = list(self.client.searchReferences(
+            self.datamodelReferenceSet.getId()))
+        self.assertEqual(
+            [reference.id for reference in references],
+            [reference.id for reference in self.references])
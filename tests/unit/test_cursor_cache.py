@@ -0,0 +1,205 @@
+"""
+Tests the cache of suspended search iterators
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import time
+import unittest
+
+import ga4gh.backend as backend
+import ga4gh.datamodel as datamodel
+import ga4gh.datamodel.datasets as datasets
+import ga4gh.datamodel.variants as variants
+import ga4gh.datarepo as datarepo
+import ga4gh.protocol as protocol
+import tests.paths as paths
+
+
+class TestCursorCache(unittest.TestCase):
+    """
+    Tests the eviction and bookkeeping logic of the cursor cache
+    """
+    def setUp(self):
+        self.cache = backend.CursorCache(maxSize=2, timeToLive=60)
+
+    def testDisabled(self):
+        cache = backend.CursorCache()
+        self.assertFalse(cache.isEnabled())
+        cache.put("key", iter([]))
+        self.assertEqual(cache.getNumEntries(), 0)
+        self.assertIsNone(cache.take("key"))
+
+    def testTakeRemovesEntry(self):
+        iterator = iter([])
+        self.cache.put("key", iterator)
+        self.assertIs(self.cache.take("key"), iterator)
+        self.assertIsNone(self.cache.take("key"))
+        self.assertEqual(self.cache.getNumHits(), 1)
+        self.assertEqual(self.cache.getNumMisses(), 1)
+        self.assertEqual(self.cache.getNumEntries(), 0)
+
+    def testMaxSize(self):
+        for key in ["a", "b", "c"]:
+            self.cache.put(key, iter([]))
+        self.assertEqual(self.cache.getNumEntries(), 2)
+        self.assertEqual(self.cache.getNumEvictions(), 1)
+        self.assertIsNone(self.cache.take("a"))
+        self.assertIsNotNone(self.cache.take("b"))
+        self.assertIsNotNone(self.cache.take("c"))
+        self.cache.put("d", iter([]))
+        self.cache.setMaxSize(0)
+        self.assertFalse(self.cache.isEnabled())
+        self.assertEqual(self.cache.getNumEntries(), 0)
+
+    def testExpiry(self):
+        self.cache.setTimeToLive(0.01)
+        self.cache.put("key", iter([]))
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.take("key"))
+        self.assertEqual(self.cache.getNumMisses(), 1)
+
+    def testDiscardedIteratorsClosed(self):
+        iterators = [ClosableIterator() for _ in range(4)]
+        for key, iterator in zip(["a", "b", "c"], iterators):
+            self.cache.put(key, iterator)
+        self.assertTrue(iterators[0].closed)
+        self.assertFalse(iterators[1].closed)
+        # Replacing an entry closes the iterator it held.
+        self.cache.put("b", iterators[3])
+        self.assertTrue(iterators[1].closed)
+        self.assertIs(self.cache.take("c"), iterators[2])
+        self.assertFalse(iterators[2].closed)
+        self.cache.setTimeToLive(0.01)
+        self.cache.put("c", iterators[2])
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.take("c"))
+        self.assertTrue(iterators[2].closed)
+        self.assertFalse(iterators[3].closed)
+        self.cache.setMaxSize(0)
+        self.assertTrue(iterators[3].closed)
+
+    def testBadValues(self):
+        with self.assertRaises(ValueError):
+            self.cache.setMaxSize(-1)
+        with self.assertRaises(ValueError):
+            self.cache.setTimeToLive(0)
+
+
+class ClosableIterator(object):
+    """
+    An empty iterator that records whether it has been closed.
+    """
+    def __init__(self):
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        raise StopIteration()
+
+    def close(self):
+        self.closed = True
+
+
+class TestCursorResumption(unittest.TestCase):
+    """
+    Tests that paging through a search with the cursor cache enabled
+    returns the same results as fetching all of the objects in one page.
+    """
+    def setUp(self):
+        dataRepository = datarepo.AbstractDataRepository()
+        dataset = datasets.Dataset("ds")
+        self.variantSet = variants.HtslibVariantSet(dataset, "vs")
+        self.variantSet.populateFromFile(
+            [paths.vcfPath1], [paths.vcfIndexPath1])
+        dataset.addVariantSet(self.variantSet)
+        dataRepository.addDataset(dataset)
+        self.backend = backend.Backend(dataRepository)
+
+    def _getRequest(self, pageSize):
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = self.variantSet.getId()
+        request.reference_name = "1"
+        request.start = 0
+        request.end = 2**20
+        request.page_size = pageSize
+        return request
+
+    def _getPage(self, request):
+        responseStr = self.backend.runSearchVariants(
+            protocol.toJson(request))
+        return protocol.fromJson(
+            responseStr, protocol.SearchVariantsResponse)
+
+    def _getAllVariants(self, pageSize):
+        request = self._getRequest(pageSize)
+        variants = []
+        while True:
+            response = self._getPage(request)
+            variants.extend(response.variants)
+            if not response.next_page_token:
+                break
+            request.page_token = response.next_page_token
+        return variants
+
+    def _getExpectedVariants(self):
+        response = self._getPage(self._getRequest(1000))
+        self.assertEqual(response.next_page_token, "")
+        return list(response.variants)
+
+    def testResumedPagesMatch(self):
+        expected = self._getExpectedVariants()
+        self.assertGreater(len(expected), 2)
+        self.assertEqual(self._getAllVariants(1), expected)
+        cursorCache = self.backend.getCursorCache()
+        self.backend.setCursorCacheMaxSize(10)
+        self.assertEqual(self._getAllVariants(1), expected)
+        self.assertEqual(cursorCache.getNumHits(), len(expected) - 1)
+        self.assertEqual(cursorCache.getNumMisses(), 0)
+        self.assertEqual(cursorCache.getNumEntries(), 0)
+        self.assertEqual(self._getAllVariants(2), expected)
+
+    def testInterleavedFetches(self):
+        # A suspended iterator has its own file handles, so fetches from
+        # the same file while it is suspended do not disturb it.
+        expected = self._getExpectedVariants()
+        self.backend.setCursorCacheMaxSize(10)
+        request = self._getRequest(3)
+        variants = []
+        while True:
+            response = self._getPage(request)
+            variants.extend(response.variants)
+            if not response.next_page_token:
+                break
+            list(self.variantSet.getVariants("1", 0, 2**20, []))
+            request.page_token = response.next_page_token
+        self.assertEqual(variants, expected)
+        self.assertGreater(self.backend.getCursorCache().getNumHits(), 0)
+
+    def testFirstPageNotRerun(self):
+        # The search is opened on its own file handles from the start, so
+        # suspending it does not re-run it and skip to the next page.
+        self.backend.setCursorCacheMaxSize(10)
+        timer = datamodel.RequestTimer()
+        datamodel.setRequestTimer(timer)
+        try:
+            response = self._getPage(self._getRequest(5))
+        finally:
+            datamodel.setRequestTimer(None)
+        self.assertNotEqual(response.next_page_token, "")
+        self.assertEqual(self.backend.getCursorCache().getNumEntries(), 1)
+        self.assertNotIn("skipped", dict(timer.getCounts()))
+
+    def testFallbackToPageToken(self):
+        expected = self._getExpectedVariants()
+        # Expire every cursor immediately, so that all pages after the
+        # first are resumed from the page token.
+        self.backend.setCursorCacheMaxSize(10)
+        self.backend.setCursorCacheTimeToLive(1e-9)
+        self.assertEqual(self._getAllVariants(1), expected)
+        cursorCache = self.backend.getCursorCache()
+        self.assertEqual(cursorCache.getNumHits(), 0)
+        self.assertEqual(cursorCache.getNumMisses(), len(expected) - 1)
@@ -0,0 +1,92 @@
+"""
+Tests for reading the metadata in htslib index files
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import glob
+import os
+import tempfile
+import unittest
+
+import pysam
+
+import ga4gh.datamodel.htslibIndexes as htslibIndexes
+import ga4gh.exceptions as exceptions
+import tests.paths as paths
+
+
+class TestReadIndexRecordCounts(unittest.TestCase):
+    """
+    Tests the record counts read from tabix and BAI indexes.
+    """
+    def testCountsMatchRecords(self):
+        pattern = os.path.join(
+            paths.testDataDir, "datasets/dataset1/variants/*/*.vcf.gz")
+        for dataFile in glob.glob(pattern):
+            counts = htslibIndexes.readIndexRecordCounts(dataFile + ".tbi")
+            varFile = pysam.VariantFile(dataFile)
+            try:
+                self.assertEqual(
+                    set(counts.keys()), set(varFile.index.keys()))
+                for referenceName, count in counts.items():
+                    # Indexes written by older versions of htslib do not
+                    # record the number of records.
+                    if count is not None:
+                        records = list(varFile.fetch(referenceName))
+                        self.assertEqual(count, len(records))
+            finally:
+                varFile.close()
+
+    def testLastBinStartsBoundRecords(self):
+        pattern = os.path.join(
+            paths.testDataDir, "datasets/dataset1/variants/*/*.vcf.gz")
+        for dataFile in glob.glob(pattern):
+            indexedReferences = htslibIndexes.readIndexReferences(
+                dataFile + ".tbi")
+            varFile = pysam.VariantFile(dataFile)
+            try:
+                for referenceName, indexedReference in (
+                        indexedReferences.items()):
+                    lastStart = max(
+                        record.start
+                        for record in varFile.fetch(referenceName))
+                    self.assertLessEqual(
+                        indexedReference.lastBinStart, lastStart)
+                    lastRecords = varFile.fetch(
+                        referenceName, indexedReference.lastBinStart)
+                    self.assertIn(
+                        lastStart,
+                        [record.start for record in lastRecords])
+            finally:
+                varFile.close()
+
+    def testBaiCountsMatchReads(self):
+        for dataFile in glob.glob(os.path.join(paths.bamDir, "*.bam")):
+            samFile = pysam.AlignmentFile(dataFile)
+            try:
+                referenceNames = list(samFile.references)
+                counts = htslibIndexes.readIndexRecordCounts(
+                    dataFile + ".bai", referenceNames)
+                self.assertEqual(set(counts.keys()), set(referenceNames))
+                for referenceName, count in counts.items():
+                    reads = [
+                        read for read in samFile.fetch(referenceName)
+                        if not read.is_unmapped]
+                    self.assertEqual(count, len(reads))
+            finally:
+                samFile.close()
+
+    def testBaiWithoutReferenceNames(self):
+        self.assertRaises(
+            exceptions.FileOpenFailedException,
+            htslibIndexes.readIndexRecordCounts, paths.bamIndexPath)
+
+    def testNotAnIndex(self):
+        with tempfile.NamedTemporaryFile() as notAnIndex:
+            notAnIndex.write(b"not an index")
+            notAnIndex.flush()
+            self.assertRaises(
+                exceptions.FileOpenFailedException,
+                htslibIndexes.readIndexRecordCounts, notAnIndex.name)
@@ -0,0 +1,97 @@
+"""
+Tests the metrics registry and its aggregation over processes
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import multiprocessing
+import shutil
+import tempfile
+import unittest
+
+import ga4gh.backend as backend
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """
+    Tests the values and text exposition format of the metrics registry
+    """
+    def setUp(self):
+        self.registry = backend.MetricsRegistry()
+        self.registry.addCounter("requests_total", "Requests.", ["route"])
+        self.registry.addGauge("in_flight", "Requests in flight.")
+        self.registry.addHistogram(
+            "duration_seconds", "Durations.", ["route"], [1, 0.125])
+
+    def testText(self):
+        self.registry.increment("requests_total", ("/a",))
+        self.registry.increment("requests_total", ("/a",), 2)
+        self.registry.increment("requests_total", ("/b\"\n",))
+        self.registry.setValue("in_flight", (), 4)
+        for value in [0.0625, 0.125, 0.5, 7]:
+            self.registry.observe("duration_seconds", ("/a",), value)
+        expected = [
+            '# HELP requests_total Requests.',
+            '# TYPE requests_total counter',
+            'requests_total{route="/a"} 3.0',
+            'requests_total{route="/b\\"\\n"} 1.0',
+            '# HELP in_flight Requests in flight.',
+            '# TYPE in_flight gauge',
+            'in_flight 4.0',
+            '# HELP duration_seconds Durations.',
+            '# TYPE duration_seconds histogram',
+            'duration_seconds_bucket{route="/a",le="0.125"} 2.0',
+            'duration_seconds_bucket{route="/a",le="1.0"} 3.0',
+            'duration_seconds_bucket{route="/a",le="+Inf"} 4.0',
+            'duration_seconds_sum{route="/a"} 7.6875',
+            'duration_seconds_count{route="/a"} 4.0',
+        ]
+        self.assertEqual(self.registry.getText(), "\n".join(expected) + "\n")
+
+    def testCollectors(self):
+        self.registry.addCollector(
+            lambda registry: registry.setValue("in_flight", (), 7))
+        self.assertEqual(self.registry.getValues()["in_flight", ()], 7)
+
+    def testBadValues(self):
+        with self.assertRaises(ValueError):
+            self.registry.addGauge("in_flight", "Duplicate.")
+        with self.assertRaises(ValueError):
+            self.registry.setDirectory(tempfile.gettempdir(), 0)
+
+
+def _incrementInChild(registry):
+    registry.increment("requests_total", ("/a",), 2)
+    registry.increment("in_flight", (), 5)
+    registry.writeSnapshot()
+
+
+class TestMultiprocessMetrics(unittest.TestCase):
+    """
+    Tests that the metrics are aggregated over forked processes
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.registry = backend.MetricsRegistry()
+        self.registry.addCounter("requests_total", "Requests.", ["route"])
+        self.registry.addGauge("in_flight", "Requests in flight.")
+        self.registry.setDirectory(self.directory, 60)
+
+    def tearDown(self):
+        self.registry.setDirectory(None)
+        shutil.rmtree(self.directory)
+
+    def testAggregation(self):
+        self.registry.increment("requests_total", ("/a",))
+        self.registry.increment("in_flight", (), 1)
+        process = multiprocessing.Process(
+            target=_incrementInChild, args=(self.registry,))
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+        values = self.registry.getValues()
+        # The child starts from zero rather than from the values it
+        # inherited, and the gauge of the exited child is dropped.
+        self.assertEqual(values["requests_total", ("/a",)], 3)
+        self.assertEqual(values["in_flight", ()], 1)
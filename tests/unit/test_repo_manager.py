@@ -64,6 +64,9 @@ class AbstractRepoManagerTest(unittest.TestCase):
 
     def tearDown(self):
         os.unlink(self._repoPath)
+        sidecarDirectory = self._repoPath + ".sidecar"
+        if os.path.exists(sidecarDirectory):
+            shutil.rmtree(sidecarDirectory)
 
     def readRepo(self):
         repo = datarepo.SqlDataRepository(self._repoPath)
@@ -434,6 +437,8 @@ class TestVerify(AbstractRepoManagerTest):
         self.addVariantSet()
         cmd = "verify {}".format(self._repoPath)
         self.runCommand(cmd)
+        cmd = "verify {} --workers=2".format(self._repoPath)
+        self.runCommand(cmd)
 
 
 class TestRemoveOntology(AbstractRepoManagerTest):
@@ -508,6 +513,18 @@ class TestAddReadGroupSet(AbstractRepoManagerTest):
         self.runCommand(cmd)
         self.verifyReadGroupSet(name, bamFile, bamFile + ".bai")
 
+    def testReferenceNotInReferenceSet(self):
+        # The reads in this file are on chr1, which is not in the
+        # reference set.
+        bamFile = paths.bamPath2
+        cmd = "add-readgroupset {} {} {} --referenceSetName={}".format(
+                self._repoPath, self._datasetName, bamFile,
+                self._referenceSetName)
+        self.assertRaises(
+            exceptions.ReadGroupReferenceNotFound, self.runCommand,
+            cmd + " --checkReferences")
+        self.runCommand(cmd)
+
     def testAddReadGroupSetWithSameName(self):
         # Default name
         bamFile = paths.bamPath
@@ -586,6 +603,17 @@ class TestAddVariantSet(AbstractRepoManagerTest):
         self.runCommand(cmd)
         self.verifyVariantSet(name, dataFiles, self.indexFiles)
 
+    def testWorkers(self):
+        dataFiles = self.vcfFiles
+        name = "test_name"
+        cmd = (
+            "add-variantset {} {} {} --name={} --referenceSetName={} "
+            "--workers=2").format(
+                self._repoPath, self._datasetName, " ".join(dataFiles),
+                name, self._referenceSetName)
+        self.runCommand(cmd)
+        self.verifyVariantSet(name, dataFiles, self.indexFiles)
+
     def testDefaultsLocalDirectory(self):
         vcfDir = self.vcfDir
         name = os.path.split(vcfDir)[1]
@@ -637,6 +665,42 @@ class TestAddVariantSet(AbstractRepoManagerTest):
         self.assertRaises(
             exceptions.DuplicateNameException, self.runCommand, cmd)
 
+    def testBuildVariantIdIndex(self):
+        name = "test_name"
+        cmd = "add-variantset {} {} {} -n {} -R {} -x".format(
+                self._repoPath, self._datasetName, self.vcfDir,
+                name, self._referenceSetName)
+        self.runCommand(cmd)
+        repo = self.readRepo()
+        variantSet = repo.getDatasetByName(
+            self._datasetName).getVariantSetByName(name)
+        variantIdIndexPath = variantSet.getVariantIdIndexPath()
+        self.assertTrue(os.path.exists(variantIdIndexPath))
+        self.assertFalse(os.path.exists(variantIdIndexPath + ".tmp"))
+        # Adding a variant set with the same name must leave the index
+        # of the existing one in place
+        self.assertRaises(
+            exceptions.DuplicateNameException, self.runCommand, cmd)
+        self.assertTrue(os.path.exists(variantIdIndexPath))
+        self.runCommand("remove-variantset {} {} {} -f".format(
+            self._repoPath, self._datasetName, name))
+        self.assertFalse(os.path.exists(variantIdIndexPath))
+
+    def testBuildVariantDensity(self):
+        name = "test_name"
+        cmd = "add-variantset {} {} {} -n {} -R {} -D".format(
+                self._repoPath, self._datasetName, self.vcfDir,
+                name, self._referenceSetName)
+        self.runCommand(cmd)
+        repo = self.readRepo()
+        variantSet = repo.getDatasetByName(
+            self._datasetName).getVariantSetByName(name)
+        variantDensityPath = variantSet.getVariantDensityPath()
+        self.assertTrue(os.path.exists(variantDensityPath))
+        self.runCommand("remove-dataset {} {} -f".format(
+            self._repoPath, self._datasetName))
+        self.assertFalse(os.path.exists(variantDensityPath))
+
     def testUrlWithMissingIndex(self):
         dataFile = "http://example.com/example.vcf.gz"
         cmd = "add-variantset {} {} {} --referenceSetName={}".format(
@@ -0,0 +1,146 @@
+"""
+Tests the coalescing of identical concurrent requests
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import threading
+import time
+import unittest
+
+import ga4gh.backend as backend
+import ga4gh.datamodel as datamodel
+import ga4gh.datarepo as datarepo
+import ga4gh.protocol as protocol
+
+
+class TestRequestCoalescer(unittest.TestCase):
+    """
+    Tests that identical concurrent requests are only run once
+    """
+    numFollowers = 3
+
+    def setUp(self):
+        self.coalescer = backend.RequestCoalescer()
+        self.coalescer.setEnabled(True)
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = []
+        self.timers = []
+
+    def _blockingFunction(self, value):
+        self.calls.append(value)
+        self.started.set()
+        self.release.wait()
+        if value is None:
+            raise ValueError("no value")
+        return value * 2
+
+    def _runConcurrently(self, value):
+        results = []
+
+        def target():
+            timer = datamodel.RequestTimer()
+            self.timers.append(timer)
+            datamodel.setRequestTimer(timer)
+            try:
+                results.append(self.coalescer.run(
+                    "key", self._blockingFunction, value))
+            except ValueError as exception:
+                results.append(exception)
+            finally:
+                datamodel.setRequestTimer(None)
+
+        threads = [threading.Thread(target=target)]
+        threads[0].start()
+        self.started.wait()
+        for _ in range(self.numFollowers):
+            thread = threading.Thread(target=target)
+            thread.start()
+            threads.append(thread)
+        while self.coalescer.getNumCoalesced() < self.numFollowers:
+            time.sleep(0.001)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def testCoalesced(self):
+        results = self._runConcurrently(21)
+        self.assertEqual(self.calls, [21])
+        self.assertEqual(results, [42] * (self.numFollowers + 1))
+        self.assertEqual(
+            self.coalescer.getNumRequests(), self.numFollowers + 1)
+        self.assertEqual(
+            self.coalescer.getCoalescedRatio(),
+            self.numFollowers / (self.numFollowers + 1))
+        # Only the time that the followers spend waiting is timed here
+        self.assertEqual(
+            [[phase for phase, _, _ in timer.getPhases()]
+             for timer in self.timers],
+            [[]] + [["coalesced"]] * self.numFollowers)
+        # Results are not retained once the request has finished
+        self.assertEqual(self.coalescer.run("key", lambda: 1), 1)
+
+    def testExceptionShared(self):
+        results = self._runConcurrently(None)
+        self.assertEqual(self.calls, [None])
+        self.assertEqual(len(results), self.numFollowers + 1)
+        for result in results:
+            self.assertIsInstance(result, ValueError)
+
+    def testDisabled(self):
+        self.coalescer.setEnabled(False)
+        self.assertEqual(self.coalescer.run("key", lambda x: x, 1), 1)
+        self.assertEqual(self.coalescer.getNumRequests(), 0)
+        self.assertEqual(self.coalescer.getCoalescedRatio(), 0)
+
+
+class TestCoalescedSearches(unittest.TestCase):
+    """
+    Tests that every caller of a coalesced search request is recorded
+    """
+    def setUp(self):
+        self.backend = backend.Backend(datarepo.EmptyDataRepository())
+        self.backend.setRequestCoalescing(True)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def _blockingGenerator(self, request):
+        self.started.set()
+        self.release.wait()
+        return iter([(protocol.Dataset(id="dataset"), None)])
+
+    def testCallersRecorded(self):
+        timers = []
+
+        def target():
+            timer = datamodel.RequestTimer()
+            timers.append(timer)
+            datamodel.setRequestTimer(timer)
+            try:
+                self.backend.runSearchRequest(
+                    "{}", protocol.SearchDatasetsRequest,
+                    protocol.SearchDatasetsResponse, self._blockingGenerator)
+            finally:
+                datamodel.setRequestTimer(None)
+
+        threads = [threading.Thread(target=target)]
+        threads[0].start()
+        self.started.wait()
+        threads.append(threading.Thread(target=target))
+        threads[1].start()
+        coalescer = self.backend.getRequestCoalescer()
+        while coalescer.getNumCoalesced() < 1:
+            time.sleep(0.001)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        for timer in timers:
+            self.assertEqual(timer.getCounts(), [("returned", 1)])
+        values = self.backend.getMetricsRegistry().getValues()
+        # The histogram value ends with the sum of the observed values
+        self.assertEqual(
+            values["ga4gh_search_page_objects",
+                   ("SearchDatasetsRequest",)][-1], 2)
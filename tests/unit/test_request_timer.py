@@ -0,0 +1,94 @@
+"""
+Tests the timing of the phases of a request
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import time
+import unittest
+
+import ga4gh.datamodel as datamodel
+
+
+class TestRequestTimer(unittest.TestCase):
+    """
+    Tests the attribution of time to the phases of a request
+    """
+    sleepTime = 0.05
+
+    def setUp(self):
+        self.timer = datamodel.RequestTimer()
+        datamodel.setRequestTimer(self.timer)
+
+    def tearDown(self):
+        datamodel.setRequestTimer(None)
+
+    def _getWallTimes(self):
+        return dict(
+            (phase, wallTime)
+            for phase, wallTime, _ in self.timer.getPhases())
+
+    def testNestedPhases(self):
+        with datamodel.timePhase("fetch"):
+            time.sleep(self.sleepTime)
+            with datamodel.timePhase("convert"):
+                time.sleep(self.sleepTime)
+        wallTimes = self._getWallTimes()
+        self.assertEqual(
+            [phase for phase, _, _ in self.timer.getPhases()],
+            ["fetch", "convert"])
+        # The time spent converting is not counted as fetching
+        for phase in ["fetch", "convert"]:
+            self.assertGreaterEqual(wallTimes[phase], self.sleepTime * 0.9)
+            self.assertLess(wallTimes[phase], self.sleepTime * 1.9)
+        self.assertGreaterEqual(
+            self.timer.getElapsedTime(), sum(wallTimes.values()))
+
+    def testSkipPhase(self):
+        with datamodel.timePhase("skip"):
+            with datamodel.timePhase("fetch"):
+                time.sleep(self.sleepTime)
+        wallTimes = self._getWallTimes()
+        self.assertEqual(list(wallTimes.keys()), ["skip"])
+        self.assertGreaterEqual(wallTimes["skip"], self.sleepTime * 0.9)
+
+    def testTimeIterator(self):
+        def generator():
+            for i in range(3):
+                time.sleep(self.sleepTime)
+                yield i
+
+        values = []
+        for value in datamodel.timeIterator(generator(), "fetch"):
+            with datamodel.timePhase("convert"):
+                values.append(value)
+        self.assertEqual(values, [0, 1, 2])
+        wallTimes = self._getWallTimes()
+        self.assertGreaterEqual(wallTimes["fetch"], 3 * self.sleepTime * 0.9)
+        self.assertLess(wallTimes["convert"], self.sleepTime)
+
+    def testCounts(self):
+        datamodel.addRequestCount("returned", 10)
+        datamodel.addRequestCount("skipped")
+        datamodel.addRequestCount("returned", 5)
+        self.assertEqual(
+            self.timer.getCounts(), [("returned", 15), ("skipped", 1)])
+
+    def testUntimed(self):
+        datamodel.setRequestTimer(None)
+        with datamodel.timePhase("fetch"):
+            datamodel.addRequestCount("returned")
+        self.assertEqual(list(datamodel.timeIterator([1, 2], "fetch")), [1, 2])
+        self.assertEqual(self.timer.getPhases(), [])
+        self.assertEqual(self.timer.getCounts(), [])
+
+    def testException(self):
+        with self.assertRaises(ValueError):
+            with datamodel.timePhase("fetch"):
+                raise ValueError()
+        with datamodel.timePhase("convert"):
+            pass
+        self.assertEqual(
+            [phase for phase, _, _ in self.timer.getPhases()],
+            ["fetch", "convert"])
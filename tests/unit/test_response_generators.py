@@ -27,7 +27,7 @@ class MockVariantSet(variants.AbstractVariantSet):
         self.numVariants = numVariants
 
     def getVariants(self, referenceName, startPosition, endPosition,
-                    variantName=None, callSetIds=None):
+                    callSetIds=None, fieldMask=None):
         for i in range(self.numVariants):
             yield generateVariant()
 
@@ -97,8 +97,8 @@ class MockReadGroup(reads.AbstractReadGroup):
         super(MockReadGroup, self).__init__(parentContainer, localId)
         self.numAlignments = numAlignments
 
-    def getReadAlignments(self, referenceName=None, referenceId=None,
-                          start=None, end=None):
+    def getReadAlignments(self, reference=None, start=None, end=None,
+                          fieldMask=None):
         for i in range(self.numAlignments):
             yield generateReadAlignment(i)
 
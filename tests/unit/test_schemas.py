@@ -2,6 +2,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import json
 import unittest
 
 import ga4gh.protocol as protocol
@@ -35,6 +36,20 @@ class SearchResponseBuilderTest(unittest.TestCase):
                 builder.getSerializedResponse(), class_)
             self.assertEqual(instance, otherInstance)
 
+    def testValueListJsonName(self):
+        # Verifies that the values are spliced in under the JSON name of
+        # the value list, for every subclass of SearchResponse
+        for class_ in [responseClass for _, _, responseClass in
+                       protocol.postMethods]:
+            instance = class_()
+            valueList = getattr(instance, getValueListName(class_))
+            valueList.add()
+            builder = protocol.SearchResponseBuilder(class_, 1, 2 ** 32)
+            builder.addValue(valueList[0])
+            self.assertEqual(
+                json.loads(builder.getSerializedResponse()),
+                protocol.toJsonDict(instance))
+
     def testPageSizeOverflow(self):
         # Verifies that the page size behaviour is correct when we keep
         # filling after full is True.
@@ -78,7 +93,7 @@ class SearchResponseBuilderTest(unittest.TestCase):
         typicalValue.start = 1
         typicalValue.end = 2
         typicalValue.reference_bases = "AAAAAAAA"
-        typicalValueLength = typicalValue.ByteSize()
+        typicalValueLength = len(protocol.toJson(typicalValue))
         for numValues in range(1, 10):
             maxBufferSize = numValues * typicalValueLength
             builder = protocol.SearchResponseBuilder(
@@ -108,3 +123,97 @@ class SearchResponseBuilderTest(unittest.TestCase):
             instance = protocol.fromJson(builder.getSerializedResponse(),
                                          responseClass)
             self.assertEqual(nextPageToken, instance.next_page_token)
+
+    def testSplicedResponse(self):
+        # Verifies that the pre-rendered values are spliced into a response
+        # that is equivalent to serialising the whole response message.
+        responseClass = protocol.SearchVariantsResponse
+        response = responseClass()
+        for start in range(5):
+            variant = response.variants.add()
+            variant.start = start
+            variant.end = start + 1
+            variant.reference_bases = "A"
+            variant.alternate_bases.extend(["C", "T"])
+            variant.info["key"].values.add().string_value = "value"
+        response.next_page_token = "token"
+        builder = protocol.SearchResponseBuilder(responseClass, 100, 2 ** 32)
+        for variant in response.variants:
+            builder.addValue(variant)
+        builder.setNextPageToken(response.next_page_token)
+        serializedResponse = builder.getSerializedResponse()
+        self.assertEqual(
+            protocol.fromJson(serializedResponse, responseClass), response)
+        self.assertEqual(
+            protocol.toJsonDict(response), json.loads(serializedResponse))
+        builder = protocol.SearchResponseBuilder(
+            responseClass, 100, 2 ** 32, protocol.PROTOBUF_MIMETYPE)
+        for variant in response.variants:
+            builder.addValue(variant)
+        builder.setNextPageToken(response.next_page_token)
+        serializedResponse = builder.getSerializedResponse()
+        parsedResponse = responseClass()
+        parsedResponse.ParseFromString(serializedResponse)
+        self.assertEqual(parsedResponse, response)
+
+
+class FieldMaskTest(unittest.TestCase):
+    """
+    Tests the parsing, validation and application of field masks.
+    """
+    def _getVariant(self):
+        variant = protocol.Variant()
+        variant.id = "id"
+        variant.start = 1
+        variant.end = 2
+        variant.reference_bases = "A"
+        variant.alternate_bases.extend(["C", "T"])
+        variant.info["key"].values.add().string_value = "value"
+        for callSetId in ["cs1", "cs2"]:
+            call = variant.calls.add()
+            call.call_set_id = callSetId
+            call.genotype.extend([0, 1])
+            call.genotype_likelihood.extend([-1.0, -2.0])
+        return variant
+
+    def testParse(self):
+        fieldMask = protocol.FieldMask.parse(
+            " start, calls.genotype,referenceBases,calls.callSetId,,")
+        self.assertEqual(
+            str(fieldMask),
+            "calls.call_set_id,calls.genotype,reference_bases,start")
+        self.assertTrue(fieldMask.includes("start"))
+        self.assertTrue(fieldMask.includes("calls"))
+        self.assertFalse(fieldMask.includes("info"))
+        callMask = fieldMask.getSubMask("calls")
+        self.assertTrue(callMask.includes("genotype"))
+        self.assertFalse(callMask.includes("info"))
+        self.assertTrue(fieldMask.getSubMask("start").isEmpty())
+        self.assertTrue(protocol.FieldMask.parse("").isEmpty())
+        # Naming a field in full overrides any of its sub-fields
+        fieldMask = protocol.FieldMask.parse("calls.genotype,calls")
+        self.assertEqual(str(fieldMask), "calls")
+
+    def testApply(self):
+        variant = self._getVariant()
+        protocol.FieldMask.parse("").apply(variant)
+        self.assertEqual(variant, self._getVariant())
+        protocol.FieldMask.parse("id,alternate_bases,calls.genotype").apply(
+            variant)
+        expected = protocol.Variant()
+        expected.id = "id"
+        expected.alternate_bases.extend(["C", "T"])
+        for _ in range(2):
+            expected.calls.add().genotype.extend([0, 1])
+        self.assertEqual(variant, expected)
+
+    def testInvalidPath(self):
+        descriptor = protocol.Variant.DESCRIPTOR
+        for maskString, invalidPath in [
+                ("start,calls.genotype,info", None),
+                ("start,notAField", "not_a_field"),
+                ("calls.genotype,calls.notAField", "calls.not_a_field"),
+                ("start.value", "start.value"),
+                ("info.key", "info.key")]:
+            fieldMask = protocol.FieldMask.parse(maskString)
+            self.assertEqual(fieldMask.getInvalidPath(descriptor), invalidPath)
@@ -0,0 +1,134 @@
+"""
+Tests variant sets sharded over several VCF files per reference
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import pysam
+
+import ga4gh.datamodel.datasets as datasets
+import ga4gh.datamodel.variants as variants
+import ga4gh.exceptions as exceptions
+import tests.paths as paths
+
+
+class TestShardedVariantSet(unittest.TestCase):
+    """
+    Tests that the variants from several shards for the same reference
+    are merged in coordinate order.
+    """
+    numShards = 3
+
+    @classmethod
+    def setUpClass(cls):
+        # Split a single VCF into disjoint shards, so that the shards have
+        # the same header metadata and samples.
+        cls.tempDir = tempfile.mkdtemp(prefix="ga4gh_test_variant_shards")
+        with gzip.open(paths.vcfPath1) as vcfFile:
+            lines = vcfFile.readlines()
+        header = [line for line in lines if line.startswith("#")]
+        records = [line for line in lines if not line.startswith("#")]
+        shardSize = len(records) // cls.numShards + 1
+        cls.dataUrls = [
+            cls._writeShard(
+                "shard{}".format(i), header,
+                records[i * shardSize:(i + 1) * shardSize])
+            for i in range(cls.numShards)]
+        # Shards whose first records differ, but whose records interleave.
+        cls.interleavedDataUrls = [
+            cls._writeShard("even", header, records[0::2]),
+            cls._writeShard("odd", header, records[1::2])]
+
+    @classmethod
+    def _writeShard(cls, name, header, records):
+        shardPath = os.path.join(cls.tempDir, name + ".vcf")
+        with open(shardPath, "w") as shardFile:
+            shardFile.writelines(header)
+            shardFile.writelines(records)
+        return pysam.tabix_index(shardPath, preset="vcf")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tempDir)
+
+    def setUp(self):
+        self.dataset = datasets.Dataset("ds")
+        self.variantSet = variants.HtslibVariantSet(self.dataset, "vs")
+        self.variantSet.populateFromFile(
+            self.dataUrls, [dataUrl + ".tbi" for dataUrl in self.dataUrls])
+
+    def _getStarts(self):
+        variantList = self.variantSet.getVariants("1", 0, 2**20, [])
+        return [variant.start for variant in variantList]
+
+    def testShardsMerged(self):
+        refMap = self.variantSet.getReferenceToDataUrlIndexMap()
+        self.assertEqual(len(refMap["1"]), self.numShards)
+        numRecords = 0
+        for i, dataUrl in enumerate(self.dataUrls):
+            singleShard = variants.HtslibVariantSet(
+                self.dataset, "shard{}".format(i))
+            singleShard.populateFromFile([dataUrl], [dataUrl + ".tbi"])
+            numRecords += len(list(
+                singleShard.getVariants("1", 0, 2**20, [])))
+        starts = self._getStarts()
+        self.assertEqual(len(starts), numRecords)
+        self.assertEqual(starts, sorted(starts))
+
+    def testFetchFromStart(self):
+        expected = list(self.variantSet.getVariants("1", 0, 2**20, []))
+        for start in [0, 10000, 20000]:
+            self.assertEqual(
+                list(self.variantSet.getVariants("1", start, 2**20, [])),
+                [variant for variant in expected if variant.end > start])
+
+    def testOverlappingShards(self):
+        variantSet = variants.HtslibVariantSet(self.dataset, "overlapping")
+        with self.assertRaises(exceptions.OverlappingVcfException):
+            variantSet.populateFromFile(
+                [paths.vcfPath1, paths.vcfPath1],
+                [paths.vcfIndexPath1, paths.vcfIndexPath1])
+
+    def testInterleavedShards(self):
+        variantSet = variants.HtslibVariantSet(self.dataset, "interleaved")
+        with self.assertRaises(exceptions.OverlappingVcfException):
+            variantSet.populateFromFile(
+                self.interleavedDataUrls,
+                [dataUrl + ".tbi" for dataUrl in self.interleavedDataUrls])
+
+    def testShardsInAnyOrder(self):
+        dataUrls = list(reversed(self.dataUrls))
+        variantSet = variants.HtslibVariantSet(self.dataset, "reversed")
+        variantSet.populateFromFile(
+            dataUrls, [dataUrl + ".tbi" for dataUrl in dataUrls])
+        starts = [
+            variant.start
+            for variant in variantSet.getVariants("1", 0, 2**20, [])]
+        self.assertEqual(starts, self._getStarts())
+
+    def testPopulateWithWorkers(self):
+        variantSet = variants.HtslibVariantSet(self.dataset, "workers")
+        variantSet.populateFromFile(
+            self.dataUrls, [dataUrl + ".tbi" for dataUrl in self.dataUrls],
+            workers=2)
+        self.assertEqual(
+            variantSet.getReferenceToDataUrlIndexMap(),
+            self.variantSet.getReferenceToDataUrlIndexMap())
+        self.assertEqual(
+            [metadata.key for metadata in variantSet.getMetadata()],
+            [metadata.key for metadata in self.variantSet.getMetadata()])
+        variantSet.checkConsistency(workers=2)
+
+    def testOverlappingShardsWithWorkers(self):
+        variantSet = variants.HtslibVariantSet(self.dataset, "overlapping")
+        with self.assertRaises(exceptions.OverlappingVcfException):
+            variantSet.populateFromFile(
+                [paths.vcfPath1, paths.vcfPath1],
+                [paths.vcfIndexPath1, paths.vcfIndexPath1], workers=2)
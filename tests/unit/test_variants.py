@@ -81,3 +81,28 @@ class TestAbstractVariantSet(unittest.TestCase):
     def testVariantSetProtocolElement(self):
         self.assertRaises(AttributeError,
                           self._variantSet.toProtocolElement)
+
+
+class TestGetVariantType(unittest.TestCase):
+    """
+    Tests the classification of variants by their alleles.
+    """
+    def testVariantTypes(self):
+        self.assertEqual(
+            variants.getVariantType("A", None), variants.VARIANT_TYPE_REF)
+        self.assertEqual(
+            variants.getVariantType("A", ["C"]), variants.VARIANT_TYPE_SNP)
+        self.assertEqual(
+            variants.getVariantType("AC", ["GT"]), variants.VARIANT_TYPE_MNP)
+        self.assertEqual(
+            variants.getVariantType("A", ["AC"]),
+            variants.VARIANT_TYPE_INDEL)
+        self.assertEqual(
+            variants.getVariantType("AC", ["A", "ACC"]),
+            variants.VARIANT_TYPE_INDEL)
+        self.assertEqual(
+            variants.getVariantType("A", ["<DEL>"]),
+            variants.VARIANT_TYPE_OTHER)
+        self.assertEqual(
+            variants.getVariantType("A", ["C", "AC"]),
+            variants.VARIANT_TYPE_MIXED)
@@ -6,11 +6,18 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import unittest
+import json
 import logging
+import multiprocessing.pool
+import os
+import shutil
+import tempfile
+import zlib
 
 import tests.paths as paths
 
 import ga4gh.datamodel as datamodel
+import ga4gh.exceptions as exceptions
 import ga4gh.frontend as frontend
 import ga4gh.protocol as protocol
 
@@ -29,6 +36,9 @@ class TestFrontend(unittest.TestCase):
             "SIMULATED_BACKEND_NUM_CALLS": 1,
             "SIMULATED_BACKEND_VARIANT_DENSITY": 1.0,
             "SIMULATED_BACKEND_NUM_VARIANT_SETS": 1,
+            "RESPONSE_COMPRESSION_MIN_SIZE": 0,
+            "REQUEST_TIMING": True,
+            "PROFILE_KEY": "profileKey",
             "LANDING_MESSAGE_HTML": paths.landingMessageHtml
             # "DEBUG" : True
         }
@@ -264,8 +274,8 @@ class TestFrontend(unittest.TestCase):
         for path in paths:
             path = path.format(referenceSetId)
             self.assertEqual(200, self.app.get(path).status_code)
-        self.verifySearchRouting('/referencesets/search', True)
-        self.verifySearchRouting('/references/search', True)
+        self.verifySearchRouting('/referencesets/search')
+        self.verifySearchRouting('/references/search')
 
     def testRouteCallSets(self):
         path = '/callsets/search'
@@ -296,6 +306,464 @@ class TestFrontend(unittest.TestCase):
             response.data, protocol.SearchVariantsResponse)
         self.assertEqual(len(responseData.variants), 1)
 
+    def testConditionalGet(self):
+        response = self.sendGetVariantSet()
+        self.assertEqual(200, response.status_code)
+        etag = response.headers['ETag']
+        self.assertIsNotNone(etag)
+        headers = {'If-None-Match': etag}
+        path = "/variantsets/{}".format(self.variantSetId)
+        response = self.app.get(path, headers=headers)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(len(response.data), 0)
+        headers = {'If-None-Match': '"stale"'}
+        response = self.app.get(path, headers=headers)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(etag, response.headers['ETag'])
+
+    def testCachedSearch(self):
+        responseCache = frontend.app.responseCache
+        response = self.sendVariantsSearch()
+        numHits = responseCache.getNumHits()
+        cachedResponse = self.sendVariantsSearch()
+        # sendVariantsSearch searches for the variant sets first, so both
+        # of its requests are answered from the cache.
+        self.assertEqual(numHits + 2, responseCache.getNumHits())
+        self.assertEqual(response.data, cachedResponse.data)
+        self.assertEqual(
+            response.headers['ETag'], cachedResponse.headers['ETag'])
+
+    def testVariantsSearchStreaming(self):
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = self.variantSetId
+        request.reference_name = "1"
+        request.start = 0
+        request.end = 100
+        request.page_size = 1
+        response = self.sendPostRequest('/variants/search', request)
+        pagedVariants = protocol.fromJson(
+            response.data, protocol.SearchVariantsResponse).variants
+        expected = list(self.variantSet.getVariants("1", 0, 100))
+        self.assertEqual(len(pagedVariants), 1)
+        headers = {
+            'Content-type': 'application/json',
+            'Accept': frontend.STREAMING_MIMETYPE,
+        }
+        response = self.app.post(
+            '/variants/search', headers=headers,
+            data=protocol.toJson(request))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(frontend.STREAMING_MIMETYPE, response.mimetype)
+        lines = response.data.splitlines()
+        self.assertEqual(len(lines), len(expected))
+        for line, variant in zip(lines, expected):
+            self.assertEqual(
+                protocol.fromJson(line, protocol.Variant), variant)
+
+    def testSearchStreamingErrors(self):
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = "notFound"
+        headers = {
+            'Content-type': 'application/json',
+            'Accept': frontend.STREAMING_MIMETYPE,
+        }
+        response = self.app.post(
+            '/variants/search', headers=headers,
+            data=protocol.toJson(request))
+        self.assertEqual(404, response.status_code)
+        self.assertEqual(frontend.MIMETYPE, response.mimetype)
+
+    def testVariantsSearchProtobuf(self):
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = self.variantSetId
+        request.reference_name = "1"
+        request.start = 0
+        request.end = 100
+        request.page_size = 2
+        jsonResponse = protocol.fromJson(
+            self.sendPostRequest('/variants/search', request).data,
+            protocol.SearchVariantsResponse)
+        headers = {
+            'Content-type': frontend.PROTOBUF_MIMETYPE,
+            'Accept': frontend.PROTOBUF_MIMETYPE,
+        }
+        response = self.app.post(
+            '/variants/search', headers=headers,
+            data=request.SerializeToString())
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(frontend.PROTOBUF_MIMETYPE, response.mimetype)
+        protobufResponse = protocol.SearchVariantsResponse()
+        protobufResponse.ParseFromString(response.data)
+        self.assertEqual(len(protobufResponse.variants), 2)
+        self.assertEqual(jsonResponse, protobufResponse)
+
+    def testSearchFieldMask(self):
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = self.variantSetId
+        request.reference_name = "1"
+        request.start = 0
+        request.end = 100
+        request.page_size = 2
+        fields = "id,start,calls.genotype"
+        fieldMask = protocol.FieldMask.parse(fields)
+        expected = list(self.variantSet.getVariants("1", 0, 100))[:2]
+        for variant in expected:
+            fieldMask.apply(variant)
+        path = '/variants/search?fields=' + fields
+        response = self.sendPostRequest(path, request)
+        self.assertEqual(200, response.status_code)
+        variants = protocol.fromJson(
+            response.data, protocol.SearchVariantsResponse).variants
+        self.assertEqual(list(variants), expected)
+        self.assertEqual(variants[0].reference_bases, "")
+        # The masked response is not served for an unmasked request
+        response = self.sendPostRequest('/variants/search', request)
+        variants = protocol.fromJson(
+            response.data, protocol.SearchVariantsResponse).variants
+        self.assertNotEqual(variants[0].reference_bases, "")
+        path = '/variants/search?fields=start,notAField'
+        response = self.sendPostRequest(path, request)
+        self.assertEqual(400, response.status_code)
+
+    def getUncachedVariantsRequest(self, start):
+        """
+        Returns a search for the variants in the ten bases from the
+        specified start, which must not be searched by any other test so
+        that the response is not cached.
+        """
+        response = self.sendVariantSetsSearch()
+        variantSets = protocol.fromJson(
+            response.data, protocol.SearchVariantSetsResponse).variant_sets
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = variantSets[0].id
+        request.reference_name = "1"
+        request.start = start
+        request.end = start + 10
+        return request
+
+    def sendUncachedVariantsSearch(self, start, path='/variants/search'):
+        return self.sendPostRequest(
+            path, self.getUncachedVariantsRequest(start))
+
+    def testServerTiming(self):
+        response = self.sendUncachedVariantsSearch(10)
+        self.assertEqual(200, response.status_code)
+        metrics = [
+            metric.split(";")
+            for metric in response.headers["Server-Timing"].split(", ")]
+        names = [metric[0] for metric in metrics]
+        for name in ["parse", "serialize", "total", "returned"]:
+            self.assertIn(name, names)
+        self.assertEqual(names[-1], "returned")
+        self.assertEqual(metrics[-1][1], "count=10")
+        for metric in metrics[:-2]:
+            self.assertTrue(metric[1].startswith("dur="))
+            self.assertTrue(metric[2].startswith("cpu="))
+
+    def testSlowRequestLog(self):
+        tempDir = tempfile.mkdtemp()
+        logFile = os.path.join(tempDir, "slow.jsonl")
+        frontend.configureRequestLog(frontend.slowRequestLogger, logFile)
+        slowRequestThreshold = frontend.app.slowRequestThreshold
+        frontend.app.slowRequestThreshold = 0
+        try:
+            response = self.sendUncachedVariantsSearch(
+                20, '/variants/search?fields=id,start')
+            self.assertEqual(200, response.status_code)
+            variantId = json.loads(response.data)["variants"][0]["id"]
+            response = self.sendGetRequest('/variants/' + variantId)
+            self.assertEqual(200, response.status_code)
+            response = self.sendGetRequest(
+                "/variantsets/{}/stats".format(self.variantSetId))
+            self.assertEqual(404, response.status_code)
+            with open(logFile) as logStream:
+                entries = [json.loads(line) for line in logStream]
+        finally:
+            frontend.app.slowRequestThreshold = slowRequestThreshold
+            frontend.configureRequestLog(frontend.slowRequestLogger, None)
+            shutil.rmtree(tempDir)
+        self.assertEqual(len(entries), 3)
+        searchEntry, getEntry, statisticsEntry = entries
+        self.assertEqual(searchEntry["endpoint"], "runSearchVariants")
+        self.assertEqual(searchEntry["fields"], "id,start")
+        self.assertIsNone(searchEntry["pageToken"])
+        self.assertEqual(searchEntry["objects"], {"returned": 10})
+        self.assertIn("serialize", searchEntry["phases"])
+        request = protocol.fromJson(
+            searchEntry["request"], protocol.SearchVariantsRequest)
+        self.assertEqual(request.start, 20)
+        self.assertEqual(getEntry["endpoint"], "runGetVariant")
+        self.assertEqual(getEntry["id"], variantId)
+        self.assertEqual(
+            statisticsEntry["endpoint"], "runGetVariantSetStatistics")
+        # Get requests are replayed with the ID and the response mimetype.
+        endpoint = getattr(self.backend, statisticsEntry["endpoint"])
+        with self.assertRaises(
+                exceptions.VariantSetStatisticsNotFoundException):
+            endpoint(statisticsEntry["id"], protocol.JSON_MIMETYPE)
+
+    def testProfile(self):
+        data = protocol.toJson(self.getUncachedVariantsRequest(30))
+
+        def sendProfiledSearch(profileType, profileKey):
+            headers = {
+                'Content-type': 'application/json',
+                frontend.PROFILE_HEADER: profileType,
+                frontend.PROFILE_KEY_HEADER: profileKey,
+            }
+            return self.app.post(
+                '/variants/search', headers=headers, data=data)
+
+        self.assertEqual(403, sendProfiledSearch("cpu", "").status_code)
+        self.assertEqual(
+            403, sendProfiledSearch("cpu", "notTheKey").status_code)
+        self.assertEqual(
+            400, sendProfiledSearch("notAType", "profileKey").status_code)
+        # Cache the response, which the profiled search must not use
+        response = self.sendUncachedVariantsSearch(30)
+        self.assertNotIn(frontend.PROFILE_REPORT_HEADER, response.headers)
+        tempDir = tempfile.mkdtemp()
+        frontend.app.config["PROFILE_DIRECTORY"] = tempDir
+        try:
+            response = sendProfiledSearch("cpu", "profileKey")
+            self.assertEqual(200, response.status_code)
+            reportName = response.headers[frontend.PROFILE_REPORT_HEADER]
+            with open(os.path.join(tempDir, reportName)) as reportFile:
+                report = reportFile.read()
+        finally:
+            frontend.app.config["PROFILE_DIRECTORY"] = None
+            shutil.rmtree(tempDir)
+        self.assertTrue(report.startswith("POST /variants/search"))
+        self.assertIn("_runSearchPage", report)
+
+    def testStreamedRequestTimedAndProfiled(self):
+        headers = {
+            'Content-type': 'application/json',
+            'Accept': frontend.STREAMING_MIMETYPE,
+            frontend.PROFILE_HEADER: "cpu",
+            frontend.PROFILE_KEY_HEADER: "profileKey",
+        }
+        data = protocol.toJson(self.getUncachedVariantsRequest(40))
+        tempDir = tempfile.mkdtemp()
+        logFile = os.path.join(tempDir, "access.jsonl")
+        frontend.configureRequestLog(frontend.accessLogger, logFile)
+        frontend.app.config["PROFILE_DIRECTORY"] = tempDir
+        try:
+            response = self.app.post(
+                '/variants/search', headers=headers, data=data)
+            self.assertEqual(200, response.status_code)
+            lines = response.data.splitlines()
+            response.close()
+            reportName = response.headers[frontend.PROFILE_REPORT_HEADER]
+            with open(os.path.join(tempDir, reportName)) as reportFile:
+                report = reportFile.read()
+            with open(logFile) as logStream:
+                entries = [json.loads(line) for line in logStream]
+        finally:
+            frontend.app.config["PROFILE_DIRECTORY"] = None
+            frontend.configureRequestLog(frontend.accessLogger, None)
+            shutil.rmtree(tempDir)
+        # The stream is timed and profiled until it has been written
+        self.assertEqual(len(lines), 10)
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]["objects"], {"returned": 10})
+        self.assertIn("serialize", entries[0]["phases"])
+        self.assertTrue(report.startswith("POST /variants/search"))
+        self.assertIn("(toJson)", report)
+
+    def testMetrics(self):
+        self.assertEqual(200, self.sendVariantsSearch().status_code)
+        response = self.app.get('/metrics')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(frontend.METRICS_CONTENT_TYPE, response.content_type)
+        lines = response.data.splitlines()
+        self.assertIn(
+            '# TYPE ga4gh_http_request_duration_seconds histogram', lines)
+        prefixes = [
+            'ga4gh_http_requests_total{route="/variants/search",'
+            'method="POST",status="200"} ',
+            'ga4gh_http_request_duration_seconds_count{'
+            'route="/variants/search",status="200"} ',
+            'ga4gh_http_response_bytes_total{route="/variants/search"} ',
+            'ga4gh_search_page_objects_count{'
+            'request="SearchVariantsRequest"} ',
+            'ga4gh_file_handle_cache_hits_total ',
+            'ga4gh_http_requests_in_flight ']
+        for prefix in prefixes:
+            matches = [line for line in lines if line.startswith(prefix)]
+            self.assertEqual(len(matches), 1, prefix)
+            self.assertGreaterEqual(float(matches[0][len(prefix):]), 0)
+        # The request for the metrics is itself in flight
+        self.assertIn('ga4gh_http_requests_in_flight 1.0', lines)
+
+    def testGetProtobuf(self):
+        path = "/variantsets/{}".format(self.variantSetId)
+        headers = {'Accept': frontend.PROTOBUF_MIMETYPE}
+        response = self.app.get(path, headers=headers)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(frontend.PROTOBUF_MIMETYPE, response.mimetype)
+        variantSet = protocol.VariantSet()
+        variantSet.ParseFromString(response.data)
+        self.assertEqual(variantSet, self.variantSet.toProtocolElement())
+        # JSON and protobuf responses are cached separately
+        response = self.sendGetRequest(path)
+        self.assertEqual(frontend.MIMETYPE, response.mimetype)
+
+    def testBadProtobufRequest(self):
+        headers = {'Content-type': frontend.PROTOBUF_MIMETYPE}
+        response = self.app.post(
+            '/variants/search', headers=headers, data=b"\xff\xff\xff")
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(frontend.MIMETYPE, response.mimetype)
+        headers = {'Content-type': 'text/plain'}
+        response = self.app.post(
+            '/variants/search', headers=headers, data="{}")
+        self.assertEqual(415, response.status_code)
+
+    def testCompressedResponses(self):
+        path = "/variantsets/{}".format(self.variantSetId)
+        expected = self.sendGetRequest(path)
+        self.assertNotIn('Content-Encoding', expected.headers)
+        for encoding, windowBits in [
+                ('gzip', 16 + zlib.MAX_WBITS), ('deflate', zlib.MAX_WBITS)]:
+            headers = {'Accept-Encoding': encoding}
+            response = self.app.get(path, headers=headers)
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(encoding, response.headers['Content-Encoding'])
+            self.assertIn('Accept-Encoding', response.headers['Vary'])
+            self.assertEqual(
+                zlib.decompress(response.data, windowBits), expected.data)
+            etag = response.headers['ETag']
+            self.assertNotEqual(etag, expected.headers['ETag'])
+            headers['If-None-Match'] = etag
+            response = self.app.get(path, headers=headers)
+            self.assertEqual(304, response.status_code)
+
+    def testCompressedStreaming(self):
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = self.variantSetId
+        request.reference_name = "1"
+        request.start = 0
+        request.end = 100
+        headers = {
+            'Content-type': 'application/json',
+            'Accept': frontend.STREAMING_MIMETYPE,
+        }
+        expected = self.app.post(
+            '/variants/search', headers=headers,
+            data=protocol.toJson(request))
+        headers['Accept-Encoding'] = 'gzip'
+        response = self.app.post(
+            '/variants/search', headers=headers,
+            data=protocol.toJson(request))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertEqual(
+            zlib.decompress(response.data, 16 + zlib.MAX_WBITS),
+            expected.data)
+
+    def testCompressedRequest(self):
+        request = protocol.SearchVariantSetsRequest()
+        request.dataset_id = self.datasetId
+        expected = self.sendPostRequest('/variantsets/search', request)
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        data = compressor.compress(protocol.toJson(request).encode('utf-8'))
+        data += compressor.flush()
+        headers = {
+            'Content-type': 'application/json',
+            'Content-Encoding': 'gzip',
+        }
+        response = self.app.post(
+            '/variantsets/search', headers=headers, data=data)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(expected.data, response.data)
+        response = self.app.post(
+            '/variantsets/search', headers=headers, data=b"notgzip")
+        self.assertEqual(400, response.status_code)
+        headers['Content-Encoding'] = 'br'
+        response = self.app.post(
+            '/variantsets/search', headers=headers, data=data)
+        self.assertEqual(415, response.status_code)
+
+    def testBackendThreadPool(self):
+        request = protocol.SearchVariantsRequest()
+        request.variant_set_id = self.variantSetId
+        request.reference_name = "1"
+        request.start = 0
+        request.end = 100
+        headers = {
+            'Content-type': 'application/json',
+            'Accept': frontend.STREAMING_MIMETYPE,
+        }
+        path = "/variantsets/{}".format(self.variantSetId)
+        expected = [
+            self.sendGetRequest(path).data,
+            self.app.post(
+                '/variants/search', headers=headers,
+                data=protocol.toJson(request)).data]
+        frontend.app.backendThreadPool = multiprocessing.pool.ThreadPool(2)
+        try:
+            frontend.app.responseCache.setMaxSize(0)
+            responses = [
+                self.sendGetRequest(path),
+                self.app.post(
+                    '/variants/search', headers=headers,
+                    data=protocol.toJson(request))]
+            # Streamed responses are computed as they are read
+            data = [response.data for response in responses]
+        finally:
+            frontend.app.backendThreadPool.close()
+            frontend.app.backendThreadPool = None
+            frontend.app.responseCache.setMaxSize(
+                frontend.app.config["RESPONSE_CACHE_MAX_SIZE"])
+        self.assertEqual(
+            [response.status_code for response in responses], [200, 200])
+        self.assertEqual(data, expected)
+
+    def testBatchGet(self):
+        headers = {'Content-type': 'application/json'}
+        data = json.dumps({"ids": [self.variantId, "notAnId"]})
+        response = self.app.post(
+            '/variants/batchGet', headers=headers, data=data)
+        self.assertEqual(200, response.status_code)
+        results = json.loads(response.data)["results"]
+        self.assertEqual(
+            [result["id"] for result in results], [self.variantId, "notAnId"])
+        variant = protocol.fromJson(
+            json.dumps(results[0]["object"]), protocol.Variant)
+        self.assertEqual(variant.id, self.variantId)
+        error = protocol.fromJson(
+            json.dumps(results[1]["error"]), protocol.GAException)
+        self.assertGreater(len(error.message), 0)
+        response = self.app.post(
+            '/notAType/batchGet', headers=headers, data=data)
+        self.assertEqual(404, response.status_code)
+        response = self.app.post(
+            '/variants/batchGet', headers=headers,
+            data=json.dumps({"ids": self.variantId}))
+        self.assertEqual(400, response.status_code)
+
+    def testBatchGetContainers(self):
+        headers = {'Content-type': 'application/json'}
+        for path, id_ in [
+                ("references", self.referenceId),
+                ("referencesets", self.referenceSetId),
+                ("readgroups", self.readGroupId)]:
+            data = json.dumps({"ids": [id_]})
+            response = self.app.post(
+                '/{}/batchGet'.format(path), headers=headers, data=data)
+            self.assertEqual(200, response.status_code)
+            results = json.loads(response.data)["results"]
+            self.assertEqual(len(results), 1)
+            self.assertEqual(results[0]["object"]["id"], id_)
+            self.assertEqual(
+                json.loads(self.sendGetRequest(
+                    '/{}/{}'.format(path, id_)).data),
+                results[0]["object"])
+            # The batch get path is not taken to be an ID
+            self.assertEqual(
+                405, self.app.get('/{}/batchGet'.format(path)).status_code)
+
     def testVariantSetsSearch(self):
         response = self.sendVariantSetsSearch()
         self.assertEqual(200, response.status_code)
@@ -319,6 +787,27 @@ class TestFrontend(unittest.TestCase):
         response = self.sendGetDataset(str(compoundId))
         self.assertEqual(404, response.status_code)
 
+    def testGetVariantSetStatistics(self):
+        # The statistics of simulated variant sets are not computed
+        response = self.sendGetRequest(
+            "/variantsets/{}/stats".format(self.variantSetId))
+        self.assertEqual(404, response.status_code)
+
+    def testGetVariantDensity(self):
+        path = "/variantsets/{}/density".format(self.variantSetId)
+        response = self.sendGetRequest(
+            path + "?referenceName=1&start=0&end=95&binSize=10")
+        self.assertEqual(200, response.status_code)
+        density = json.loads(response.data)
+        variants = list(self.variantSet.getVariants("1", 0, 100))
+        self.assertEqual(len(density["counts"]), 10)
+        self.assertEqual(sum(density["counts"]), len(variants))
+        response = self.sendGetRequest(path + "?referenceName=1&end=95")
+        self.assertEqual(400, response.status_code)
+        response = self.sendGetRequest(
+            path + "?referenceName=1&end=95&binSize=0")
+        self.assertEqual(400, response.status_code)
+
     def testGetVariantSet(self):
         response = self.sendVariantSetsSearch()
         responseData = protocol.fromJson(
@@ -396,3 +885,80 @@ class TestFrontend(unittest.TestCase):
             readGroupIds=[self.readGroupId, "42"],
             referenceId=self.referenceId)
         self.assertEqual(400, response.status_code)
+
+
+class TestResponseCache(unittest.TestCase):
+    """
+    Tests the size-bounded LRU cache of responses.
+    """
+    def setUp(self):
+        self.cache = frontend.ResponseCache()
+        self.cache.setMaxSize(10)
+
+    def testEviction(self):
+        self.cache.put("a", "aaaa")
+        self.cache.put("b", "bbbb")
+        self.assertIsNotNone(self.cache.get("a"))
+        self.cache.put("c", "cccc")
+        self.assertEqual(self.cache.getSize(), 8)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a")[0], "aaaa")
+        self.assertEqual(self.cache.get("c")[0], "cccc")
+
+    def testOversizedResponse(self):
+        responseString, etag = self.cache.put("a", "a" * 11)
+        self.assertEqual(responseString, "a" * 11)
+        self.assertIsNotNone(etag)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.getSize(), 0)
+
+    def testEtags(self):
+        _, etag1 = self.cache.put("a", "aaaa")
+        _, etag2 = self.cache.put("b", "aaaa")
+        _, etag3 = self.cache.put("c", "cccc")
+        self.assertEqual(etag1, etag2)
+        self.assertNotEqual(etag1, etag3)
+
+
+class TestResponseCompressor(unittest.TestCase):
+    """
+    Tests the compression of responses.
+    """
+    def setUp(self):
+        self.compressor = frontend.ResponseCompressor()
+        self.compressor.setLevel(6)
+        self.compressor.setMinSize(100)
+        self.app = frontend.app
+
+    def _compress(self, data, acceptEncoding='gzip'):
+        headers = {'Accept-Encoding': acceptEncoding}
+        with self.app.test_request_context(headers=headers):
+            response = self.app.response_class(data)
+            return self.compressor.compressResponse(
+                response, frontend.flask.request)
+
+    def testMinSize(self):
+        response = self._compress("a" * 99)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.get_data(), "a" * 99)
+        response = self._compress("a" * 100)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertLess(len(response.get_data()), 100)
+
+    def testPreferredEncoding(self):
+        response = self._compress("a" * 100, 'gzip;q=0.5, deflate')
+        self.assertEqual(response.headers['Content-Encoding'], 'deflate')
+        response = self._compress("a" * 100, 'br')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def testDisabled(self):
+        self.compressor.setLevel(0)
+        self.assertFalse(self.compressor.isEnabled())
+        response = self._compress("a" * 100)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def testBadValues(self):
+        with self.assertRaises(ValueError):
+            self.compressor.setLevel(10)
+        with self.assertRaises(ValueError):
+            self.compressor.setMinSize(-1)